@@ -0,0 +1,20 @@
+"""
+Id of the result backend entry holding the progress of a simulation task
+
+The simulation task (task_queue/tasks.py) stores its progress under this id while it runs and forgets it when it
+ends, the web app (webapp.py) reads it. The progress is not stored in the state of the task itself, which would
+overwrite the ABORTED state set by AbortableAsyncResult.abort. This module has no dependency, so the worker and the
+web app can both import it.
+"""
+
+# Suffix appended to the id of the task
+PROGRESS_ID_SUFFIX = "-progress"
+
+
+def progress_id(task_id):
+    """
+    Id of the result backend entry holding the progress of a task
+    :param task_id: id of the simulation task
+    :return: id of the progress entry
+    """
+    return f"{task_id}{PROGRESS_ID_SUFFIX}"
@@ -9,9 +9,12 @@ from fastapi.responses import JSONResponse
 
 try:
     from worker import app as celery_app
+    from progress_key import progress_id
 except ModuleNotFoundError:
     from .worker import app as celery_app
+    from .progress_key import progress_id
 import celery.states as states
+from celery.contrib.abortable import ABORTED, AbortableAsyncResult
 
 app = FastAPI()
 
@@ -102,23 +105,44 @@ async def check_task(task_id: str) -> JSONResponse:
         "id": task_id,
         "status": res.state,
         "results": None,
+        "progress": None,
     }
-    if res.state == states.PENDING:
-        task["status"] = res.state
-    else:
-        task["status"] = "DONE"
+    if res.state == states.SUCCESS:
+        # The simulation task returns a dict of results, or a json string with an ERROR or ABORTED key
+        task["results"] = res.result
         results_as_dict = res.result
-        task["results"] = results_as_dict
-        if "ERROR" in task["results"]:
+        if isinstance(results_as_dict, str):
+            results_as_dict = json.loads(results_as_dict)
+        task["status"] = "DONE"
+        if "ERROR" in results_as_dict:
             task["status"] = "ERROR"
-            task["results"] = results_as_dict
+        elif "ABORTED" in results_as_dict:
+            task["status"] = "ABORTED"
+    elif res.state in (ABORTED, states.REVOKED):
+        # Abort requested, the simulation stops at its next progress update
+        task["status"] = ABORTED
+    elif res.state == states.FAILURE:
+        # Exception raised by the task outside the simulation, res.info is the exception
+        task["status"] = "ERROR"
+        task["results"] = {"ERROR": str(res.info)}
+    else:
+        # Pending, started or retried task: a running simulation stores its demand, fraction done and elapsed time
+        # under an id of its own
+        progress = celery_app.AsyncResult(progress_id(task_id))
+        if progress.state == "PROGRESS":
+            task["status"] = "PROGRESS"
+            task["progress"] = progress.info
+        else:
+            task["status"] = res.state
 
     return JSONResponse(content=jsonable_encoder(task))
 
 
 @app.get("/abort/{task_id}")
 async def revoke_task(task_id: str) -> JSONResponse:
-    res = celery_app.AsyncResult(task_id)
-    res.revoke(terminate=True)
+    # Running simulations check the abort request and stop within a few seconds, the worker process keeps running
+    AbortableAsyncResult(task_id, app=celery_app).abort()
+    # Tasks still waiting in the queue are not started
+    celery_app.AsyncResult(task_id).revoke()
     return JSONResponse(content=jsonable_encoder({"task_id": task_id, "aborted": True}))
 
@@ -0,0 +1,164 @@
+"""
+Check the precision of float32 profiles against float64 profiles of the same seeded simulation
+
+A synthetic village (see simulation_benchmark.synthetic_village) is simulated by run_opti_mg_dat with dtype float32
+and float64 and the same seed, at every level of detail and output resolution. Profiles are summed over users,
+appliances, user types and minutes in float64 and only rounded to dtype once (see RampControl's dtype), so every time
+step of the float32 outputs ("mean" and "max" dataframes) may only differ from float64 by the rounding of a few
+float32 operations:
+
+    |float32 - float64| <= STEP_TOLERANCE * |float64|               for every time step and column
+
+and the energy of every column (sum of its mean values over the timeframe, summed in float64) by
+
+    |energy float32 - energy float64| <= ENERGY_TOLERANCE * |energy float64|
+
+Accumulating in float32 instead compounds the rounding errors with the number of users, days and minutes and
+exceeds these bounds, e.g. by about 10x for users added one by one by the "ramp" engine (the default here, the
+"vectorized" engine sums the users of a user type in its sampler). The float32 outputs must also be float32 and
+finite (no overflow). The check fails (exit code 1) if any bound is exceeded, e.g.
+
+    python -m wefe_demand.helpers.dtype_precision_check --users 500 --days 31
+"""
+
+import argparse
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from wefe_demand.helpers.simulation_benchmark import synthetic_village
+from wefe_demand.input.admin_input import admin_input
+from wefe_demand.ramp_model.ramp_control import DETAIL_LEVELS, RampControl
+
+# Default output resolutions in minutes, 1 keeps the 1-minute profiles
+RESOLUTIONS = (1, 15, 60)
+
+# Maximal relative difference of a time step: rounding to float32 of the accumulated value (half an epsilon) and of
+# the mean (sum / resolution) computed in float32
+STEP_TOLERANCE = 2 * np.finfo(np.float32).eps
+
+# Maximal relative difference of the energy of a column, the sum of values rounded to float32 once each
+ENERGY_TOLERANCE = np.finfo(np.float32).eps
+
+
+def compare_outputs(reference, compared):
+    """
+    Compare the float32 output of run_opti_mg_dat with the float64 output
+    :param reference: float64 dataframe (mean or max) of run_opti_mg_dat
+    :param compared: float32 dataframe of the same simulation
+    :return: dict with the largest relative difference of a time step ("step_error"), of the energy of a column
+        ("energy_error"), whether all values are float32 ("float32") and finite ("finite")
+    """
+    reference_values = reference.to_numpy(dtype=np.float64)
+    compared_values = compared.to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step_errors = np.abs(
+            compared_values.astype(np.float64) - reference_values
+        ) / np.abs(reference_values)
+        # Steps without load must be exactly 0
+        step_errors[reference_values == 0] = np.where(
+            compared_values[reference_values == 0] == 0, 0, np.inf
+        )
+        reference_energy = reference_values.sum(axis=0)
+        energy_errors = np.abs(
+            compared_values.astype(np.float64).sum(axis=0) - reference_energy
+        ) / np.abs(reference_energy)
+        energy_errors[reference_energy == 0] = 0
+    return {
+        "step_error": float(np.nanmax(step_errors, initial=0)),
+        "energy_error": float(np.nanmax(energy_errors, initial=0)),
+        "float32": all(dtype == np.float32 for dtype in compared.dtypes),
+        "finite": bool(np.isfinite(compared_values).all()),
+    }
+
+
+def check_precision(
+    num_users=500,
+    num_days=31,
+    seed=0,
+    engine="ramp",
+    details=DETAIL_LEVELS,
+    resolutions=RESOLUTIONS,
+):
+    """
+    Simulate a synthetic village with float32 and float64 at every level of detail and resolution and compare them
+    :param num_users: number of users of the village
+    :param num_days: number of days to simulate
+    :param seed: seed of both simulations
+    :param engine: engine generating the load profiles, see RampControl
+    :param details: levels of detail to check
+    :param resolutions: output resolutions to check in minutes
+    :return: dataframe with one row per level of detail, resolution and output ("mean", "max"), see compare_outputs,
+        and whether the bounds hold ("ok")
+    """
+    village = synthetic_village(num_users)
+    rows = []
+    for detail in details:
+        for resolution in resolutions:
+            outputs = {}
+            for dtype in (np.float64, np.float32):
+                ramp_control = RampControl(
+                    num_days,
+                    "2018-01-01",
+                    seed=seed,
+                    output_resolution=resolution,
+                    detail=detail,
+                    engine=engine,
+                    dtype=dtype,
+                )
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    outputs[dtype] = ramp_control.run_opti_mg_dat(village, admin_input)
+            for output_name, reference, compared in zip(
+                ("mean", "max"), outputs[np.float64], outputs[np.float32]
+            ):
+                comparison = compare_outputs(reference, compared)
+                rows.append(
+                    {
+                        "detail": detail,
+                        "resolution": resolution,
+                        "output": output_name,
+                        **comparison,
+                        "ok": comparison["step_error"] <= STEP_TOLERANCE
+                        and comparison["energy_error"] <= ENERGY_TOLERANCE
+                        and comparison["float32"]
+                        and comparison["finite"],
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare float32 and float64 profiles of the same seeded simulation"
+    )
+    parser.add_argument("--users", type=int, default=500, help="Number of users")
+    parser.add_argument("--days", type=int, default=31, help="Number of days")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", type=str, default="ramp")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=list(RESOLUTIONS))
+    args = parser.parse_args()
+
+    comparison = check_precision(
+        num_users=args.users,
+        num_days=args.days,
+        seed=args.seed,
+        engine=args.engine,
+        resolutions=args.resolutions,
+    )
+    with pd.option_context("display.width", 200, "display.precision", 3):
+        print(comparison.to_string(index=False))
+    print(
+        f"Bounds: step error {STEP_TOLERANCE:.2e}, energy error {ENERGY_TOLERANCE:.2e}"
+    )
+    failed = comparison[~comparison["ok"]]
+    if len(failed) > 0:
+        print(f"FAILED: {len(failed)} of {len(comparison)} outputs exceed the bounds")
+        sys.exit(1)
+    print(f"OK: {len(comparison)} outputs within the bounds")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,7 @@
 class MissingInput(Exception):
     pass
+
+
+# Raised by a progress callback to stop a running simulation, see RampControl.run_opti_mg_dat
+class SimulationCancelled(Exception):
+    pass
@@ -0,0 +1,229 @@
+"""
+Stage-level timing and memory instrumentation of the pipeline
+
+The stages of the pipeline (Kobo download, form parsing, use case generation, RAMP sampling, resampling,
+serialisation) are wrapped in nested spans:
+
+    with span("run_use_cases"):
+        ...
+
+or by decorating the function of a stage with @instrumented(). Spans are only recorded while an Instrumentation is
+active, otherwise span() does nothing:
+
+    with Instrumentation(trace_memory=True) as instrumentation:
+        ramp_control.run_opti_mg_dat(input_dict, admin_input)
+    print(instrumentation.report().format())
+
+Every span records how often it was entered, its total and maximal duration, how much it raised the peak resident
+memory of the process and, if trace_memory, the peak memory allocated while it ran (tracemalloc, which slows down
+the traced code). Spans with the same name under the same parent span are aggregated. Spans of worker processes
+(n_jobs > 1, parallel_demands) are not recorded, their time is part of the span that waits for them.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Instrumentation spans are recorded in, None if the instrumentation is off
+_active_instrumentation = contextvars.ContextVar("active_instrumentation", default=None)
+
+
+def peak_rss():
+    """
+    Peak resident memory of the current process in bytes
+    :return: None where the resource module is not available
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def span(name):
+    """
+    Context manager recording a stage of the pipeline in the active Instrumentation, if any
+    :param name: name of the stage
+    :return:
+    """
+    instrumentation = _active_instrumentation.get()
+    if instrumentation is None:
+        return contextlib.nullcontext()
+    return instrumentation.span(name)
+
+
+def instrumented(name=None):
+    """
+    Decorator recording every call of a function as a span, see span
+    :param name: name of the span, the qualified name of the function by default
+    :return:
+    """
+
+    def decorator(function):
+        span_name = function.__qualname__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class SpanReport:
+    """
+    Aggregated measurements of all calls of a span with the same name under the same parent span
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        # Durations in seconds
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # Maximal increase of the peak resident memory of the process during one call in bytes
+        self.rss_increase = None
+        # Maximal peak of memory allocated during one call above the memory allocated at its start in bytes
+        self.peak_memory = None
+        self.children = {}
+
+    def child(self, name):
+        """
+        Report of a child span, created at its first call
+        :param name:
+        :return: SpanReport
+        """
+        if name not in self.children:
+            self.children[name] = SpanReport(name)
+        return self.children[name]
+
+    def to_dict(self):
+        """
+        Nested dict of the report, e.g. to serialise it as JSON
+        :return:
+        """
+        return {
+            "name": self.name,
+            "count": self.count,
+            "total_time": self.total_time,
+            "max_time": self.max_time,
+            "rss_increase": self.rss_increase,
+            "peak_memory": self.peak_memory,
+            "children": [child.to_dict() for child in self.children.values()],
+        }
+
+    def to_json(self, **kwargs):
+        """
+        :param kwargs: keyword arguments of json.dumps (e.g. indent)
+        :return: JSON str of to_dict
+        """
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def format(self, depth=0):
+        """
+        Human readable table of the report, one line per span indented by nesting level
+        :param depth: nesting level of this span
+        :return: str
+        """
+        line = f"{'  ' * depth}{self.name}: {self.count}x {self.total_time:.3f} s"
+        if self.rss_increase is not None:
+            line += f", rss +{self.rss_increase / 1024 ** 2:.1f} MB"
+        if self.peak_memory is not None:
+            line += f", peak {self.peak_memory / 1024 ** 2:.1f} MB"
+        return "\n".join(
+            [line] + [child.format(depth + 1) for child in self.children.values()]
+        )
+
+
+class Instrumentation:
+    """
+    Recorder of nested spans, see span
+    """
+
+    def __init__(self, name="pipeline", trace_memory=False):
+        """
+        :param name: name of the root span of the report
+        :param trace_memory: if True, trace the peak memory allocated during every span with tracemalloc
+        """
+        self.trace_memory = trace_memory
+        self.root = SpanReport(name)
+        # Reports of the open spans, from the root to the innermost one
+        self._stack = [self.root]
+        # Peak of traced memory of every open span so far, see span
+        self._peaks = [0]
+        self._token = None
+        self._started_tracing = False
+        self._start = None
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._token = _active_instrumentation.set(self)
+        self._start = time.perf_counter()
+        self.root.count += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self._start
+        self.root.total_time += duration
+        self.root.max_time = max(self.root.max_time, duration)
+        _active_instrumentation.reset(self._token)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        Record a span as child of the innermost open span
+        :param name:
+        :return:
+        """
+        report = self._stack[-1].child(name)
+        self._stack.append(report)
+        if self.trace_memory:
+            # tracemalloc has a single peak: keep the peak of the parent spans so far before resetting it
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            memory_at_start = tracemalloc.get_traced_memory()[0]
+            self._peaks.append(memory_at_start)
+        rss_at_start = peak_rss()
+        start = time.perf_counter()
+        try:
+            yield report
+        finally:
+            duration = time.perf_counter() - start
+            report.count += 1
+            report.total_time += duration
+            report.max_time = max(report.max_time, duration)
+            if rss_at_start is not None:
+                report.rss_increase = max(
+                    report.rss_increase or 0, peak_rss() - rss_at_start
+                )
+            if self.trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                report.peak_memory = max(
+                    report.peak_memory or 0, peak - memory_at_start
+                )
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            self._stack.pop()
+
+    def report(self):
+        """
+        Report of the root span with the reports of all recorded spans as children
+        :return: SpanReport
+        """
+        return self.root
@@ -0,0 +1,148 @@
+"""
+Check that the peak memory of the out-of-core mode does not grow with the 1-minute profiles of the timeframe
+
+A synthetic village (see simulation_benchmark.synthetic_village) is simulated by run_opti_mg_dat with a working_dir
+for growing numbers of days, every horizon in a fresh process so that its peak resident memory (peak_rss) belongs
+to this horizon only. Between the shortest and the longest horizon, the peak memory may only grow by what the
+returned dataframes and the 1-minute datetime index of RampControl need:
+
+    peak_rss growth <= OUTPUT_COPIES * output growth + minute index growth + RSS_TOLERANCE
+
+while the 1-minute profiles of all columns of the largest demand (which run_use_cases keeps in memory without
+working_dir) grow much faster. The check fails (exit code 1) if the bound is exceeded, e.g.
+
+    python -m wefe_demand.helpers.out_of_core_memory_check --users 100 --days 365 1825 3650
+"""
+
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from wefe_demand.helpers.instrumentation import peak_rss
+from wefe_demand.helpers.simulation_benchmark import synthetic_village
+from wefe_demand.input.admin_input import admin_input
+from wefe_demand.ramp_model.ramp_control import DEMANDS, RampControl
+
+# Default horizons in days
+DAYS = (365, 1825, 3650)
+
+# Number of copies of the returned dataframes alive at once (folded buffers, sum / mean / max dataframes of a demand,
+# multi-index dataframes of all demands)
+OUTPUT_COPIES = 4
+
+# Growth of the peak memory allowed in addition to the output, e.g. for allocator fragmentation (bytes)
+RSS_TOLERANCE = 64 * 1024**2
+
+
+def run_horizon(num_users, num_days, working_dir, **ramp_options):
+    """
+    Simulate a synthetic village in out-of-core mode and measure its memory
+    :param num_users: number of users of the village
+    :param num_days: number of days to simulate
+    :param working_dir: directory of the memory-mapped files
+    :param ramp_options: keyword arguments of RampControl (e.g. seed, detail)
+    :return: dict with the "peak_rss", the size of the returned dataframes ("output_bytes"), of the 1-minute
+        datetime index ("minute_index_bytes") and of the 1-minute profiles of the largest demand
+        ("minute_profiles_bytes") in bytes
+    """
+    village = synthetic_village(num_users)
+    ramp_control = RampControl(
+        num_days, "2018-01-01", working_dir=working_dir, **ramp_options
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        profiles_mean, profiles_max = ramp_control.run_opti_mg_dat(village, admin_input)
+    largest_demand_columns = max(
+        len(profiles_mean[demand_name].columns)
+        for demand_name in DEMANDS
+        if demand_name in profiles_mean.columns.get_level_values(0)
+    )
+    return {
+        "num_days": num_days,
+        "peak_rss": peak_rss(),
+        "output_bytes": int(
+            profiles_mean.memory_usage(deep=True).sum()
+            + profiles_max.memory_usage(deep=True).sum()
+        ),
+        "minute_index_bytes": ramp_control.min_timeseries.nbytes,
+        "minute_profiles_bytes": largest_demand_columns
+        * num_days
+        * 1440
+        * ramp_control.dtype.itemsize,
+    }
+
+
+def check_memory_bound(num_users=100, days=DAYS, **ramp_options):
+    """
+    Simulate every horizon in a fresh process and compare the growth of the peak memory to the bound
+    :param num_users: number of users of the village
+    :param days: numbers of days to simulate, at least two
+    :param ramp_options: keyword arguments of RampControl
+    :return: list of the results of every horizon (see run_horizon), allowed growth of the peak memory in bytes
+    """
+    if len(days) < 2:
+        raise ValueError(f"The check needs at least two horizons, got {days}")
+    results = []
+    with tempfile.TemporaryDirectory() as working_dir:
+        for num_days in sorted(days):
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                results.append(
+                    executor.submit(
+                        run_horizon, num_users, num_days, working_dir, **ramp_options
+                    ).result()
+                )
+    first, last = results[0], results[-1]
+    allowed_growth = (
+        OUTPUT_COPIES * (last["output_bytes"] - first["output_bytes"])
+        + last["minute_index_bytes"]
+        - first["minute_index_bytes"]
+        + RSS_TOLERANCE
+    )
+    return results, allowed_growth
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that the peak memory of the out-of-core mode is bounded"
+    )
+    parser.add_argument("--users", type=int, default=100, help="Number of users")
+    parser.add_argument(
+        "--days", type=int, nargs="+", default=list(DAYS), help="Numbers of days"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--detail", type=str, default="appliance")
+    parser.add_argument("--resolution", type=int, default=None)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    results, allowed_growth = check_memory_bound(
+        num_users=args.users,
+        days=args.days,
+        seed=args.seed,
+        detail=args.detail,
+        output_resolution=args.resolution,
+        n_jobs=args.jobs,
+    )
+    for result in results:
+        print(
+            f"{result['num_days']} days: peak_rss {result['peak_rss'] / 1024 ** 2:.0f} MB, "
+            f"output {result['output_bytes'] / 1024 ** 2:.0f} MB, "
+            f"1-minute profiles of the largest demand {result['minute_profiles_bytes'] / 1024 ** 2:.0f} MB"
+        )
+    growth = results[-1]["peak_rss"] - results[0]["peak_rss"]
+    print(
+        f"peak_rss growth {growth / 1024 ** 2:.0f} MB, allowed {allowed_growth / 1024 ** 2:.0f} MB"
+    )
+    if growth > allowed_growth:
+        print("FAILED: the peak memory grows with the 1-minute profiles")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
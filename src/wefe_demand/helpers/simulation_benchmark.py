@@ -0,0 +1,382 @@
+"""
+Benchmark suite of the simulation pipeline on synthetic villages
+
+Synthetic input dicts shaped like input/complete_input.py are generated for every number of users and simulated with
+RampControl for every number of days. The stages of run_opti_mg_dat are timed separately for every demand:
+- use_case_generation: RampControl.generate_use_cases
+- run_use_cases: RampControl.run_use_cases without its final folding (simulation and merging of the work units,
+  which fold their own days at appliance and user level of detail)
+- resampling: folding of the merged profiles at the end of RampControl.run_use_cases (span "resampling") and
+  RampControl.resample_demand_profiles
+- concat: combination of all demands into the multi-index mean and max dataframes
+
+Every case runs in a fresh process, so the peak resident memory of the process (peak_rss) belongs to this case only.
+With --trace-memory, the peak memory allocated during every stage is traced with tracemalloc as well, which slows
+down the simulation. Results are written as JSON to compare them between versions, e.g.
+
+    python -m wefe_demand.helpers.simulation_benchmark --users 10 100 --days 7 90 --output benchmark.json
+
+Use case generation is measured on villages with many user types, e.g. one per respondent of a survey:
+
+    python -m wefe_demand.helpers.simulation_benchmark --users 2000 --household-types 200 --days 365
+"""
+
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from wefe_demand.helpers.instrumentation import Instrumentation, peak_rss
+from wefe_demand.input.admin_input import admin_input
+from wefe_demand.input.complete_input import input_dict
+from wefe_demand.ramp_model.cache import engine_version
+from wefe_demand.ramp_model.ramp_control import (
+    DEFAULT_OUTPUT_RESOLUTION,
+    DEMANDS,
+    RampControl,
+)
+
+# Default benchmark grid
+USERS = (10, 100, 1000, 10000)
+DAYS = (7, 90, 365)
+
+# Timed stages of the simulation pipeline
+STAGES = ("use_case_generation", "run_use_cases", "resampling", "concat")
+
+# Electrical appliances the synthetic households own in addition to the lights of the template household
+HOUSEHOLD_APPLIANCES = {
+    "radio": {
+        "num_app": 1,
+        "power": 5,
+        "usage_window_1": [6, 9],
+        "usage_window_2": [18, 22],
+        "daily_usage_time": 3,
+        "func_cycle": 30,
+    },
+    "mobile": {
+        "num_app": 2,
+        "power": 5,
+        "usage_window_1": [8, 12],
+        "usage_window_2": [18, 23],
+        "daily_usage_time": 2,
+        "func_cycle": 60,
+    },
+    "television": {
+        "num_app": 1,
+        "power": 60,
+        "usage_window_1": [12, 14],
+        "usage_window_2": [18, 23],
+        "daily_usage_time": 3,
+        "func_cycle": 30,
+    },
+}
+
+
+def synthetic_village(num_users, household_types=3, seed=0):
+    """
+    Generate an input dict shaped like input/complete_input.py for a village of num_users users
+    - household_types variants of the template household "low_income_hh" share 90% of the users, a farm based on
+      the template "medium_farm" the remaining 10% (at least 1 user)
+    - the n-th household variant owns the first n - 1 appliances of HOUSEHOLD_APPLIANCES in addition to the lights,
+      power and daily usage time of all its appliances are randomised by +/- 20%
+    - agro-processing machines without metadata in admin_input are left out
+
+    :param num_users: total number of users of the village
+    :param household_types: number of household user types
+    :param seed: seed of the randomised appliance parameters
+    :return: input dict
+    """
+    generator = np.random.default_rng(seed)
+    num_farms = max(1, round(0.1 * num_users))
+    num_households = num_users - num_farms
+
+    village = {}
+    for household_idx in range(household_types):
+        # Spread the households as evenly as possible over the household types
+        household_users = num_households // household_types + (
+            household_idx < num_households % household_types
+        )
+        if household_users == 0:
+            continue
+        household = copy.deepcopy(input_dict["low_income_hh"])
+        household["num_users"] = household_users
+        for appliance_name in list(HOUSEHOLD_APPLIANCES)[:household_idx]:
+            household["appliances"][appliance_name] = copy.deepcopy(
+                HOUSEHOLD_APPLIANCES[appliance_name]
+            )
+        for appliance in household["appliances"].values():
+            appliance["power"] = round(
+                appliance["power"] * generator.uniform(0.8, 1.2), 1
+            )
+            appliance["daily_usage_time"] = round(
+                appliance["daily_usage_time"] * generator.uniform(0.8, 1.2), 2
+            )
+        village[f"household_{household_idx + 1}"] = household
+
+    farm = copy.deepcopy(input_dict["medium_farm"])
+    farm["num_users"] = num_farms
+    farm["agro_processing_machines"] = {
+        machine_name: machine
+        for machine_name, machine in farm["agro_processing_machines"].items()
+        if machine_name in admin_input["agro_processing_metadata"]
+    }
+    village["farm"] = farm
+    return village
+
+
+def measure(trace_memory, function, *args, **kwargs):
+    """
+    Run a function and measure its duration and, if trace_memory, the peak memory it allocated
+    :param trace_memory: if True, tracemalloc must be tracing
+    :param function:
+    :param args: positional arguments of function
+    :param kwargs: keyword arguments of function
+    :return: result of function, duration in seconds, peak memory in bytes (None if not trace_memory)
+    """
+    if trace_memory:
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    duration = time.perf_counter() - start
+    peak_memory = (
+        tracemalloc.get_traced_memory()[1] - memory_before if trace_memory else None
+    )
+    return result, duration, peak_memory
+
+
+def run_case(num_users, num_days, household_types=3, **case_options):
+    """
+    Simulate a synthetic village and time every stage of the simulation pipeline, see time_pipeline
+    - warnings of RAMP (e.g. about appliances without usage during a month) are not shown
+    :param num_users: number of users of the village, see synthetic_village
+    :param num_days: number of days to simulate
+    :param household_types: number of household user types of the village, see synthetic_village. Use case
+        generation builds the users of every user type and month, it is only significant with many user types
+        (e.g. one per survey respondent)
+    :param case_options: keyword arguments of time_pipeline
+    :return: see time_pipeline
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return time_pipeline(
+            synthetic_village(num_users, household_types=household_types),
+            num_days,
+            **case_options,
+        )
+
+
+def time_pipeline(
+    village, num_days, start_date="2018-01-01", trace_memory=False, **ramp_options
+):
+    """
+    Simulate an input dict and time every stage of the simulation pipeline
+    :param village: input dict, see synthetic_village
+    :param num_days: number of days to simulate
+    :param start_date: first simulated day
+    :param trace_memory: if True, trace the peak memory allocated during every stage with tracemalloc
+    :param ramp_options: keyword arguments of RampControl (e.g. seed, n_jobs, engine)
+    :return: dict with the durations (seconds) and peak memory (bytes) of the case
+    """
+    ramp_control = RampControl(num_days, start_date, **ramp_options)
+    if trace_memory:
+        tracemalloc.start()
+
+    demand_stages = {}
+    stage_peak_memory = {stage: 0 for stage in STAGES}
+    demand_profiles_mean = {}
+    demand_profiles_max = {}
+    for demand_name in DEMANDS:
+        durations = {}
+        use_cases, durations["use_case_generation"], peak = measure(
+            trace_memory,
+            ramp_control.generate_use_cases,
+            demand_name,
+            village,
+            admin_input,
+        )
+        stage_peak_memory["use_case_generation"] = max(
+            stage_peak_memory["use_case_generation"], peak or 0
+        )
+        # run_use_cases folds the merged profiles to the output resolution, as in run_demand. This final folding is
+        # recorded as span "resampling" and counted in the resampling stage
+        with Instrumentation() as instrumentation:
+            demand_profiles, durations["run_use_cases"], peak = measure(
+                trace_memory,
+                ramp_control.run_use_cases,
+                use_cases,
+                village,
+                demand_name,
+                resolution=ramp_control.output_resolution or DEFAULT_OUTPUT_RESOLUTION,
+            )
+        folding = instrumentation.report().child("RampControl.run_use_cases")
+        folding_duration = folding.child("resampling").total_time
+        durations["run_use_cases"] -= folding_duration
+        stage_peak_memory["run_use_cases"] = max(
+            stage_peak_memory["run_use_cases"], peak or 0
+        )
+        (
+            (demand_profiles_mean[demand_name], demand_profiles_max[demand_name]),
+            durations["resampling"],
+            peak,
+        ) = measure(
+            trace_memory,
+            ramp_control.resample_demand_profiles,
+            demand_name,
+            demand_profiles,
+        )
+        durations["resampling"] += folding_duration
+        stage_peak_memory["resampling"] = max(
+            stage_peak_memory["resampling"], peak or 0
+        )
+        del use_cases, demand_profiles
+        demand_stages[demand_name] = durations
+
+    _, concat_duration, stage_peak_memory["concat"] = measure(
+        trace_memory,
+        lambda: (
+            pd.concat(demand_profiles_mean, axis=1),
+            pd.concat(demand_profiles_max, axis=1),
+        ),
+    )
+    if trace_memory:
+        tracemalloc.stop()
+
+    stages = {
+        stage: sum(durations.get(stage, 0) for durations in demand_stages.values())
+        for stage in STAGES
+    }
+    stages["concat"] = concat_duration
+    return {
+        "num_users": sum(user_data["num_users"] for user_data in village.values()),
+        "num_days": num_days,
+        "user_types": len(village),
+        "total": sum(stages.values()),
+        "stages": stages,
+        "demands": demand_stages,
+        "peak_rss": peak_rss(),
+        "stage_peak_memory": stage_peak_memory if trace_memory else None,
+    }
+
+
+def run_benchmark(users=USERS, days=DAYS, isolate=True, **case_options):
+    """
+    Run every combination of users and days
+    :param users: numbers of users of the synthetic villages
+    :param days: numbers of simulated days
+    :param isolate: if True, every case runs in a fresh process so that its peak_rss is not affected by other cases
+    :param case_options: keyword arguments of run_case (e.g. trace_memory, seed, n_jobs)
+    :return: dict with the "metadata" of the benchmark and the "results" of every case
+    """
+    results = []
+    for num_users in users:
+        for num_days in days:
+            if isolate:
+                with ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn")
+                ) as executor:
+                    result = executor.submit(
+                        run_case, num_users, num_days, **case_options
+                    ).result()
+            else:
+                result = run_case(num_users, num_days, **case_options)
+            print(
+                f"{num_users} users, {num_days} days: {result['total']:.2f} s "
+                + ", ".join(
+                    f"{stage} {duration:.2f} s"
+                    for stage, duration in result["stages"].items()
+                )
+            )
+            results.append(result)
+
+    metadata = {
+        "engine_version": engine_version(),
+        "date": pd.Timestamp.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "isolate": isolate,
+        "options": case_options,
+    }
+    return {"metadata": metadata, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the simulation pipeline on synthetic villages"
+    )
+    parser.add_argument(
+        "--users", type=int, nargs="+", default=list(USERS), help="Numbers of users"
+    )
+    parser.add_argument(
+        "--days", type=int, nargs="+", default=list(DAYS), help="Numbers of days"
+    )
+    parser.add_argument(
+        "--household-types",
+        type=int,
+        default=3,
+        help="Number of household user types of the villages",
+    )
+    parser.add_argument("--start-date", type=str, default="2018-01-01")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the simulation, fixed by default so results can be compared",
+    )
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--engine", type=str, default="ramp")
+    parser.add_argument("--pool-size", type=int, default=None)
+    parser.add_argument("--resolution", type=int, default=None)
+    parser.add_argument("--detail", type=str, default="appliance")
+    parser.add_argument("--dtype", type=str, default="float64")
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Trace the peak memory of every stage (slows down the simulation)",
+    )
+    parser.add_argument(
+        "--no-isolation",
+        action="store_true",
+        help="Run all cases in the current process instead of a fresh process per case",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path of the JSON output file"
+    )
+    args = parser.parse_args()
+
+    benchmark = run_benchmark(
+        users=args.users,
+        days=args.days,
+        isolate=not args.no_isolation,
+        household_types=args.household_types,
+        start_date=args.start_date,
+        trace_memory=args.trace_memory,
+        seed=args.seed,
+        n_jobs=args.jobs,
+        engine=args.engine,
+        pool_size=args.pool_size,
+        output_resolution=args.resolution,
+        detail=args.detail,
+        dtype=args.dtype,
+    )
+    if args.output is None:
+        print(json.dumps(benchmark, indent=2))
+    else:
+        with open(args.output, "w") as output_file:
+            json.dump(benchmark, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
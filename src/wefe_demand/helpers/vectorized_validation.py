@@ -0,0 +1,284 @@
+"""
+Statistical validation of the vectorized engine against RAMP, appliance by appliance
+
+The "vectorized" engine follows RAMP's algorithm with other random draws, so both engines can only be compared in
+distribution. For every appliance of every user type of a synthetic village (see simulation_benchmark.synthetic_village),
+the first use case of every demand is simulated with simulation.simulate_work_unit by both engines for several seeds,
+with the same peak time range and day types for both engines:
+- single user-days (the user type with one user): mean daily energy, mean daily peak and mean number of switch-on
+  events per day (runs of minutes drawing more than the window mask value of RAMP)
+- all users of the user type: mean daily peak and maximum peak over all days of the aggregated profile
+In addition, a year of the village is simulated by run_opti_mg_dat with both engines for several seeds and the
+yearly 1-minute peak of every demand is compared (see RampControl's statistics).
+
+A statistic is the mean over the seeds of its value for every seed. The engines agree if the difference of their
+statistics is within the sampling error:
+
+    |vectorized - ramp| <= z_threshold * standard error of the difference
+
+The standard error is estimated from the spread of the statistic between seeds. z_threshold is the two-sided
+threshold of the normal distribution for a false alarm probability FAMILY_ALPHA over all compared statistics
+(Bonferroni correction, about 3.9 for 130 statistics), so a systematic difference fails however small the relative
+difference is. The yearly peak is an extreme value of few coincident switch-ons and differs between single runs by
+several percent, only its mean over the seeds is compared. The check fails (exit code 1) if any statistic differs,
+e.g.
+
+    python -m wefe_demand.helpers.vectorized_validation --users 100 --days 28 --seeds 20 --yearly-seeds 10
+"""
+
+import argparse
+import copy
+import statistics
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from wefe_demand.helpers.simulation_benchmark import synthetic_village
+from wefe_demand.input.admin_input import admin_input
+from wefe_demand.ramp_model.ramp_control import DEMANDS, RampControl
+from wefe_demand.ramp_model.simulation import (
+    derive_seed,
+    seed_random_state,
+    simulate_work_unit,
+)
+from wefe_demand.ramp_model.vectorized import WINDOW_MASK_VALUE
+
+# Compared engines, the first one is the reference
+ENGINES = ("ramp", "vectorized")
+
+# Probability that any of the compared statistics fails although both engines follow the same distribution
+FAMILY_ALPHA = 0.01
+
+
+def day_statistics(single_profiles, aggregate_profiles):
+    """
+    Statistics of the profiles of one appliance simulated with one seed
+    :param single_profiles: 2D numpy array [day, min_of_day] of a single user
+    :param aggregate_profiles: 2D numpy array [day, min_of_day] of all users of the user type
+    :return: dict {statistic: value}
+    """
+    switched_on = single_profiles > WINDOW_MASK_VALUE
+    # Minutes at which a run of minutes drawing power starts
+    switch_ons = (
+        switched_on[:, 0].sum() + (switched_on[:, 1:] & ~switched_on[:, :-1]).sum()
+    )
+    daily_peaks = aggregate_profiles.max(axis=1)
+    return {
+        "single_energy": single_profiles.sum(axis=1).mean(),
+        "single_peak": single_profiles.max(axis=1).mean(),
+        "single_switch_ons": switch_ons / len(single_profiles),
+        "aggregate_daily_peak": daily_peaks.mean(),
+        "aggregate_max_peak": daily_peaks.max(),
+    }
+
+
+def z_threshold(num_comparisons, family_alpha=FAMILY_ALPHA):
+    """
+    Two-sided threshold of the difference in standard errors, Bonferroni-corrected for the number of comparisons
+    :param num_comparisons: number of compared statistics
+    :param family_alpha: probability that any comparison fails by chance
+    :return: threshold (float)
+    """
+    return statistics.NormalDist().inv_cdf(1 - family_alpha / (2 * num_comparisons))
+
+
+def compare_statistics(values):
+    """
+    Compare the statistics of both engines over all seeds
+    :param values: dict {engine: 1D numpy array of the value of a statistic for every seed}
+    :return: dict with the mean of every engine, their relative difference and the difference in standard errors
+        ("z", inf for a difference without variation between seeds)
+    """
+    reference, compared = (np.asarray(values[engine]) for engine in ENGINES)
+    difference = compared.mean() - reference.mean()
+    standard_error = np.sqrt(
+        sum(
+            engine_values.var(ddof=1) / len(engine_values)
+            for engine_values in (reference, compared)
+        )
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if standard_error > 0:
+            z = abs(difference) / standard_error
+        else:
+            z = 0.0 if difference == 0 else np.inf
+        relative_difference = difference / abs(reference.mean())
+    return {
+        ENGINES[0]: reference.mean(),
+        ENGINES[1]: compared.mean(),
+        "rel_difference": relative_difference,
+        "z": z,
+    }
+
+
+def validate_engines(num_users=100, num_days=28, seeds=range(20), demands=DEMANDS):
+    """
+    Simulate every appliance of a synthetic village with both engines and compare their statistics
+    :param num_users: number of users of the village
+    :param num_days: number of days simulated per seed, the last two days of every week are holidays
+    :param seeds: seeds of the compared simulations, at least two
+    :param demands: demands whose appliances are compared
+    :return: dataframe with one row per demand, user type, appliance and statistic, see compare_statistics
+    """
+    seeds = list(seeds)
+    if len(seeds) < 2:
+        raise ValueError(f"The validation needs at least two seeds, got {seeds}")
+    village = synthetic_village(num_users)
+    ramp_control = RampControl(num_days, "2018-01-01")
+    day_types = (np.arange(num_days) % 7 >= 5).astype(np.int8)
+
+    rows = []
+    for demand_name in demands:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            use_case, _ = ramp_control.generate_use_cases(
+                demand_name, village, admin_input
+            )[0]
+        # Same peak time range for both engines. RAMP derives it from the appliances' last daily profiles, it is
+        # therefore drawn for all seeds before any simulation
+        peak_time_ranges = {}
+        for seed in seeds:
+            seed_random_state(derive_seed(seed, demand_name, "peak_time"))
+            peak_time_ranges[seed] = use_case.calc_peak_time_range()
+        for user in use_case.users:
+            single_user = copy.deepcopy(user)
+            single_user.num_users = 1
+            # {appliance: {statistic: {engine: [value of every seed]}}}
+            values = {}
+            for seed in seeds:
+                for engine in ENGINES:
+                    with warnings.catch_warnings():
+                        # RAMP warns about every switch-on event drawn outside the duty cycle windows
+                        warnings.simplefilter("ignore")
+                        single_profiles, aggregate_profiles = (
+                            simulate_work_unit(
+                                simulated_user,
+                                day_types,
+                                peak_time_ranges[seed],
+                                seed=derive_seed(seed, demand_name, user.user_name),
+                                engine=engine,
+                            )
+                            for simulated_user in (single_user, user)
+                        )
+                    for appliance_name, profiles in aggregate_profiles.items():
+                        for statistic, value in day_statistics(
+                            single_profiles[appliance_name], profiles
+                        ).items():
+                            values.setdefault(appliance_name, {}).setdefault(
+                                statistic, {}
+                            ).setdefault(engine, []).append(value)
+            for appliance_name, statistics in values.items():
+                for statistic, statistic_values in statistics.items():
+                    rows.append(
+                        {
+                            "demand": demand_name,
+                            "user": user.user_name,
+                            "appliance": appliance_name,
+                            "statistic": statistic,
+                            **compare_statistics(statistic_values),
+                        }
+                    )
+    return pd.DataFrame(rows)
+
+
+def yearly_peaks(num_users=100, seeds=range(10), num_days=365, demands=DEMANDS):
+    """
+    Simulate a synthetic village with both engines and compare the yearly 1-minute peak of every demand
+    :param num_users: number of users of the village
+    :param seeds: seeds of the compared simulations, at least two
+    :param num_days: number of days simulated per seed
+    :param demands: demands whose peaks are compared
+    :return: dataframe with one row per demand, see compare_statistics
+    """
+    seeds = list(seeds)
+    if len(seeds) < 2:
+        raise ValueError(f"The validation needs at least two seeds, got {seeds}")
+    village = synthetic_village(num_users)
+    # {demand: {engine: [yearly peak of every seed]}}
+    values = {demand_name: {} for demand_name in demands}
+    for seed in seeds:
+        for engine in ENGINES:
+            ramp_control = RampControl(
+                num_days,
+                "2018-01-01",
+                seed=seed,
+                detail="demand",
+                engine=engine,
+                statistics=True,
+            )
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                ramp_control.run_opti_mg_dat(village, admin_input)
+            for demand_name in demands:
+                values[demand_name].setdefault(engine, []).append(
+                    ramp_control.load_statistics[demand_name]["peak"]
+                )
+    return pd.DataFrame(
+        [
+            {
+                "demand": demand_name,
+                "user": "all",
+                "appliance": "all",
+                "statistic": "yearly_peak",
+                **compare_statistics(demand_values),
+            }
+            for demand_name, demand_values in values.items()
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the vectorized engine with RAMP appliance by appliance"
+    )
+    parser.add_argument("--users", type=int, default=100, help="Number of users")
+    parser.add_argument("--days", type=int, default=28, help="Number of days per seed")
+    parser.add_argument("--seeds", type=int, default=20, help="Number of seeds")
+    parser.add_argument(
+        "--yearly-seeds",
+        type=int,
+        default=10,
+        help="Number of seeds of the yearly peaks, 0 to skip them",
+    )
+    parser.add_argument(
+        "--demands", type=str, nargs="+", default=list(DEMANDS), choices=DEMANDS
+    )
+    args = parser.parse_args()
+
+    comparison = validate_engines(
+        num_users=args.users,
+        num_days=args.days,
+        seeds=range(args.seeds),
+        demands=args.demands,
+    )
+    if args.yearly_seeds > 0:
+        comparison = pd.concat(
+            [
+                comparison,
+                yearly_peaks(
+                    num_users=args.users,
+                    seeds=range(args.yearly_seeds),
+                    demands=args.demands,
+                ),
+            ],
+            ignore_index=True,
+        )
+    # Bonferroni correction over all compared statistics
+    threshold = z_threshold(len(comparison))
+    comparison["ok"] = comparison["z"] <= threshold
+    with pd.option_context(
+        "display.max_rows", None, "display.width", 200, "display.precision", 3
+    ):
+        print(comparison.to_string(index=False))
+    print(f"z threshold for {len(comparison)} statistics: {threshold:.2f}")
+    failed = comparison[~comparison["ok"]]
+    if len(failed) > 0:
+        print(f"FAILED: {len(failed)} of {len(comparison)} statistics differ")
+        sys.exit(1)
+    print(f"OK: {len(comparison)} statistics agree")
+
+
+if __name__ == "__main__":
+    main()
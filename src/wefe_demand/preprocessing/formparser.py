@@ -2,6 +2,7 @@ import numpy as np
 from copy import copy
 
 
+from wefe_demand.helpers.instrumentation import instrumented
 from wefe_demand.preprocessing import constants
 from wefe_demand.preprocessing.constants import prefix, suffix
 from wefe_demand.preprocessing.constants import months_defaults, working_day
@@ -141,6 +142,7 @@ class FormParser:
         else:
             self.subtype_info = None
 
+    @instrumented()
     def create_dictionary(self, numerosity) -> dict:
         """
         Creates a dictionary needed for the ramp simulation, from the form data. If the form is from a local authority
@@ -4,6 +4,7 @@ import numpy as np
 
 from copy import copy
 
+from wefe_demand.helpers.instrumentation import instrumented
 from wefe_demand.preprocessing.formparser import FormParser
 from wefe_demand.preprocessing.utils import load_kobo_data, warn_and_skip
 from wefe_demand.preprocessing import constants
@@ -39,6 +40,7 @@ class SurveyParser:
     def init_parser(self) -> None:
         self.survey_key, self.token = os.getenv("SURVEY_KEY"), os.getenv("KOBO_TOKEN")
 
+    @instrumented()
     def read_survey(self) -> None:
         """
         Read the forms from the survey with the given key and token.
@@ -96,6 +98,7 @@ class SurveyParser:
         if self.n_forms["household"]:
             self._divide_households()
 
+    @instrumented()
     def process_survey(self, form_type=None, form_id=None) -> dict:
         """
         Process a selected subset of the forms in the survey.
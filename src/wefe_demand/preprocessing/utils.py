@@ -8,6 +8,7 @@ import warnings
 from copy import copy
 from koboextractor import KoboExtractor  # type: ignore
 
+from wefe_demand.helpers.instrumentation import instrumented
 from wefe_demand.preprocessing import constants
 
 
@@ -205,6 +206,7 @@ def check_time(windows, time):
 
 
 # %% general function
+@instrumented()
 def load_kobo_data(form_id, api_token):
     """
     Loads data from Kobo Toolbox using the given form id and api token.
@@ -0,0 +1,225 @@
+"""
+Content-addressed on-disk cache of simulation results
+
+Results are stored in one pickle file per entry, named after a hash of everything the result depends on (input data,
+admin input, timeframe, seed, simulation options and engine version). Identical requests thus find the stored result
+without simulating again, and any change of the inputs leads to a new entry.
+
+The cache directory is bounded in size: when it grows larger than max_size, the least recently used entries are
+deleted. The last use of an entry is tracked by the modification time of its file.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import ramp  # type: ignore
+
+from wefe_demand import version
+
+# Version of the layout of cached results, increase it when the returned results change
+CACHE_FORMAT = 2
+
+# Extension of the files of cache entries
+ENTRY_EXTENSION = ".pkl"
+
+# Attributes of ramp.Appliance which hold simulation state or references instead of parameters
+APPLIANCE_STATE_ATTRIBUTES = (
+    "user",
+    "daily_use",
+    "free_spots",
+    "random_cycle1",
+    "random_cycle2",
+    "random_cycle3",
+    "current_duty_cycle_id",
+)
+
+
+def engine_version():
+    """
+    Version of the code generating the results, part of every cache key
+    :return: str
+    """
+    return f"wefe_demand={version};ramp={ramp.__version__};format={CACHE_FORMAT}"
+
+
+def canonical(value):
+    """
+    Turn nested input data into JSON-serializable values which do not depend on the insertion order of dicts
+    - dicts -> lists of [key, value] pairs sorted by key
+    - numpy arrays and scalars -> lists and Python scalars
+    - other unknown objects -> their string representation
+    :param value:
+    :return:
+    """
+    if isinstance(value, dict):
+        return sorted(
+            ([str(key), canonical(item)] for key, item in value.items()),
+            key=lambda pair: pair[0],
+        )
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return canonical(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def appliance_parameters(appliance):
+    """
+    Parameters of a RAMP appliance the profiles it generates depend on, e.g. to fingerprint these profiles
+    :param appliance: ramp.Appliance
+    :return: dict {attribute: value}
+    """
+    return {
+        attribute: value
+        for attribute, value in vars(appliance).items()
+        if attribute not in APPLIANCE_STATE_ATTRIBUTES
+    }
+
+
+class ResultCache:
+    """
+    On-disk store of results with size-based least recently used (LRU) eviction
+    """
+
+    def __init__(self, directory, max_size=2 * 1024**3):
+        """
+        :param directory: directory the cache entries are stored in, created if it does not exist
+        :param max_size: maximal total size of the cache entries in bytes (default 2 GB)
+        """
+        if max_size <= 0:
+            raise ValueError(f"Cache size must be positive, got {max_size}")
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """
+        Stable hash of the given parts, equal for equal content whatever the Python session
+        :param parts: values the cached result depends on (dicts, lists, numbers, strings, numpy arrays, ...)
+        :return: hexadecimal str
+        """
+        serialized = json.dumps(canonical(parts), separators=(",", ":"))
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def path(self, key):
+        """
+        Path of the file of a cache entry
+        :param key:
+        :return:
+        """
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+    def get(self, key):
+        """
+        Load a cached result and mark it as used
+        :param key: key of the entry, see key
+        :return: the cached result or None if there is no (readable) entry for this key
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as entry_file:
+                result = pickle.load(entry_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            # Unreadable entry (e.g. written by an incompatible version) -> drop it
+            self.remove(key)
+            return None
+        # Mark the entry as recently used
+        os.utime(path)
+        return result
+
+    def put(self, key, result, evict=True):
+        """
+        Store a result and evict least recently used entries if the cache grows too large
+        - the entry is written to a temporary file first, so concurrent readers never see partial entries
+        :param key: key of the entry, see key
+        :param result: picklable result
+        :param evict: if False, the size of the cache is not checked, e.g. to call evict once after storing many
+            entries
+        :return:
+        """
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=self.directory, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as entry_file:
+                pickle.dump(result, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self.path(key))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        if evict:
+            self.evict()
+
+    def remove(self, key):
+        """
+        Delete a cache entry if it exists
+        :param key:
+        :return:
+        """
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """
+        Cache entries from least to most recently used
+        :return: list of (path, size in bytes, time of last use)
+        """
+        entries = []
+        with os.scandir(self.directory) as directory_entries:
+            for directory_entry in directory_entries:
+                if not directory_entry.name.endswith(ENTRY_EXTENSION):
+                    continue
+                try:
+                    stat = directory_entry.stat()
+                except FileNotFoundError:
+                    # Removed by another process meanwhile
+                    continue
+                entries.append((directory_entry.path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        """
+        Total size of the cache entries in bytes
+        :return:
+        """
+        return sum(entry_size for _, entry_size, _ in self.entries())
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache is not larger than max_size
+        :return:
+        """
+        entries = self.entries()
+        total_size = sum(entry_size for _, entry_size, _ in entries)
+        for path, entry_size, _ in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= entry_size
+
+    def clear(self):
+        """
+        Delete all cache entries
+        :return:
+        """
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,83 @@
+"""
+Calendar of the simulated timeframe as NumPy arrays
+
+Every day of the timeframe is identified by its position (day index) from the start date, so timeframes can start
+on any day of the year and span several years. Year, month and weekday of every day are computed once, the RAMP day
+type of a user type (0->working day, 1->holiday) is then looked up for all days at once from a bitmask of its
+working days.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def working_days_bitmask(working_days):
+    """
+    Encode the working days of a user type as a 7-bit mask
+    :param working_days: weekdays (Monday=0, Sunday=6) the user type uses its appliances on
+    :return: int with bit weekday set for every working day (e.g. Monday to Friday -> 0b0011111)
+    """
+    bitmask = 0
+    for weekday in working_days:
+        if not 0 <= int(weekday) <= 6:
+            raise ValueError(
+                f"Working days must be weekdays from 0 to 6, got {weekday}"
+            )
+        bitmask |= 1 << int(weekday)
+    return bitmask
+
+
+class CalendarIndex:
+    """
+    Day index, month and weekday of every day of a timeframe
+    """
+
+    def __init__(self, start_date, number_of_days):
+        """
+        :param start_date: first day of the timeframe
+        :param number_of_days: number of days of the timeframe
+        """
+        days = pd.date_range(start_date, periods=number_of_days, freq="D")
+        # Position of every day in the timeframe
+        self.day_index = np.arange(number_of_days)
+        # Year of every day
+        self.year = days.year.to_numpy(dtype=np.int32)
+        # Month (1-12) of every day
+        self.month = days.month.to_numpy(dtype=np.int8)
+        # Weekday (Monday=0, Sunday=6) of every day
+        self.weekday = days.weekday.to_numpy(dtype=np.int8)
+        # Day indexes of the days of every month of the year, whatever the year
+        self.month_day_indexes = {
+            month: self.day_index[self.month == month] for month in range(1, 13)
+        }
+
+    def __len__(self):
+        return len(self.day_index)
+
+    def days_of_months(self, months):
+        """
+        Day indexes of all days of the given months, in chronological order
+        :param months: months of the year (1-12)
+        :return: numpy array of day indexes
+        """
+        return np.sort(
+            np.concatenate([self.month_day_indexes[month] for month in months])
+        )
+
+    def month_blocks(self, day_indexes):
+        """
+        Split days into blocks of consecutive days of the same month of the same year
+        :param day_indexes: day indexes in chronological order
+        :return: list of numpy arrays of day indexes, one per block in chronological order
+        """
+        day_indexes = np.asarray(day_indexes)
+        breaks = (np.diff(day_indexes) != 1) | (np.diff(self.month[day_indexes]) != 0)
+        return np.split(day_indexes, np.flatnonzero(breaks) + 1)
+
+    def day_types(self, bitmask):
+        """
+        RAMP day type of every day of the timeframe for a user type
+        :param bitmask: working days of the user type, see working_days_bitmask
+        :return: numpy array with 0 for working days and 1 for holidays
+        """
+        return ((bitmask >> self.weekday) & 1 ^ 1).astype(np.int8)
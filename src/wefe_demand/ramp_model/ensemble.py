@@ -0,0 +1,224 @@
+"""
+Online statistics of an ensemble of Monte-Carlo realisations of the demand profiles
+
+Every realisation (output of RampControl.run_opti_mg_dat with its own seed) is folded into the statistics as soon as
+it is simulated and dropped afterwards, so the memory does not grow with the number of realisations:
+- running mean and variance of every time step and column (Welford's algorithm)
+- streaming quantiles of every time step and column (P-square algorithm of Jain and Chlamtac, 1985, which keeps 5
+  markers per quantile instead of all observations). The estimates are approximate, their error shrinks with the
+  number of realisations; with less than 5 realisations, quantiles are computed exactly
+- peak (maximum over the timeframe) of every column of every realisation
+"""
+
+import numpy as np
+import pandas as pd
+
+# Quantiles of the ensemble estimated by default (P10, P50, P90)
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+
+class StreamingQuantile:
+    """
+    P-square estimator of a quantile of every element of a stream of numpy arrays of the same shape
+    """
+
+    def __init__(self, quantile):
+        """
+        :param quantile: probability of the estimated quantile, between 0 and 1
+        """
+        if not 0 < quantile < 1:
+            raise ValueError(f"Quantiles must be between 0 and 1, got {quantile}")
+        self.quantile = quantile
+        self.count = 0
+        # First observations, until the 5 markers can be initialised
+        self.observations = []
+        # Heights and positions (number of observations below) of the 5 markers [marker, element]
+        self.heights = None
+        self.positions = None
+        # Desired positions of the markers and their increment for every observation
+        self.desired_positions = np.array(
+            [0, 2 * quantile, 4 * quantile, 2 + 2 * quantile, 4]
+        )
+        self.desired_increments = np.array(
+            [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+        )
+
+    def add(self, values):
+        """
+        Update the estimate with one observation of every element
+        :param values: numpy array
+        :return:
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        self.count += 1
+        if self.count <= 5:
+            self.observations.append(values)
+            if self.count == 5:
+                self.heights = np.sort(np.stack(self.observations), axis=0)
+                self.positions = np.tile(
+                    np.arange(5, dtype=np.float64)[:, None], (1, len(values))
+                )
+                self.observations = []
+            return
+
+        heights = self.heights
+        positions = self.positions
+        # Extreme markers follow the minimum and maximum
+        np.minimum(heights[0], values, out=heights[0])
+        np.maximum(heights[4], values, out=heights[4])
+        # Markers above the observation move up by one position
+        cell = (values >= heights[1:4]).sum(axis=0)
+        positions += np.arange(5)[:, None] > cell
+        self.desired_positions += self.desired_increments
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for marker in (1, 2, 3):
+                below, above = marker - 1, marker + 1
+                offset = self.desired_positions[marker] - positions[marker]
+                move = ((offset >= 1) & (positions[above] - positions[marker] > 1)) | (
+                    (offset <= -1) & (positions[below] - positions[marker] < -1)
+                )
+                step = np.where(move, np.sign(offset), 0.0)
+                # Piecewise-parabolic prediction of the marker's new height
+                parabolic = heights[marker] + step / (
+                    positions[above] - positions[below]
+                ) * (
+                    (positions[marker] - positions[below] + step)
+                    * (heights[above] - heights[marker])
+                    / (positions[above] - positions[marker])
+                    + (positions[above] - positions[marker] - step)
+                    * (heights[marker] - heights[below])
+                    / (positions[marker] - positions[below])
+                )
+                # Linear prediction if the parabolic one is not between the neighbouring markers
+                neighbour = np.where(step > 0, above, below)
+                neighbour_heights = np.take_along_axis(heights, neighbour[None], 0)[0]
+                neighbour_positions = np.take_along_axis(positions, neighbour[None], 0)[
+                    0
+                ]
+                linear = heights[marker] + step * (
+                    neighbour_heights - heights[marker]
+                ) / (neighbour_positions - positions[marker])
+                new_heights = np.where(
+                    (heights[below] < parabolic) & (parabolic < heights[above]),
+                    parabolic,
+                    linear,
+                )
+                heights[marker] = np.where(move, new_heights, heights[marker])
+                positions[marker] += step
+
+    def estimate(self):
+        """
+        Current estimate of the quantile of every element
+        :return: 1D numpy array (flattened shape of the observations)
+        """
+        if self.count == 0:
+            raise ValueError("No observation was added yet")
+        if self.count < 5:
+            return np.quantile(np.stack(self.observations), self.quantile, axis=0)
+        return self.heights[2].copy()
+
+
+class EnsembleStatistics:
+    """
+    Online statistics of the (mean, max) dataframes of run_opti_mg_dat over an ensemble of realisations
+    - mean, standard deviation and quantiles are computed from the "mean" dataframes (sum for water demands)
+    - peaks are the maximum of every column of the "max" dataframes
+    """
+
+    def __init__(self, quantiles=DEFAULT_QUANTILES):
+        """
+        :param quantiles: probabilities of the estimated quantiles (default P10, P50, P90)
+        """
+        self.quantile_estimators = [
+            StreamingQuantile(quantile) for quantile in quantiles
+        ]
+        self.count = 0
+        self.index = None
+        self.columns = None
+        self.mean = None
+        self.squared_deviations = None
+        self.peaks = []
+
+    def add(self, profiles_mean, profiles_max):
+        """
+        Fold one realisation into the statistics
+        :param profiles_mean: "mean" dataframe of run_opti_mg_dat
+        :param profiles_max: "max" dataframe of run_opti_mg_dat
+        :return:
+        """
+        if self.count == 0:
+            self.index = profiles_mean.index
+            self.columns = profiles_mean.columns
+            self.mean = np.zeros(profiles_mean.shape)
+            self.squared_deviations = np.zeros(profiles_mean.shape)
+        elif not (
+            profiles_mean.index.equals(self.index)
+            and profiles_mean.columns.equals(self.columns)
+        ):
+            raise ValueError(
+                "All realisations of an ensemble must have the same time steps and columns"
+            )
+        values = profiles_mean.to_numpy(dtype=np.float64)
+        self.count += 1
+        # Welford's update of the running mean and sum of squared deviations
+        deviation = values - self.mean
+        self.mean += deviation / self.count
+        self.squared_deviations += deviation * (values - self.mean)
+        for estimator in self.quantile_estimators:
+            estimator.add(values)
+        self.peaks.append(profiles_max[self.columns].max().to_numpy(dtype=np.float64))
+
+    def summary(self):
+        """
+        Summary bands of the ensemble
+        :return: dict with
+            - "mean", "std": dataframes of the mean and (sample) standard deviation of every time step
+            - "quantiles": dict {quantile: dataframe of the quantile of every time step}
+            - "peaks": dataframe of the peak of every column (columns) in every realisation (rows)
+            - "realisations": number of realisations
+        """
+        if self.count == 0:
+            raise ValueError("No realisation was added yet")
+
+        def to_dataframe(values):
+            return pd.DataFrame(
+                values.reshape(self.mean.shape), index=self.index, columns=self.columns
+            )
+
+        standard_deviation = (
+            np.sqrt(self.squared_deviations / (self.count - 1))
+            if self.count > 1
+            else np.full(self.mean.shape, np.nan)
+        )
+        # Quantiles are estimated independently and may cross with few realisations, sorting the estimates of every
+        # element keeps the bands ordered and does not increase their error
+        estimators = sorted(
+            self.quantile_estimators, key=lambda estimator: estimator.quantile
+        )
+        quantile_estimates = np.sort(
+            [estimator.estimate() for estimator in estimators], axis=0
+        )
+        peaks = pd.DataFrame(self.peaks, columns=self.columns)
+        peaks.index.name = "realisation"
+        return {
+            "mean": to_dataframe(self.mean),
+            "std": to_dataframe(standard_deviation),
+            "quantiles": {
+                estimator.quantile: to_dataframe(estimates)
+                for estimator, estimates in zip(estimators, quantile_estimates)
+            },
+            "peaks": peaks,
+            "realisations": self.count,
+        }
+
+
+def simulate_realisation(ramp_control, input_data_dict, admin_input):
+    """
+    Simulate one realisation of an ensemble, e.g. in a worker process
+    :param ramp_control: RampControl of the realisation, see RampControl.realisation
+    :param input_data_dict:
+    :param admin_input:
+    :return: (mean, max) dataframes of run_opti_mg_dat
+    """
+    return ramp_control.run_opti_mg_dat(input_data_dict, admin_input)
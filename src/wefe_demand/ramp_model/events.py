@@ -0,0 +1,391 @@
+"""
+Event lists (sparse representation) of load profiles
+
+Most minutes of the load profiles of water and agro-processing demands are zero: drinking water is drawn in 1-minute
+peaks, machines run a few times a day. Instead of 1440 values per day, such profiles are stored as the list of their
+events, the runs of consecutive minutes of constant, non-zero load:
+- profile: position of the daylong profile (e.g. the day of the timeframe)
+- start: first minute of the day of the event
+- duration: number of minutes of the event
+- power: load during every minute of the event
+
+Event lists are lossless: profile_events extracts the events of daylong profiles, events_to_profiles draws them
+again. The load of a minute is the sum of the powers of all events covering it, so the profiles of several work units
+are added by concatenating their events. fold_events computes the sum and max of the time steps of any resolution
+directly from the events: its cost grows with the number of events and time steps they cover, not with the number of
+minutes of the timeframe.
+
+In sparse mode (see RampControl's sparse), work units return the event lists of their profiles and run_use_cases
+collects them in EventProfiles instead of 1-minute buffers of the whole timeframe.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from wefe_demand.ramp_model.resampling import (
+    check_resolution,
+    column_index,
+    profiles_to_dataframe,
+    resampled_dataframes,
+)
+
+# Events of daylong load profiles, one entry per event (see module docstring)
+LoadEvents = namedtuple("LoadEvents", ["profile", "start", "duration", "power"])
+
+
+def empty_events(dtype=np.float64):
+    """
+    :param dtype: floating point type of the powers
+    :return: LoadEvents without event
+    """
+    return LoadEvents(
+        profile=np.zeros(0, dtype=np.int32),
+        start=np.zeros(0, dtype=np.int16),
+        duration=np.zeros(0, dtype=np.int16),
+        power=np.zeros(0, dtype=dtype),
+    )
+
+
+def concatenate_events(events_list, dtype=np.float64):
+    """
+    Concatenate event lists of the same profiles, i.e. add their loads
+    :param events_list: list of LoadEvents
+    :param dtype: floating point type of the powers if events_list is empty
+    :return: LoadEvents
+    """
+    if not events_list:
+        return empty_events(dtype)
+    return LoadEvents(*(np.concatenate(field) for field in zip(*events_list)))
+
+
+def profile_events(profiles):
+    """
+    Events of daylong load profiles
+    :param profiles: 2D numpy array [profile, min_of_day]
+    :return: LoadEvents sorted by profile and start, the events of a profile do not overlap
+    """
+    flat_profiles = np.ascontiguousarray(profiles).reshape(-1)
+    # An event starts at every change of load and at the first minute of every profile
+    changes = np.empty(flat_profiles.size, dtype=bool)
+    changes[:1] = True
+    np.not_equal(flat_profiles[1:], flat_profiles[:-1], out=changes[1:])
+    changes[::1440] = True
+    starts = np.flatnonzero(changes)
+    durations = np.diff(starts, append=flat_profiles.size)
+    powers = flat_profiles[starts]
+    # Runs of zero load are no events
+    loaded = powers != 0
+    starts, durations, powers = starts[loaded], durations[loaded], powers[loaded]
+    return LoadEvents(
+        profile=(starts // 1440).astype(np.int32),
+        start=(starts % 1440).astype(np.int16),
+        duration=durations.astype(np.int16),
+        power=powers,
+    )
+
+
+def event_minutes(events):
+    """
+    Position of every minute of every event in the flattened profiles [profile * 1440 + min_of_day]
+    :param events: LoadEvents
+    :return: 1D numpy array, the minutes of the first event followed by the minutes of the second event, ...
+    """
+    durations = events.duration.astype(np.int64)
+    # Minute of every minute of the events since the start of its event
+    event_offsets = np.arange(durations.sum()) - np.repeat(
+        np.cumsum(durations) - durations, durations
+    )
+    return (
+        np.repeat(
+            events.profile.astype(np.int64) * 1440 + events.start.astype(np.int64),
+            durations,
+        )
+        + event_offsets
+    )
+
+
+def events_to_profiles(events, num_profiles, dtype=np.float64):
+    """
+    Draw the daylong load profiles of an event list
+    :param events: LoadEvents
+    :param num_profiles: number of profiles, all events must belong to profiles below num_profiles
+    :param dtype: floating point type of the profiles
+    :return: 2D numpy array [profile, min_of_day]
+    """
+    # The load of every minute is the sum of the powers of all events covering it
+    profiles = np.bincount(
+        event_minutes(events),
+        weights=np.repeat(events.power, events.duration.astype(np.int64)),
+        minlength=num_profiles * 1440,
+    )
+    return profiles.reshape(num_profiles, 1440).astype(dtype, copy=False)
+
+
+def disjoint_events(events):
+    """
+    Event list of the same load profiles without overlapping events
+    - profiles with overlapping events (e.g. concatenated events of several user types) are drawn and their events
+      extracted again
+    :param events: LoadEvents
+    :return: LoadEvents sorted by profile and start
+    """
+    order = np.lexsort((events.start, events.profile))
+    events = LoadEvents(*(field[order] for field in events))
+    starts = events.profile.astype(np.int64) * 1440 + events.start
+    ends = starts + events.duration
+    # An event overlaps a previous event of its profile if it starts before the latest end so far
+    overlapping = np.zeros(len(starts), dtype=bool)
+    overlapping[1:] = starts[1:] < np.maximum.accumulate(ends)[:-1]
+    if not overlapping.any():
+        return events
+
+    overlapped_profiles = np.unique(events.profile[overlapping])
+    in_overlapped = np.isin(events.profile, overlapped_profiles)
+    overlapped_events = LoadEvents(*(field[in_overlapped] for field in events))
+    redrawn_events = profile_events(
+        events_to_profiles(
+            overlapped_events._replace(
+                profile=np.searchsorted(overlapped_profiles, overlapped_events.profile)
+            ),
+            len(overlapped_profiles),
+            dtype=events.power.dtype,
+        )
+    )
+    redrawn_events = redrawn_events._replace(
+        profile=overlapped_profiles[redrawn_events.profile]
+    )
+    kept_events = LoadEvents(*(field[~in_overlapped] for field in events))
+    merged_events = concatenate_events([kept_events, redrawn_events])
+    order = np.lexsort((merged_events.start, merged_events.profile))
+    return LoadEvents(*(field[order] for field in merged_events))
+
+
+def fold_events(events, num_profiles, resolution, dtype=np.float64):
+    """
+    Fold the events of daylong profiles into time steps of resolution minutes, without drawing the profiles
+    - same result as resampling.fold_day_profiles of events_to_profiles, up to floating point rounding
+    :param events: LoadEvents
+    :param num_profiles: number of profiles
+    :param resolution: length of the time steps in minutes, must divide 1440
+    :param dtype: floating point type of the folded profiles
+    :return: dict with 2D numpy arrays [profile, step_of_day] of the "sum" and "max" of every time step
+    """
+    check_resolution(resolution)
+    steps_per_day = 1440 // resolution
+    events = disjoint_events(events)
+    starts = events.start.astype(np.int64)
+    ends = starts + events.duration
+    first_steps = starts // resolution
+    step_counts = (ends - 1) // resolution - first_steps + 1
+
+    # One entry per time step covered by every event
+    step_events = np.repeat(np.arange(len(starts)), step_counts)
+    steps = np.repeat(first_steps, step_counts) + (
+        np.arange(step_counts.sum())
+        - np.repeat(np.cumsum(step_counts) - step_counts, step_counts)
+    )
+    # Number of minutes of the time step covered by the event
+    overlaps = np.minimum(ends[step_events], (steps + 1) * resolution) - np.maximum(
+        starts[step_events], steps * resolution
+    )
+    positions = events.profile[step_events].astype(np.int64) * steps_per_day + steps
+    powers = events.power[step_events]
+
+    size = num_profiles * steps_per_day
+    sums = np.bincount(positions, weights=powers * overlaps, minlength=size)
+    # Events do not overlap: the max of a time step is the largest power of its events, or 0 if some of its minutes
+    # have no event
+    maxima = np.full(size, -np.inf)
+    np.maximum.at(maxima, positions, powers)
+    covered_minutes = np.bincount(positions, weights=overlaps, minlength=size)
+    maxima = np.where(covered_minutes < resolution, np.maximum(maxima, 0), maxima)
+    return {
+        "sum": sums.reshape(num_profiles, steps_per_day).astype(dtype),
+        "max": maxima.reshape(num_profiles, steps_per_day).astype(dtype),
+    }
+
+
+class EventProfiles:
+    """
+    Load profiles [column, day, min_of_day] of a timeframe stored as event lists, see LoadEvents
+    """
+
+    def __init__(self, columns, start_date, number_of_days, dtype=np.float64):
+        """
+        :param columns: column of every profile, see RampControl.profile_column
+        :param start_date: first day of the timeframe
+        :param number_of_days: number of days of the timeframe
+        :param dtype: floating point type of the profiles
+        """
+        self.columns = list(columns)
+        self.start_date = start_date
+        self.number_of_days = number_of_days
+        self.dtype = np.dtype(dtype)
+        # Event lists added to every column, merged into one event list by events()
+        self._events = {column: [] for column in self.columns}
+
+    def __len__(self):
+        return self.number_of_days * 1440
+
+    @property
+    def nbytes(self):
+        """
+        Memory of the event lists in bytes
+        :return:
+        """
+        return sum(
+            field.nbytes
+            for events_list in self._events.values()
+            for events in events_list
+            for field in events
+        )
+
+    def add(self, column, events, day_indexes=None):
+        """
+        Add events to the profiles of a column
+        :param column: one of columns
+        :param events: LoadEvents
+        :param day_indexes: position in the timeframe of the days the profiles of events belong to. If None, the
+            profiles of events are the days of the timeframe
+        :return:
+        """
+        if day_indexes is not None:
+            events = events._replace(
+                profile=np.asarray(day_indexes, dtype=np.int32)[events.profile]
+            )
+        self._events[column].append(events)
+
+    def events(self, column):
+        """
+        Event list of a column
+        :param column: one of columns
+        :return: LoadEvents without overlapping events, profile is the day of the timeframe
+        """
+        if len(self._events[column]) != 1:
+            # Merge the added event lists once
+            self._events[column] = [
+                disjoint_events(concatenate_events(self._events[column], self.dtype))
+            ]
+        return self._events[column][0]
+
+    def to_dataframe(self, first_day=0, last_day=None):
+        """
+        Dataframe of 1-minute profiles drawn from the events
+        :param first_day: position of the first day in the timeframe
+        :param last_day: position of the day after the last day, None for the end of the timeframe
+        :return: dataframe with one column per profile, like RampControl.run_use_cases without sparse
+        """
+        if last_day is None:
+            last_day = self.number_of_days
+        profiles_buffer = np.zeros(
+            (len(self.columns), last_day - first_day, 1440), dtype=self.dtype
+        )
+        for column_idx, column in enumerate(self.columns):
+            events = self.events(column)
+            in_days = (events.profile >= first_day) & (events.profile < last_day)
+            events = LoadEvents(*(field[in_days] for field in events))
+            profiles_buffer[column_idx] = events_to_profiles(
+                events._replace(profile=events.profile - first_day),
+                last_day - first_day,
+                dtype=self.dtype,
+            )
+        index = pd.date_range(
+            pd.Timestamp(self.start_date) + pd.Timedelta(days=first_day),
+            periods=(last_day - first_day) * 1440,
+            freq="min",
+        )
+        return profiles_to_dataframe(profiles_buffer, self.columns, index)
+
+    def fold(self, resolution):
+        """
+        Fold the events of every column like resampling.fold_day_profiles, see fold_events
+        """
+        folded_profiles = {
+            stat: np.zeros(
+                (len(self.columns), self.number_of_days, 1440 // resolution),
+                dtype=self.dtype,
+            )
+            for stat in ("sum", "max")
+        }
+        for column_idx, column in enumerate(self.columns):
+            for stat, profiles in fold_events(
+                self.events(column), self.number_of_days, resolution, self.dtype
+            ).items():
+                folded_profiles[stat][column_idx] = profiles
+        return folded_profiles
+
+    def resample(self, resolution):
+        """
+        "sum", "mean" and "max" dataframes of the profiles, see fold and resampling.resampled_dataframes
+        """
+        return resampled_dataframes(
+            self.fold(resolution),
+            self.columns,
+            self.start_date,
+            resolution,
+            self.dtype,
+        )
+
+    def to_table(self):
+        """
+        Table of all events, e.g. to store the 1-minute profiles without loss
+        :return: dataframe with one row per event and the columns "column", "datetime" (start of the event),
+            "duration" (minutes) and "power"
+        """
+        tables = []
+        for column in self.columns:
+            events = self.events(column)
+            tables.append(
+                pd.DataFrame(
+                    {
+                        "column": pd.Series([column] * len(events.power), dtype=object),
+                        "datetime": pd.Timestamp(self.start_date)
+                        + pd.to_timedelta(
+                            events.profile.astype(np.int64) * 1440 + events.start,
+                            unit="min",
+                        ),
+                        "duration": events.duration,
+                        "power": events.power,
+                    }
+                )
+            )
+        return pd.concat(tables, ignore_index=True)
+
+    @classmethod
+    def from_table(cls, table, start_date, number_of_days, dtype=np.float64):
+        """
+        Event profiles of a table returned by to_table
+        :param table: dataframe of events
+        :param start_date: first day of the timeframe
+        :param number_of_days: number of days of the timeframe
+        :param dtype: floating point type of the profiles
+        :return: EventProfiles
+        """
+        event_profiles = cls(
+            column_index(list(dict.fromkeys(table["column"]))),
+            start_date,
+            number_of_days,
+            dtype=dtype,
+        )
+        minutes = (
+            (pd.DatetimeIndex(table["datetime"]) - pd.Timestamp(start_date))
+            // pd.Timedelta(minutes=1)
+        ).to_numpy()
+        # Position of the column of every event in columns
+        column_codes = pd.Index(
+            event_profiles.columns, tupleize_cols=False
+        ).get_indexer(pd.Index(table["column"].to_numpy(), tupleize_cols=False))
+        for column_idx, column in enumerate(event_profiles.columns):
+            in_column = column_codes == column_idx
+            event_profiles.add(
+                column,
+                LoadEvents(
+                    profile=(minutes[in_column] // 1440).astype(np.int32),
+                    start=(minutes[in_column] % 1440).astype(np.int16),
+                    duration=table["duration"].to_numpy()[in_column].astype(np.int16),
+                    power=table["power"].to_numpy(dtype=dtype)[in_column],
+                ),
+            )
+        return event_profiles
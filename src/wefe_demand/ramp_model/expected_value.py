@@ -0,0 +1,190 @@
+"""
+Analytical expected value of RAMP load profiles
+
+Instead of sampling switch-on events, the expected power of every minute of the day is computed from the parameters
+given to ramp.User.add_appliance:
+- the probability of every minute to lie inside the randomised usage windows (window_1-3, random_var_w)
+- the expected daily usage time (func_time, func_cycle), spread uniformly over these windows
+- the mean power of a switch-on event (power or duty cycle p_11/t_11, p_12/t_12)
+- the expected number of coincident switch-ons (number, fixed) inside and outside the peak time range
+- the days the appliance is used on (wd_we_type, occasional_use)
+
+This is a first-order approximation of RAMP's sampling algorithm: switch-on events are assumed to be spread uniformly
+over the available minutes of the randomised windows, and the random peak time range is replaced by its expected
+position and width.
+"""
+
+import math
+
+import numpy as np
+
+# RAMP calibration parameters of coincident switch-ons, see ramp.core.utils.switch_on_parameters
+MU_PEAK = 0.5
+S_PEAK = 0.5
+OP_FACTOR = 0.5
+
+
+def expected_peak_time_range(use_case):
+    """
+    Expected value of ramp.UseCase.calc_peak_time_range
+    - the peak time is the centre of the peak window of the use case's theoretical maximum profile
+    - it is enlarged by the expected absolute deviation of RAMP's gaussian enlargement
+    :param use_case: ramp.UseCase
+    :return: numpy array of the minutes of the peak time range
+    """
+    tot_max_profile = np.zeros(1440)
+    for user in use_case.users:
+        tot_max_profile = tot_max_profile + user.maximum_profile
+    peak_window = np.flatnonzero(tot_max_profile == np.amax(tot_max_profile))
+    peak_time = round(np.average(peak_window))
+    # E[|X - peak_time|] of X ~ N(peak_time, peak_enlarge * peak_time)
+    peak_enlarge = max(
+        round(use_case.peak_enlarge * peak_time * math.sqrt(2 / math.pi)), 1
+    )
+    return np.arange(peak_time - peak_enlarge, peak_time + peak_enlarge)
+
+
+def window_probability(window, random_var):
+    """
+    Probability of every minute of the day to lie inside a randomised usage window
+    - RAMP draws the start and end of the window uniformly within +/- random_var minutes
+    :param window: [start, end] of the window in minutes
+    :param random_var: maximal random shift of start and end in minutes
+    :return: numpy array with 1440 probabilities
+    """
+    minutes = np.arange(1440)
+    start, end = int(window[0]), int(window[1])
+    if start == end:
+        return np.zeros(1440)
+    width = 2 * random_var + 1
+    # P(randomised start <= minute) * P(randomised end > minute)
+    p_started = np.clip((minutes - (start - random_var) + 1) / width, 0, 1)
+    p_not_ended = np.clip(((end + random_var) - minutes) / width, 0, 1)
+    return p_started * p_not_ended
+
+
+def expected_coincidence(appliance, inside_peak_window):
+    """
+    Expected number of the appliance's copies switched on together, see ramp.Appliance.calc_coincident_switch_on
+    :param appliance: ramp.Appliance
+    :param inside_peak_window: True for switch-on events within the peak time range
+    :return:
+    """
+    number = appliance.number
+    if appliance.fixed != "no" or number <= 1:
+        return number
+
+    if inside_peak_window:
+        # min(number, max(1, ceil(X))) with X ~ N(number * MU_PEAK, S_PEAK * number * MU_PEAK)
+        mean = number * MU_PEAK
+        sigma = S_PEAK * number * MU_PEAK
+        # E[c] = sum over k of P(c >= k) = 1 + sum_{k=2..number} P(X > k - 1)
+        return 1 + sum(
+            0.5 * math.erfc((k - 1 - mean) / (sigma * math.sqrt(2)))
+            for k in range(2, number + 1)
+        )
+
+    # floor(U) + 1 with U ~ U(0, number - OP_FACTOR)
+    upper = number - OP_FACTOR
+    return 1 + sum((upper - k) / upper for k in range(1, int(upper) + 1))
+
+
+def duration_distribution(duration, random_var):
+    """
+    Distribution of a randomised duty cycle duration int(duration * U(1 - random_var, 1 + random_var))
+    :param duration: duration of the duty cycle part in minutes
+    :param random_var: random variability of the duration
+    :return: numpy arrays of the possible durations and of their probabilities
+    """
+    if duration == 0 or random_var == 0:
+        return np.array([int(duration)]), np.array([1.0])
+    low, high = duration * (1 - random_var), duration * (1 + random_var)
+    durations = np.arange(int(np.floor(low)), int(np.floor(high)) + 1)
+    # Share of [low, high] for which int(duration * u) equals each possible duration
+    probabilities = (np.minimum(durations + 1, high) - np.maximum(durations, low)) / (
+        high - low
+    )
+    return durations, probabilities
+
+
+def expected_event_power(appliance):
+    """
+    Mean power drawn during a switch-on event of one copy of the appliance
+    - appliances with duty cycles repeat their first duty cycle during the whole event, RAMP randomises the
+      duration of both parts of the cycle (r_c1) and draws no power if both are rounded down to 0
+    :param appliance: ramp.Appliance
+    :return:
+    """
+    if appliance.fixed_cycle > 0:
+        durations_1, probabilities_1 = duration_distribution(
+            appliance.t_11, appliance.r_c1
+        )
+        durations_2, probabilities_2 = duration_distribution(
+            appliance.t_12, appliance.r_c1
+        )
+        # Mean power of the cycle for every combination of durations of its two parts
+        t_1, t_2 = np.meshgrid(durations_1, durations_2, indexing="ij")
+        cycle_duration = t_1 + t_2
+        cycle_power = np.divide(
+            appliance.p_11 * t_1 + appliance.p_12 * t_2,
+            cycle_duration,
+            out=np.zeros(cycle_duration.shape),
+            where=cycle_duration > 0,
+        )
+        return float(np.sum(cycle_power * np.outer(probabilities_1, probabilities_2)))
+    return float(np.mean(appliance.power))
+
+
+def expected_daily_profile(appliance, peak_time_range, day_type):
+    """
+    Expected 1-minute load profile of one user's appliance on a day of the given type
+    :param appliance: ramp.Appliance
+    :param peak_time_range: peak time range of the use case, see expected_peak_time_range
+    :param day_type: 0->working day, 1->holiday
+    :return: numpy array with 1440 values
+    """
+    if appliance.func_time == 0 or appliance.wd_we_type not in [day_type, 2]:
+        return np.zeros(1440)
+
+    # Probability of every minute to be available for switch-on events
+    window_probabilities = np.clip(
+        sum(
+            window_probability(
+                getattr(appliance, f"window_{i}"),
+                getattr(appliance, f"random_var_{i}"),
+            )
+            for i in range(1, 4)
+        ),
+        0,
+        1,
+    )
+    available_time = window_probabilities.sum()
+    if available_time == 0:
+        return np.zeros(1440)
+
+    if appliance.flat == "yes":
+        # Flat appliances are switched on with all copies during their whole windows
+        return (
+            window_probabilities
+            * float(np.mean(appliance.power))
+            * appliance.number
+            * appliance.occasional_use
+        )
+
+    # Expected usage time: func_time (symmetric random variation), at least func_cycle, at most 99% of the windows
+    usage_time = min(
+        max(appliance.func_time, appliance.func_cycle), 0.99 * available_time
+    )
+    on_probabilities = np.minimum(usage_time * window_probabilities / available_time, 1)
+
+    # Expected number of coincident switch-ons inside and outside the peak time range
+    coincidence = np.full(1440, expected_coincidence(appliance, False))
+    peak_minutes = peak_time_range[(peak_time_range >= 0) & (peak_time_range < 1440)]
+    coincidence[peak_minutes] = expected_coincidence(appliance, True)
+
+    return (
+        on_probabilities
+        * coincidence
+        * expected_event_power(appliance)
+        * appliance.occasional_use
+    )
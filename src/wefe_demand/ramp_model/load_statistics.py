@@ -0,0 +1,197 @@
+"""
+Online sizing statistics of the 1-minute load profiles of a demand
+
+RampControl.run_use_cases adds the 1-minute profile of every work unit (all users and appliances of one user type
+during a group of months) to a LoadStatistics while merging the work units. The aggregate load of a day (sum of all
+user types) is complete once all work units of the day are added: it is then folded into the statistics and
+dropped, so only the days of the work units being merged are kept in memory, whatever the output resolution or
+level of detail:
+- exact 1-minute peak of the aggregate load and its time, energy (sum of the 1-minute values) and load factor
+- exact 1-minute peak and energy of every user type, coincidence factor of the user types (aggregate peak / sum of
+  the peaks of the user types) and its inverse, the diversity factor. The users of a user type are summed by the
+  engines before their profiles are returned, the peak of a single user is not known: this factor is the
+  coincidence between user types, not the usual coincidence between all users (aggregate peak / sum of the peaks
+  of every user), which it bounds from above since the peak of a user type is at most the sum of the peaks of its
+  users
+- load duration curve of the aggregate load from a histogram of its 1-minute values. The histogram has a fixed
+  number of bins of equal width, its range is doubled (merging pairs of bins) whenever a load exceeds it, so the
+  width of the bins is at most 2 * peak / HISTOGRAM_BINS
+"""
+
+import numpy as np
+import pandas as pd
+
+# Number of bins of the histogram of the aggregate load
+HISTOGRAM_BINS = 1024
+
+
+class LoadStatistics:
+    """
+    Accumulator of the statistics of the aggregate and user type loads of a demand over a timeframe
+    """
+
+    def __init__(
+        self, start_date, number_of_days, unit_day_indexes, bins=HISTOGRAM_BINS
+    ):
+        """
+        :param start_date: first day of the timeframe
+        :param number_of_days: number of days of the timeframe
+        :param unit_day_indexes: position in the timeframe of the days of every work unit that will be added. A day
+            is folded into the statistics once all its work units are added, days without work unit have no load
+        :param bins: number of bins of the histogram of the aggregate load, must be even
+        """
+        if bins < 2 or bins % 2 != 0:
+            raise ValueError(f"The histogram needs an even number of bins, got {bins}")
+        self.start_date = start_date
+        self.number_of_days = number_of_days
+        # Number of work units still to be added to every day
+        self.pending_units = np.zeros(number_of_days, dtype=np.int64)
+        for day_indexes in unit_day_indexes:
+            np.add.at(self.pending_units, day_indexes, 1)
+        # Aggregate load of the days with pending work units {day_of_timeframe: 1D numpy array [min_of_day]}
+        self.pending_days = {}
+        # Number of days in the histogram
+        self.folded_days = 0
+        self.energy = 0.0
+        self.peak = 0.0
+        # Position of the peak in the timeframe [day_of_timeframe * 1440 + min_of_day]
+        self.peak_minute = None
+        # Number of minutes of every bin of the histogram [0, upper_load), bin k holds loads in
+        # [k * upper_load / bins, (k + 1) * upper_load / bins)
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.upper_load = None
+        self.user_peaks = {}
+        self.user_energy = {}
+
+    def add(self, user_name, day_indexes, profiles):
+        """
+        Add the load of a work unit
+        :param user_name: user type of the work unit
+        :param day_indexes: position in the timeframe of the days of the work unit
+        :param profiles: 2D numpy array [day_of_unit, min_of_day] of the load of all users and appliances of the
+            work unit, None if the work unit has no load
+        :return:
+        """
+        day_indexes = np.asarray(day_indexes)
+        self.user_peaks.setdefault(user_name, 0.0)
+        self.user_energy.setdefault(user_name, 0.0)
+        if profiles is not None and profiles.size > 0:
+            # Days of a user type are simulated by a single work unit: its peak is the user type's peak on these days
+            self.user_peaks[user_name] = max(
+                self.user_peaks[user_name], float(profiles.max())
+            )
+            self.user_energy[user_name] += float(profiles.sum(dtype=np.float64))
+            for day_idx, day_profile in zip(day_indexes, profiles):
+                if day_idx in self.pending_days:
+                    self.pending_days[day_idx] += day_profile
+                else:
+                    self.pending_days[day_idx] = day_profile.astype(np.float64)
+
+        self.pending_units[day_indexes] -= 1
+        # Days without load of any work unit are not kept, their minutes are added to the first bin of the histogram
+        completed_days = [
+            day_idx
+            for day_idx in day_indexes
+            if self.pending_units[day_idx] == 0 and day_idx in self.pending_days
+        ]
+        if completed_days:
+            self.fold_days(
+                completed_days,
+                [self.pending_days.pop(day_idx) for day_idx in completed_days],
+            )
+
+    def fold_days(self, day_indexes, day_profiles):
+        """
+        Fold complete days into the statistics of the aggregate load
+        :param day_indexes: position in the timeframe of the days of the profiles
+        :param day_profiles: list of 1D numpy arrays [min_of_day] of the aggregate load of every day
+        :return:
+        """
+        self.folded_days += len(day_indexes)
+        loads = np.stack(day_profiles)
+        self.energy += float(loads.sum())
+        peak_position = int(loads.argmax())
+        if self.peak_minute is None or loads.flat[peak_position] > self.peak:
+            self.peak = float(loads.flat[peak_position])
+            self.peak_minute = (
+                int(day_indexes[peak_position // 1440]) * 1440 + peak_position % 1440
+            )
+
+        bins = len(self.histogram)
+        if self.upper_load is None:
+            # Smallest power of two above the first loads
+            self.upper_load = 2.0 ** np.ceil(np.log2(max(self.peak, 1e-3) * 1.001))
+        while self.peak >= self.upper_load:
+            # Double the range of the histogram, pairs of bins are merged into the lower half
+            self.histogram[: bins // 2] = self.histogram.reshape(-1, 2).sum(axis=1)
+            self.histogram[bins // 2 :] = 0
+            self.upper_load *= 2
+        self.histogram += np.bincount(
+            np.minimum(
+                (loads.ravel() * (bins / self.upper_load)).astype(np.int64), bins - 1
+            ),
+            minlength=bins,
+        )
+
+    def load_duration_curve(self):
+        """
+        Load duration curve of the aggregate load
+        :return: pd.Series of the number of minutes the load is at or above the lower edge of every bin of the
+            histogram (index "load"), from 0 to the bin of the peak
+        """
+        histogram = self.histogram.copy()
+        # Minutes of days without load
+        histogram[0] += (self.number_of_days - self.folded_days) * 1440
+        last_bin = int(np.flatnonzero(histogram).max()) if histogram.any() else 0
+        bin_width = 0.0 if self.upper_load is None else self.upper_load / len(histogram)
+        return pd.Series(
+            np.cumsum(histogram[last_bin::-1])[::-1],
+            index=pd.Index(np.arange(last_bin + 1) * bin_width, name="load"),
+            name="minutes",
+        )
+
+    def summary(self):
+        """
+        Statistics of the demand, all work units must have been added
+        :return: dict with
+            - "peak": 1-minute peak of the aggregate load, "peak_time": its timestamp (None without load)
+            - "energy": sum of the 1-minute values of the aggregate load (e.g. Wmin for powers in W, l for flows in
+              l/min), "mean": mean aggregate load
+            - "load_factor": mean / peak of the aggregate load
+            - "coincidence_factor": peak of the aggregate load / sum of the peaks of the user types (not of every
+              user, see module docstring), "diversity_factor": its inverse
+            - "users": dataframe of the "peak", "energy" and "load_factor" of every user type
+            - "load_duration_curve": see load_duration_curve
+        """
+        if (self.pending_units > 0).any():
+            raise ValueError("Not all work units of the timeframe were added")
+        minutes = self.number_of_days * 1440
+        mean = self.energy / minutes
+        users = pd.DataFrame(
+            {
+                "peak": pd.Series(self.user_peaks, dtype=np.float64),
+                "energy": pd.Series(self.user_energy, dtype=np.float64),
+            }
+        )
+        users.index.name = "user_type"
+        with np.errstate(divide="ignore", invalid="ignore"):
+            users["load_factor"] = users["energy"] / minutes / users["peak"]
+        sum_user_peaks = float(users["peak"].sum())
+        return {
+            "peak": self.peak,
+            "peak_time": (
+                None
+                if self.peak_minute is None
+                else pd.Timestamp(self.start_date)
+                + pd.Timedelta(minutes=self.peak_minute)
+            ),
+            "energy": self.energy,
+            "mean": mean,
+            "load_factor": mean / self.peak if self.peak > 0 else np.nan,
+            "coincidence_factor": (
+                self.peak / sum_user_peaks if sum_user_peaks > 0 else np.nan
+            ),
+            "diversity_factor": sum_user_peaks / self.peak if self.peak > 0 else np.nan,
+            "users": users,
+            "load_duration_curve": self.load_duration_curve(),
+        }
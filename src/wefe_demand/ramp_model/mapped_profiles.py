@@ -0,0 +1,231 @@
+"""
+1-minute load profiles of a whole timeframe stored in memory-mapped files
+
+For long timeframes and many users, the 1-minute profiles of all columns of a demand do not fit in memory (e.g. 10
+years of 1440 steps per day are 42 MB per column in float64). In out-of-core mode (see RampControl's working_dir),
+run_use_cases accumulates them in a .npy file [column, day, min_of_day] instead of a numpy array.
+
+The file is never mapped into memory as a whole for longer than one operation: the pages of a mapping that were
+read or written count as resident memory of the process until it is closed. Work units (at most one month of days)
+are added through a mapping of their days only, the profiles are folded chunk of days by chunk of days through a
+mapping closed after every chunk. Memory then grows with the work units and the chunks, not with the timeframe.
+Dataframes and DataArrays returned by MappedProfiles are built upon a mapping and only read the parts of the file
+that are accessed. The file is kept until MappedProfiles.remove is called.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from wefe_demand.ramp_model.resampling import (
+    fold_day_profiles,
+    profiles_to_dataframe,
+    resampled_dataframes,
+)
+
+# Number of days of the chunks the profiles are streamed in by default (about 10 MB per column in float64)
+CHUNK_DAYS = 30
+
+
+class MappedProfiles:
+    """
+    1-minute load profiles [column, day, min_of_day] of a timeframe in a memory-mapped .npy file
+    """
+
+    def __init__(
+        self,
+        working_dir,
+        columns,
+        start_date,
+        number_of_days,
+        dtype=np.float64,
+        prefix="profiles_",
+    ):
+        """
+        Create a new file of zeros in working_dir
+        :param working_dir: directory of the file, created if it does not exist
+        :param columns: column of every profile, see RampControl.profile_column
+        :param start_date: first day of the timeframe
+        :param number_of_days: number of days of the timeframe
+        :param dtype: floating point type of the profiles
+        :param prefix: prefix of the file name, the file names of a working directory are unique
+        """
+        os.makedirs(working_dir, exist_ok=True)
+        file_descriptor, self.path = tempfile.mkstemp(
+            dir=working_dir, prefix=prefix, suffix=".npy"
+        )
+        os.close(file_descriptor)
+        self.columns = list(columns)
+        self.column_idxs = {
+            column: column_idx for column_idx, column in enumerate(columns)
+        }
+        self.start_date = start_date
+        self.number_of_days = number_of_days
+        self.dtype = np.dtype(dtype)
+        profiles = np.lib.format.open_memmap(
+            self.path,
+            mode="w+",
+            dtype=self.dtype,
+            shape=(len(self.columns), number_of_days, 1440),
+        )
+        # Position of the profiles after the header of the .npy file
+        self.offset = profiles.offset
+        del profiles
+
+    def __len__(self):
+        return self.number_of_days * 1440
+
+    def day_chunks(self, chunk_days=CHUNK_DAYS):
+        """
+        Split the timeframe in chunks of days
+        :param chunk_days: number of days per chunk (the last chunk may be shorter)
+        :return: list of (first_day, last_day + 1) tuples
+        """
+        return [
+            (first_day, min(first_day + chunk_days, self.number_of_days))
+            for first_day in range(0, self.number_of_days, chunk_days)
+        ]
+
+    def open(self, mode="r"):
+        """
+        Map the whole file into memory, the profiles are only read when accessed
+        - the accessed pages stay resident until the returned memory map is deleted
+        :param mode: "r" to read the profiles, "r+" to change them
+        :return: 3D numpy memory map [column, day, min_of_day]
+        """
+        return np.memmap(
+            self.path,
+            dtype=self.dtype,
+            mode=mode,
+            offset=self.offset,
+            shape=(len(self.columns), self.number_of_days, 1440),
+        )
+
+    def add(self, column, day_indexes, profiles):
+        """
+        Add profiles to days of a column through a mapping of these days only
+        :param column: column of the profiles, one of self.columns
+        :param day_indexes: position in the timeframe of the days of the profiles, in chronological order
+        :param profiles: 2D numpy array [day, min_of_day]
+        :return:
+        """
+        day_indexes = np.asarray(day_indexes)
+        column_idx = self.column_idxs[column]
+        # Runs of consecutive days are contiguous in the file
+        runs = np.split(
+            np.arange(len(day_indexes)), np.flatnonzero(np.diff(day_indexes) != 1) + 1
+        )
+        for run in runs:
+            if run.size == 0:
+                continue
+            first_day = int(day_indexes[run[0]])
+            window = np.memmap(
+                self.path,
+                dtype=self.dtype,
+                mode="r+",
+                offset=self.offset
+                + (column_idx * self.number_of_days + first_day)
+                * 1440
+                * self.dtype.itemsize,
+                shape=(run.size, 1440),
+            )
+            window += profiles[run]
+            # Closing the mapping writes the days to the file and releases their pages
+            del window
+
+    def to_dataframe(self, first_day=0, last_day=None):
+        """
+        Dataframe of 1-minute profiles upon the memory-mapped file, the profiles are only read when accessed
+        :param first_day: position of the first day in the timeframe
+        :param last_day: position of the day after the last day, None for the end of the timeframe
+        :return: dataframe with one column per profile, like RampControl.run_use_cases without working_dir
+        """
+        if last_day is None:
+            last_day = self.number_of_days
+        index = pd.date_range(
+            pd.Timestamp(self.start_date) + pd.Timedelta(days=first_day),
+            periods=(last_day - first_day) * 1440,
+            freq="min",
+        )
+        return profiles_to_dataframe(
+            self.open()[:, first_day:last_day], self.columns, index
+        )
+
+    def iter_dataframes(self, chunk_days=CHUNK_DAYS):
+        """
+        Dataframes of 1-minute profiles of consecutive chunks of days
+        :param chunk_days: number of days per dataframe
+        :return: generator of dataframes, see to_dataframe
+        """
+        for first_day, last_day in self.day_chunks(chunk_days):
+            yield self.to_dataframe(first_day, last_day)
+
+    def fold(self, resolution, chunk_days=CHUNK_DAYS):
+        """
+        Fold the profiles like resampling.fold_day_profiles, reading chunk_days days of the file at once
+        """
+        folded_profiles = {
+            stat: np.zeros(
+                (len(self.columns), self.number_of_days, 1440 // resolution),
+                dtype=self.dtype,
+            )
+            for stat in ("sum", "max")
+        }
+        for first_day, last_day in self.day_chunks(chunk_days):
+            # A new mapping for every chunk: the pages read are released once the chunk is folded
+            profiles = self.open()
+            for stat, chunk_profiles in fold_day_profiles(
+                profiles[:, first_day:last_day], resolution
+            ).items():
+                folded_profiles[stat][:, first_day:last_day] = chunk_profiles
+            del profiles
+        return folded_profiles
+
+    def resample(self, resolution, chunk_days=CHUNK_DAYS):
+        """
+        "sum", "mean" and "max" dataframes of the profiles, see fold and resampling.resampled_dataframes
+        """
+        return resampled_dataframes(
+            self.fold(resolution, chunk_days),
+            self.columns,
+            self.start_date,
+            resolution,
+            self.dtype,
+        )
+
+    def to_xarray(self):
+        """
+        xarray DataArray [column, datetime] upon the memory-mapped file, the profiles are only read when accessed
+        - needs the optional dependency xarray
+        :return: xarray.DataArray
+        """
+        try:
+            import xarray as xr  # type: ignore
+        except ImportError as error:
+            raise ImportError(
+                "MappedProfiles.to_xarray needs xarray, install it with 'pip install xarray'"
+            ) from error
+        return xr.DataArray(
+            self.open().reshape(len(self.columns), len(self)),
+            dims=("column", "datetime"),
+            coords={
+                # Flat index, tuples [user, appliance] are kept as labels
+                "column": pd.Index(self.columns, tupleize_cols=False),
+                "datetime": pd.date_range(
+                    self.start_date, periods=len(self), freq="min"
+                ),
+            },
+        )
+
+    def remove(self):
+        """
+        Delete the file, the profiles cannot be accessed anymore
+        - dataframes returned by to_dataframe must not be used after removing the file
+        :return:
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
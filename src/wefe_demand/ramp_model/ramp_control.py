@@ -2,9 +2,68 @@ import ramp  # type: ignore
 import pandas as pd
 import numpy as np
 import copy
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from tqdm import tqdm  # type: ignore
 
 from wefe_demand.helpers.exceptions import MissingInput
+from wefe_demand.helpers.instrumentation import instrumented, span
+from wefe_demand.ramp_model.cache import appliance_parameters, engine_version
+from wefe_demand.ramp_model.calendar_index import CalendarIndex, working_days_bitmask
+from wefe_demand.ramp_model.events import EventProfiles, events_to_profiles
+from wefe_demand.ramp_model.ensemble import (
+    DEFAULT_QUANTILES,
+    EnsembleStatistics,
+    simulate_realisation,
+)
+from wefe_demand.ramp_model.load_statistics import LoadStatistics
+from wefe_demand.ramp_model.mapped_profiles import MappedProfiles
+from wefe_demand.ramp_model.resampling import (
+    check_resolution,
+    fold_day_profiles,
+    fold_minute_profiles,
+    group_day_means,
+    profiles_to_dataframe,
+    resampled_dataframes,
+    steps_timeseries,
+)
+from wefe_demand.ramp_model.expected_value import expected_peak_time_range
+from wefe_demand.ramp_model.simulation import (
+    ENGINES,
+    HEARTBEAT_INTERVAL,
+    WorkUnit,
+    check_cancelled,
+    derive_seed,
+    reseed_worker,
+    resolve_n_jobs,
+    run_work_units,
+    seed_random_state,
+    unit_profile_keys,
+    wait_result,
+)
+
+# Demands modeled in OptiMG DAT, in the order of the columns of run_opti_mg_dat's output
+DEMANDS = (
+    "electrical_appliances",
+    "agro_processing",
+    "cooking",
+    "drinking_water",
+    "service_water",
+)
+
+# Length in minutes of the time steps of run_opti_mg_dat's output if no output_resolution is given
+DEFAULT_OUTPUT_RESOLUTION = 60
+
+# Floating point types of the simulated load profiles
+DTYPES = (np.float64, np.float32)
+
+# Levels of detail of the simulated load profiles
+# - "appliance": one profile per user type and appliance
+# - "user": one profile per user type (sum of its appliances)
+# - "demand": one profile per demand (sum of all user types)
+DETAIL_LEVELS = ("appliance", "user", "demand")
 
 
 class RampControl:
@@ -12,173 +71,1105 @@ class RampControl:
     - !!
     """
 
-    def __init__(self, number_of_days, start_date):
+    def __init__(
+        self,
+        number_of_days,
+        start_date,
+        n_jobs=1,
+        seed=None,
+        output_resolution=None,
+        detail="appliance",
+        engine="ramp",
+        pool_size=None,
+        cache=None,
+        column_store=None,
+        parallel_demands=False,
+        dtype=np.float64,
+        working_dir=None,
+        sparse=False,
+        statistics=False,
+    ):
+        """
+        :param number_of_days: number of days to model load profiles for
+        :param start_date: first day of the modeled timeframe
+        :param n_jobs: number of worker processes used to simulate use cases. 1 (default) simulates serially in
+            the current process, -1 uses all CPU cores
+        :param seed: root seed of the simulation. If given, an independent random stream is derived for every
+            (demand, user type, month, user) and the results are identical whatever the value of n_jobs.
+            If None (default), results depend on the global random state
+        :param output_resolution: length of the time steps of run_opti_mg_dat's output in minutes (e.g. 60). If
+            given, simulated days are folded into mean/sum/max buffers of this resolution as soon as they are
+            generated and the 1-minute profiles of the whole timeframe are never materialised. If None (default),
+            the output is hourly (DEFAULT_OUTPUT_RESOLUTION)
+        :param detail: level of detail of the simulated profiles, one of DETAIL_LEVELS. "appliance" (default) keeps
+            one column per user type and appliance, "user" one column per user type and "demand" a single "total"
+            column per demand. Profiles are accumulated at the requested level while simulating, so coarser levels
+            need less memory. The max of a time step is the peak of the accumulated profile
+        :param engine: engine generating the load profiles, one of ENGINES. "ramp" (default) samples every user
+            and day with RAMP, "expected" computes the expected load profile analytically from the appliance
+            parameters (no random variation between days, users or runs). "vectorized" samples all users and days of a
+            user type and month at once with numpy, following RAMP's algorithm (same distribution of the profiles,
+            not the same draws; appliances with at most one duty cycle, see vectorized)
+        :param pool_size: if given, user types with more than pool_size users are not simulated user by user:
+            pool_size user-days per (user type, month, day type) are sampled with RAMP and each day's aggregate is
+            built by drawing num_users of them with replacement. Runtime then grows with pool_size instead of the
+            number of users, at the cost of a relative error of the order of 1 / sqrt(pool_size) on energy and
+            peak (see simulation.add_bootstrap_profiles). If None (default), every user is simulated
+        :param cache: cache.ResultCache storing the results of run_opti_mg_dat. Only reproducible results are cached,
+            i.e. if a seed is given or the "expected" engine is used. If None (default), nothing is cached
+        :param column_store: cache.ResultCache storing the simulated profile of every column (user type and
+            appliance, user type or demand, depending on detail) and month under a fingerprint of its inputs.
+            Columns whose fingerprint is found are reused, only changed columns are simulated again (e.g. after
+            editing one appliance of the input data). Like cache, only used for reproducible results. The same
+            ResultCache can be used as cache and column_store
+        :param parallel_demands: if True, run_opti_mg_dat generates and simulates the 5 demands concurrently, each
+            in its own worker process (in addition to the n_jobs worker processes of every demand). If False
+            (default), demands are run one after another
+        :param dtype: floating point type of the simulated profiles, one of DTYPES. It is used for the buffers of
+            run_use_cases, the profiles returned by the work units and the returned dataframes. np.float32 halves
+            the memory of the profiles. Sums over users, appliances, user types (detail "demand", also in
+            working_dir) and minutes are accumulated in float64 and rounded to dtype once, so every value keeps a
+            relative precision of about 1e-7 (default np.float64)
+        :param working_dir: if given, out-of-core mode: the 1-minute profiles of the whole timeframe are accumulated
+            in memory-mapped files in this directory instead of memory at every level of detail, see
+            mapped_profiles.MappedProfiles. Work units of one month are added to the files as soon as they are
+            merged and the files are resampled in chunks of days, so memory does not grow with the 1-minute
+            profiles of the timeframe. run_use_cases without resolution returns MappedProfiles instead of a 1-minute
+            dataframe. If None (default), profiles are kept in memory
+        :param sparse: if True, sparse mode: work units return the event lists of their profiles (runs of minutes of
+            constant, non-zero load, see events) and run_use_cases collects them in events.EventProfiles instead of
+            1-minute buffers of the timeframe. Events are folded exactly into the time steps of any resolution,
+            run_use_cases without resolution returns the EventProfiles. Memory and resampling then grow with the
+            number of events instead of the number of minutes: much less for demands with few, short events
+            (water, agro-processing, few users), more for profiles whose load changes almost every minute (many
+            users, "expected" engine). Cannot be combined with working_dir (default False)
+        :param statistics: if True, run_use_cases accumulates the sizing statistics of every demand from the exact
+            1-minute profiles while merging the work units: peak, energy, load factor and load duration curve of the
+            aggregate load, peak and energy of every user type and their coincidence factor, see
+            load_statistics.LoadStatistics. They are stored in load_statistics by demand, whatever the output
+            resolution and level of detail. Work units return their 1-minute load (sum of their profiles) in addition
+            to their profiles: with n_jobs > 1, 1440 values per day and work unit are sent from the workers. With a
+            column_store, work units return their 1-minute profiles instead, which are folded to the output
+            resolution once merged (default False)
+        """
+        if output_resolution is not None:
+            check_resolution(output_resolution)
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(
+                f"Level of detail must be one of {DETAIL_LEVELS}, got {detail}"
+            )
+        if engine not in ENGINES:
+            raise ValueError(f"Engine must be one of {ENGINES}, got {engine}")
+        if not any(np.dtype(valid) == dtype for valid in DTYPES):
+            raise ValueError(
+                f"Data type must be one of {[str(np.dtype(valid)) for valid in DTYPES]}, got {dtype}"
+            )
+        if sparse and working_dir is not None:
+            raise ValueError(
+                "Sparse mode and out-of-core mode (working_dir) cannot be combined"
+            )
+        if pool_size is not None and (
+            not isinstance(pool_size, (int, np.integer)) or pool_size < 1
+        ):
+            raise ValueError(
+                f"Pool size must be a positive number of user-days, got {pool_size}"
+            )
         self.number_of_days = number_of_days
+        self.start_date = start_date
+        self.n_jobs = n_jobs
+        self.seed = seed
+        self.output_resolution = output_resolution
+        self.detail = detail
+        self.engine = engine
+        self.pool_size = pool_size
+        self.cache = cache
+        self.column_store = column_store
+        self.parallel_demands = parallel_demands
+        self.dtype = np.dtype(dtype)
+        self.working_dir = working_dir
+        self.sparse = sparse
+        self.statistics = statistics
         self.min_timeseries = pd.date_range(
             start_date, periods=number_of_days * 24 * 60, freq="Min"
         )
         self.days_timeseries = pd.date_range(
             start_date, periods=number_of_days, freq="D"
         )
+        # Month and weekday of every simulated day as numpy arrays
+        self.calendar = CalendarIndex(start_date, number_of_days)
         self.opti_mg_uses_cases = {}
+        # Summary of the statistics of every simulated demand, see statistics
+        self.load_statistics = {}
 
-    def run_opti_mg_dat(self, input_data_dict, admin_input):
+    @instrumented()
+    def run_opti_mg_dat(self, input_data_dict, admin_input, progress=None):
         """
         --- Performs modeling of all demands in OptiMG DAT ---
         - Generate UseCases for the 5 demands to be modeled from input data generated from surveys
         - Run RAMP model for all UseCases
-        - Resample demand profiles to hourly resolution
+        - Resample demand profiles to output_resolution (hourly by default) while simulating
         - Return multi-index dataframe with all modeled demands
+        Demands are run one after another or, if parallel_demands is set, concurrently in worker processes
+        If a cache is set, results of identical requests are loaded from the cache instead (use cases are then not
+        generated, the statistics of the demands are loaded with the results)
+        If a progress callback is given, it is called while simulating with the name of the running demand, the
+        fraction of all demands done (every demand counts for an equal share) and the elapsed time in seconds. It can
+        stop the simulation by raising an exception, e.g. helpers.exceptions.SimulationCancelled: work units not
+        started yet are dropped and the exception is raised by run_opti_mg_dat. If parallel_demands is set, progress
+        is called when a demand is done and every simulation.HEARTBEAT_INTERVAL seconds meanwhile with the demand
+        awaited, the demands still running in worker processes stop at their next user once it raised
 
         :param input_data_dict:
         :param admin_input:
+        :param progress: callable progress(demand_name, fraction, elapsed), see above (default None)
         :return:
         """
-
-        # Generate dict of use_cases with entry for each demand
-        self.opti_mg_uses_cases = {
-            "electrical_appliances": self.generate_electric_appliances_use_cases(
-                input_data_dict, admin_input
-            ),
-            "agro_processing": self.generate_agro_processing_use_cases(
-                input_data_dict, admin_input
-            ),
-            "cooking": self.generate_cooking_demand_use_cases(
-                input_data_dict, admin_input
-            ),
-            "drinking_water": self.generate_drinking_water_use_cases(
-                input_data_dict, admin_input
-            ),
-            "service_water": self.generate_service_water_use_cases(
-                input_data_dict, admin_input
-            ),
-        }
+        start = time.perf_counter()
+        cache_key = self.cache_key(input_data_dict, admin_input)
+        if cache_key is not None:
+            with span("cache_get"):
+                cached_result = self.cache.get(cache_key)
+            if cached_result is not None:
+                if self.statistics:
+                    *cached_result, self.load_statistics = cached_result
+                    cached_result = tuple(cached_result)
+                return cached_result
 
         demand_profiles_mean = {}
         demand_profiles_max = {}
-        # Run RAMP model for each demand
-        for demand_name, use_cases in self.opti_mg_uses_cases.items():
-            demand_profiles_mean[demand_name] = self.run_use_cases(
-                use_cases, input_data_dict, demand_name
+        self.opti_mg_uses_cases = {}
+        self.load_statistics = {}
+        if self.parallel_demands:
+            # Progress callbacks cannot be sent to worker processes, progress is reported from this process when a
+            # demand is done and while waiting for it
+            if progress is not None:
+                progress(DEMANDS[0], 0.0, time.perf_counter() - start)
+            # Set to stop the demands running in the workers, see simulation.check_cancelled
+            cancel_event = multiprocessing.Event()
+            # Generate and simulate every demand in its own worker process. No with statement: leaving it would wait
+            # for the demands still running
+            executor = ProcessPoolExecutor(
+                max_workers=len(DEMANDS),
+                initializer=reseed_worker,
+                initargs=(cancel_event,),
             )
-            demand_profiles_max[demand_name] = demand_profiles_mean[demand_name]
-
-            # Resample to hourly values
-            if demand_name == "service_water" or demand_name == "drinking_water":
-                # Water demands are resampled as hourly sum
-                demand_profiles_max[demand_name] = (
-                    demand_profiles_max[demand_name].resample("h").sum()
-                )
-                demand_profiles_mean[demand_name] = (
-                    demand_profiles_mean[demand_name].resample("h").sum()
-                )
-            else:
-                # Energy demands are resampled as hourly mean
-                demand_profiles_max[demand_name] = (
-                    demand_profiles_max[demand_name].resample("h").max()
-                )
-                demand_profiles_mean[demand_name] = (
-                    demand_profiles_mean[demand_name].resample("h").mean()
+            try:
+                futures = [
+                    executor.submit(
+                        self.run_demand,
+                        demand_name,
+                        input_data_dict,
+                        admin_input,
+                        progress=check_cancelled,
+                    )
+                    for demand_name in DEMANDS
+                ]
+                for demand_idx, (demand_name, future) in enumerate(
+                    zip(DEMANDS, futures)
+                ):
+                    use_cases, profiles_mean, profiles_max, demand_statistics = (
+                        wait_result(
+                            future,
+                            (
+                                None
+                                if progress is None
+                                else lambda: progress(
+                                    demand_name,
+                                    demand_idx / len(DEMANDS),
+                                    time.perf_counter() - start,
+                                )
+                            ),
+                        )
+                    )
+                    self.opti_mg_uses_cases[demand_name] = use_cases
+                    demand_profiles_mean[demand_name] = profiles_mean
+                    demand_profiles_max[demand_name] = profiles_max
+                    if demand_statistics is not None:
+                        self.load_statistics[demand_name] = demand_statistics
+                    if progress is not None:
+                        progress(
+                            demand_name,
+                            (demand_idx + 1) / len(DEMANDS),
+                            time.perf_counter() - start,
+                        )
+            except BaseException:
+                # Cancelled simulation or failed demand: demands not started yet are dropped, running demands stop
+                # at their next user, without waiting for them
+                cancel_event.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            executor.shutdown()
+        else:
+            # Run RAMP model for each demand
+            for demand_idx, demand_name in enumerate(DEMANDS):
+                (
+                    self.opti_mg_uses_cases[demand_name],
+                    demand_profiles_mean[demand_name],
+                    demand_profiles_max[demand_name],
+                    _,
+                ) = self.run_demand(
+                    demand_name,
+                    input_data_dict,
+                    admin_input,
+                    progress=(
+                        None
+                        if progress is None
+                        else demand_progress(progress, demand_idx, start)
+                    ),
                 )
 
         # Combine all demand profiles in multi-index dataframe
-        demand_profiles_df_mean = pd.concat(demand_profiles_mean, axis=1)
-        demand_profiles_df_max = pd.concat(demand_profiles_max, axis=1)
+        with span("concat"):
+            demand_profiles_df_mean = pd.concat(demand_profiles_mean, axis=1)
+            demand_profiles_df_max = pd.concat(demand_profiles_max, axis=1)
+
+        if cache_key is not None:
+            cached_result = (demand_profiles_df_mean, demand_profiles_df_max)
+            if self.statistics:
+                cached_result += (self.load_statistics,)
+            with span("cache_put"):
+                self.cache.put(cache_key, cached_result)
 
         return demand_profiles_df_mean, demand_profiles_df_max
 
-    def run_use_cases(self, use_cases_list, user_data, description):
+    def iter_days(self, input_data_dict, admin_input, chunk_days=7):
         """
+        Simulate all demands like run_opti_mg_dat, chunk of days by chunk of days
+        - use cases and work units (with their peak time ranges and seeds) of every demand are generated once for
+          the whole timeframe, see plan_work_units
+        - work units do not span two months: days are simulated month by month, up to the end of the month of the
+          last day of a chunk, and the days not yielded yet are kept for the next chunk. Memory is bounded by the
+          chunk size plus one month, not by the timeframe
+        - with a seed, the concatenated chunks are equal to run_opti_mg_dat's output, whatever chunk_days
+        - demands are simulated one after another, the cache is not used. load_statistics holds the statistics of
+          the last simulated days
 
-        :param use_cases_list:
-        :param user_data:
-        :param description: description to show in progress bar of this run of use cases
-        :return:
+        :param input_data_dict:
+        :param admin_input:
+        :param chunk_days: number of days per chunk (the last chunk may be shorter)
+        :return: generator of (mean, max) multi-index dataframes of every chunk, like run_opti_mg_dat's output
+        """
+        if chunk_days < 1:
+            raise ValueError(
+                f"Chunks must have a positive number of days, got {chunk_days}"
+            )
+        resolution = self.output_resolution or DEFAULT_OUTPUT_RESOLUTION
+        self.opti_mg_uses_cases = {}
+        demand_work_units = {}
+        for demand_name in DEMANDS:
+            use_cases = self.generate_use_cases(
+                demand_name, input_data_dict, admin_input
+            )
+            self.opti_mg_uses_cases[demand_name] = use_cases
+            demand_work_units[demand_name] = self.plan_work_units(
+                use_cases, input_data_dict, demand_name
+            )
+
+        # Position of the first day of every month after the first one and end of the timeframe: work units end there
+        month_ends = np.append(
+            np.flatnonzero(np.diff(self.calendar.month) != 0) + 1, self.number_of_days
+        )
+        simulated_days = 0
+        # Profiles of the simulated days not yielded yet, from the first day of the next chunk on
+        pending_mean = pending_max = None
+        for first_day in range(0, self.number_of_days, chunk_days):
+            last_day = min(first_day + chunk_days, self.number_of_days)
+            if last_day > simulated_days:
+                month_end = int(
+                    month_ends[np.searchsorted(month_ends, last_day - 1, side="right")]
+                )
+                self.load_statistics = {}
+                demand_profiles_mean = {}
+                demand_profiles_max = {}
+                for demand_name in DEMANDS:
+                    demand_profiles = self.run_use_cases(
+                        self.opti_mg_uses_cases[demand_name],
+                        input_data_dict,
+                        demand_name,
+                        resolution=resolution,
+                        work_units=demand_work_units[demand_name],
+                        days=(simulated_days, month_end),
+                    )
+                    (
+                        demand_profiles_mean[demand_name],
+                        demand_profiles_max[demand_name],
+                    ) = self.resample_demand_profiles(demand_name, demand_profiles)
+                simulated_mean = pd.concat(demand_profiles_mean, axis=1)
+                simulated_max = pd.concat(demand_profiles_max, axis=1)
+                if pending_mean is not None:
+                    simulated_mean = pd.concat([pending_mean, simulated_mean])
+                    simulated_max = pd.concat([pending_max, simulated_max])
+                pending_mean, pending_max = simulated_mean, simulated_max
+                simulated_days = month_end
+
+            chunk_steps = (last_day - first_day) * (1440 // resolution)
+            yield pending_mean.iloc[:chunk_steps], pending_max.iloc[:chunk_steps]
+            pending_mean = pending_mean.iloc[chunk_steps:]
+            pending_max = pending_max.iloc[chunk_steps:]
+
+    def run_ensemble(
+        self,
+        input_data_dict,
+        admin_input,
+        realisations,
+        quantiles=DEFAULT_QUANTILES,
+        n_jobs=1,
+    ):
+        """
+        Simulate an ensemble of independent realisations of run_opti_mg_dat and summarise them
+        - every realisation is folded into online statistics as soon as it is simulated and dropped afterwards:
+          memory does not depend on the number of realisations, see ensemble.EnsembleStatistics
+        - if a seed is given, every realisation has its own seed derived from it, see realisation
+
+        :param input_data_dict:
+        :param admin_input:
+        :param realisations: number of realisations
+        :param quantiles: probabilities of the estimated quantile bands (default P10, P50, P90)
+        :param n_jobs: number of realisations simulated concurrently in worker processes, -1 uses all CPU cores.
+            Realisations simulated in worker processes run their work units and demands serially
+        :return: dict with the "mean", "std", "quantiles", "peaks" and number of "realisations" of the ensemble,
+            see ensemble.EnsembleStatistics.summary
         """
+        if realisations < 1:
+            raise ValueError(
+                f"An ensemble needs a positive number of realisations, got {realisations}"
+            )
+        statistics = EnsembleStatistics(quantiles)
+        n_jobs = min(resolve_n_jobs(n_jobs), realisations)
+        realisation_controls = (
+            self.realisation(realisation_idx, serial=n_jobs > 1)
+            for realisation_idx in range(realisations)
+        )
+        simulate = partial(
+            simulate_realisation,
+            input_data_dict=input_data_dict,
+            admin_input=admin_input,
+        )
+        if n_jobs == 1:
+            for realisation_control in realisation_controls:
+                statistics.add(*simulate(realisation_control))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs, initializer=reseed_worker
+            ) as executor:
+                for profiles_mean, profiles_max in executor.map(
+                    simulate, realisation_controls
+                ):
+                    statistics.add(profiles_mean, profiles_max)
+        return statistics.summary()
+
+    def realisation(self, realisation_idx, serial=False):
+        """
+        RampControl with the same options for one realisation of an ensemble
+        - if a seed is given, the realisation's seed is derived from it and realisation_idx, otherwise realisations
+          draw from the current random state
+        :param realisation_idx: position of the realisation in the ensemble
+        :param serial: if True, work units and demands of the realisation are simulated in the current process
+        :return: RampControl
+        """
+        realisation_control = copy.copy(self)
+        if self.seed is not None:
+            realisation_control.seed = derive_seed(
+                self.seed, "realisation", realisation_idx
+            )
+        if serial:
+            realisation_control.n_jobs = 1
+            realisation_control.parallel_demands = False
+        realisation_control.opti_mg_uses_cases = {}
+        realisation_control.load_statistics = {}
+        return realisation_control
+
+    def run_demand(self, demand_name, input_data_dict, admin_input, progress=None):
+        """
+        Generate the use cases of one demand, simulate them and resample the demand profiles
+        - demands share no state, they can be run in separate processes
 
-        # Dict to store generated demand profiles
-        demand_profiles = {}
+        :param demand_name: one of DEMANDS
+        :param input_data_dict:
+        :param admin_input:
+        :param progress: progress callback of the simulation of the demand, see run_use_cases
+        :return: list of (use_case, month) tuples of the demand, dataframes of the resampled mean and max profiles,
+            summary of the demand's statistics (None if statistics is not set)
+        """
+        with span(demand_name):
+            use_cases = self.generate_use_cases(
+                demand_name, input_data_dict, admin_input
+            )
+            demand_profiles = self.run_use_cases(
+                use_cases,
+                input_data_dict,
+                demand_name,
+                resolution=self.output_resolution or DEFAULT_OUTPUT_RESOLUTION,
+                progress=progress,
+            )
+            demand_profiles_mean, demand_profiles_max = self.resample_demand_profiles(
+                demand_name, demand_profiles
+            )
+        return (
+            use_cases,
+            demand_profiles_mean,
+            demand_profiles_max,
+            self.load_statistics.get(demand_name),
+        )
 
-        # Day of year counter
-        day_counter = 0
-        for entry in tqdm(use_cases_list, desc=f"Modeling demands: {description}"):
+    @instrumented()
+    def resample_demand_profiles(self, demand_name, demand_profiles):
+        """
+        Resample the profiles of a demand returned by run_use_cases to the output of run_opti_mg_dat
+        - water demands are resampled as sum, energy demands as mean and max
+        :param demand_name: one of DEMANDS
+        :param demand_profiles: dict of resampled dataframes returned by run_use_cases with a resolution, or
+            1-minute dataframe, MappedProfiles or EventProfiles returned by run_use_cases without resolution
+            (resampled to output_resolution here)
+        :return: dataframes of the resampled mean and max profiles
+        """
+        if isinstance(demand_profiles, pd.DataFrame):
+            demand_profiles = self.resample_minute_dataframe(
+                demand_profiles, self.output_resolution or DEFAULT_OUTPUT_RESOLUTION
+            )
+        elif isinstance(demand_profiles, (MappedProfiles, EventProfiles)):
+            demand_profiles = demand_profiles.resample(
+                self.output_resolution or DEFAULT_OUTPUT_RESOLUTION
+            )
+        if demand_name == "service_water" or demand_name == "drinking_water":
+            # Water demands are resampled as sum
+            return demand_profiles["sum"], demand_profiles["sum"]
+        # Energy demands are resampled as mean and max
+        return demand_profiles["mean"], demand_profiles["max"]
 
-            use_case = entry[
-                0
-            ]  # use_case object is first entry in tuple in use_cases_list
-            use_case_month = entry[1]  # month number of the use_case is second entry
+    def resample_minute_dataframe(self, minute_profiles_df, resolution):
+        """
+        Resample a 1-minute dataframe of the whole timeframe (see run_use_cases)
+        - the sum, mean and max of all columns are computed from the underlying 2D numpy array, the datetime index
+          of the time steps is attached once to the resulting dataframes
 
-            # Calculate peak time range of this use case
-            peak_time_range = use_case.calc_peak_time_range()
+        :param minute_profiles_df: dataframe with one row per minute of the timeframe
+        :param resolution: length of the time steps in minutes
+        :return: dict with the "sum", "mean" and "max" dataframes of every time step
+        """
+        steps_index = steps_timeseries(self.start_date, self.number_of_days, resolution)
+        steps_index.name = minute_profiles_df.index.name
+        folded_profiles = fold_minute_profiles(
+            minute_profiles_df.to_numpy(dtype=self.dtype), resolution
+        )
+        return {
+            stat: pd.DataFrame(
+                profiles, index=steps_index, columns=minute_profiles_df.columns
+            )
+            for stat, profiles in folded_profiles.items()
+        }
 
-            # Loop through all days of this month's use_case
+    @instrumented()
+    def typical_profiles(self, profiles):
+        """
+        Typical day, typical week and typical day of every month of profiles of the timeframe
+        - the rows of the profiles are reshaped to [day, step_of_day, column] and the days grouped by the weekday and
+          month of the calendar (see calendar_index.CalendarIndex, resampling.group_day_means): no datetime is
+          formatted and the returned dataframes have one row per time step of the typical days
+
+        :param profiles: dataframe with the same number of time steps for every day of the timeframe, e.g. the
+            "mean" dataframe of run_opti_mg_dat or the 1-minute dataframe of run_use_cases. MappedProfiles and
+            EventProfiles are resampled to output_resolution first
+        :return: dict with the dataframes of the mean profile of
+            - "day": all days, indexed by the time of day
+            - "week": every weekday, indexed by the time since Monday 00:00 (NaN for weekdays without days)
+            - "month": every month of the timeframe, indexed by month (1-12) and time of day
+        """
+        if isinstance(profiles, (MappedProfiles, EventProfiles)):
+            profiles = profiles.resample(
+                self.output_resolution or DEFAULT_OUTPUT_RESOLUTION
+            )["mean"]
+        steps_per_day, remainder = divmod(len(profiles), self.number_of_days)
+        if remainder != 0 or steps_per_day == 0 or 1440 % steps_per_day != 0:
+            raise ValueError(
+                f"Profiles must have the same number of time steps dividing a day for each of the "
+                f"{self.number_of_days} days of the timeframe, got {len(profiles)} rows"
+            )
+        step_length = pd.Timedelta(minutes=1440 // steps_per_day)
+        day_profiles = profiles.to_numpy().reshape(
+            self.number_of_days, steps_per_day, -1
+        )
+        time_of_day = pd.timedelta_range(
+            0, periods=steps_per_day, freq=step_length, name="time_of_day"
+        )
+        # Months of the timeframe, in the order of the year
+        months = np.unique(self.calendar.month)
+        week_profiles = group_day_means(day_profiles, self.calendar.weekday, 7)
+        month_profiles = group_day_means(day_profiles, self.calendar.month - 1, 12)[
+            months - 1
+        ]
+        return {
+            "day": pd.DataFrame(
+                day_profiles.mean(axis=0), index=time_of_day, columns=profiles.columns
+            ),
+            "week": pd.DataFrame(
+                week_profiles.reshape(7 * steps_per_day, -1),
+                index=pd.timedelta_range(
+                    0, periods=7 * steps_per_day, freq=step_length, name="time_of_week"
+                ),
+                columns=profiles.columns,
+            ),
+            "month": pd.DataFrame(
+                month_profiles.reshape(len(months) * steps_per_day, -1),
+                index=pd.MultiIndex.from_product(
+                    [months, time_of_day], names=["month", "time_of_day"]
+                ),
+                columns=profiles.columns,
+            ),
+        }
 
-            for day in self.days_timeseries[
-                self.days_timeseries.month == use_case_month
-            ]:
-                # Return weekday of this day (Monday=0, Sunday=6)
-                weekday = day.weekday()
-                # Loop through all user instances (= user types)
-                for user in use_case.users:
+    @instrumented()
+    def generate_use_cases(self, demand_name, input_data_dict, admin_input):
+        """
+        Generate the use cases of one demand from input data generated from surveys
+        :param demand_name: one of DEMANDS
+        :param input_data_dict:
+        :param admin_input:
+        :return: list of (use_case, month) tuples
+        """
+        generators = {
+            "electrical_appliances": self.generate_electric_appliances_use_cases,
+            "agro_processing": self.generate_agro_processing_use_cases,
+            "cooking": self.generate_cooking_demand_use_cases,
+            "drinking_water": self.generate_drinking_water_use_cases,
+            "service_water": self.generate_service_water_use_cases,
+        }
+        if demand_name not in generators:
+            raise ValueError(f"Demand must be one of {DEMANDS}, got {demand_name}")
+        return generators[demand_name](input_data_dict, admin_input)
 
-                    # Check if user_name does not exist in demand_profiles dict yet (=first day to be simulated)
-                    if user.user_name not in demand_profiles:
-                        # Create dict entry for every user
-                        demand_profiles[user.user_name] = {}
+    def cache_key(self, input_data_dict, admin_input):
+        """
+        Key of the results of run_opti_mg_dat in the cache
+        - depends on the input data, the timeframe, the seed, all simulation options and the engine version
+        :param input_data_dict:
+        :param admin_input:
+        :return: str, or None if no cache is set or the results are not reproducible (no seed, "ramp" engine)
+        """
+        if self.cache is None or (self.seed is None and self.engine != "expected"):
+            return None
+        return self.cache.key(
+            input_data_dict,
+            admin_input,
+            self.number_of_days,
+            pd.Timestamp(self.start_date).isoformat(),
+            self.seed,
+            self.engine,
+            self.output_resolution,
+            self.detail,
+            self.pool_size,
+            engine_version(),
+            str(self.dtype),
+            self.sparse,
+            self.statistics,
+        )
 
-                    # Check if current weekday is working day of the user
-                    if weekday in user_data[user.user_name]["working_days"]:
-                        day_type = 0  # set day_type=0 -> working day
-                    else:
-                        day_type = 1  # set day_type=1 -> holiday
-
-                    # Loop through each user of this user type
-                    for _ in range(user.num_users):
-                        # Loop through user's appliances
-                        for appliance in user.App_list:
-                            # Check if there is no dict entry for this appliance yet in the load profiles dict
-                            # (= first day of simulation)
-                            if appliance.name not in demand_profiles[user.user_name]:  #
-                                # Create dict entry for this appliance with pre-allocated 2D numpy array
-                                # 1440 (minute) timesteps for each day to be simulated
-                                demand_profiles[user.user_name][appliance.name] = (
-                                    np.zeros((self.number_of_days, 1440))
-                                )
+    def plan_work_units(self, use_cases_list, user_data, description):
+        """
+        Split the simulation of the use cases of one demand into independent work units
+        - months with identical use cases share their user instances, every user type of every month of every year
+          is simulated as an independent work unit with the peak time range drawn for this month of the year. With
+          the expected engine, the peak time range is the same for identical months and is computed once
+        - appliances without usage during a month (e.g. of absent users) are not simulated
+        - peak time ranges are drawn here, before simulating: RAMP derives them from the appliances' daily_use,
+          which simulating overwrites
+
+        :param use_cases_list: list of (use_case, month) tuples, see generate_use_cases
+        :param user_data:
+        :param description: name of the demand
+        :return: list of WorkUnit in chronological order of their months for every group of identical months
+        """
+        # Group the months whose use cases consist of the same user instances: generate_*_use_cases share user
+        # instances between months with the same parameters, so these monthly configurations are identical
+        month_groups = {}
+        for use_case_idx, (use_case, use_case_month) in enumerate(use_cases_list):
+            month_groups.setdefault(
+                tuple(id(user) for user in use_case.users), []
+            ).append(use_case_idx)
+
+        # List of WorkUnit, one for every user type of every month of every year of the timeframe. A peak time range
+        # is drawn for every month of the year (once for every group of identical months with the expected engine,
+        # whose peak time range is the same for identical months)
+        work_units = []
+        # RAMP day type of every day of the timeframe for every user type
+        user_day_types = {}
+        for use_case_idxs in month_groups.values():
+            # The first use case of the group represents all its months
+            use_case = use_cases_list[use_case_idxs[0]][0]
+            # Appliances without usage during these months (func_time = 0, e.g. absent users) are not simulated,
+            # their profiles stay zero
+            users_appliance_idxs = [
+                [
+                    appliance_idx
+                    for appliance_idx, appliance in enumerate(user.App_list)
+                    if appliance.func_time > 0
+                ]
+                for user in use_case.users
+            ]
+            if self.engine == "expected":
+                # Expected position and width of the peak time range of this use case
+                month_units = [(use_case_idxs, expected_peak_time_range(use_case))]
+            else:
+                # A peak time range is drawn for every month, as RAMP does for every use case
+                month_units = []
+                for use_case_idx in use_case_idxs:
+                    if self.seed is not None:
+                        # Independent random stream for the peak time range of this demand and month
+                        seed_random_state(
+                            derive_seed(
+                                self.seed,
+                                description,
+                                use_cases_list[use_case_idx][1],
+                                "peak_time",
+                            )
+                        )
+                    # Calculate peak time range of this use case
+                    month_units.append(
+                        ([use_case_idx], use_case.calc_peak_time_range())
+                    )
 
-                            # --- Generate appliance load profile ---
-                            # Generate a daylong profile with 1-min resolution (1440 time steps) for this appliance
-                            # Load profile is not returned but saved in the appliance's daily_use attribute
-                            appliance.generate_load_profile(
-                                prof_i=0,  # Day of the year in RAMP core. Not used here, thus always 0
+            for unit_use_case_idxs, peak_time_range in month_units:
+                unit_months = [use_cases_list[idx][1] for idx in unit_use_case_idxs]
+                # Position of all days of these months in the simulated timeframe (of any year), split into blocks
+                # of one month of one year: the memory of a work unit does not grow with the timeframe
+                for day_indexes in self.calendar.month_blocks(
+                    self.calendar.days_of_months(unit_months)
+                ):
+                    if day_indexes.size == 0:
+                        continue
+                    block_year = int(self.calendar.year[day_indexes[0]])
+                    block_month = int(self.calendar.month[day_indexes[0]])
+
+                    # Loop through all user instances (= user types)
+                    for user_idx, user in enumerate(use_case.users):
+                        # Check if weekdays are working days of the user
+                        # day_type=0 -> working day, day_type=1 -> holiday
+                        if user.user_name not in user_day_types:
+                            user_day_types[user.user_name] = self.calendar.day_types(
+                                working_days_bitmask(
+                                    user_data[user.user_name]["working_days"]
+                                )
+                            )
+                        work_units.append(
+                            WorkUnit(
+                                use_case_idx=unit_use_case_idxs[0],
+                                user_idx=user_idx,
+                                day_indexes=day_indexes,
+                                day_types=user_day_types[user.user_name][day_indexes],
                                 peak_time_range=peak_time_range,
-                                day_type=day_type,  # Day type: 0->working day, 1->holiday
-                                power=appliance.power,  # Power of the appliance at this day
+                                # Seed of the random streams of this demand, user type, year and month
+                                seed=(
+                                    None
+                                    if self.seed is None
+                                    else derive_seed(
+                                        self.seed,
+                                        description,
+                                        user.user_name,
+                                        block_year,
+                                        block_month,
+                                    )
+                                ),
+                                appliance_idxs=users_appliance_idxs[user_idx],
                             )
+                        )
+        return work_units
+
+    @instrumented()
+    def run_use_cases(
+        self,
+        use_cases_list,
+        user_data,
+        description,
+        resolution=None,
+        progress=None,
+        work_units=None,
+        days=None,
+    ):
+        """
+        Simulate all use cases of one demand
+        - every user type of every month is simulated as an independent work unit, see plan_work_units
+        - work units are run serially or, if n_jobs > 1, spread over a pool of worker processes
+        - if statistics is set, the load statistics of the demand are stored in load_statistics[description]
 
-                            # Add this appliance load profile to the day's load profile
-                            demand_profiles[user.user_name][appliance.name][
-                                day_counter
-                            ] += appliance.daily_use
+        :param use_cases_list:
+        :param user_data:
+        :param description: description to show in progress bar of this run of use cases
+        :param resolution: if given, every work unit folds its days into time steps of resolution minutes and only
+            these are kept
+        :param progress: if given, callable progress(description, fraction, elapsed) called before simulating,
+            after merging every work unit and at least every simulation.HEARTBEAT_INTERVAL seconds while simulating
+            with the fraction of work units done and the elapsed time in seconds. An exception raised by progress
+            (e.g. helpers.exceptions.SimulationCancelled) stops the simulation: the work unit being simulated stops
+            at its next user, work units not started yet are dropped and the exception is raised by run_use_cases
+        :param work_units: work units of the use cases returned by plan_work_units, planned here if None
+        :param days: if given, (first_day, last_day + 1) positions in the timeframe of the days to simulate, only
+            the work units of these days are simulated and the returned profiles start at first_day. Work units do
+            not span two months, days must consist of whole months (except at the ends of the timeframe)
+        :return: dataframe of 1-minute load profiles with one column per [user, appliance], user or demand,
+            depending on self.detail (MappedProfiles of these columns if self.working_dir is set, EventProfiles if
+            self.sparse). If resolution is given, dict with the "sum", "mean" and "max" dataframes of every time step
+            instead
+        """
+        start = time.perf_counter()
+        if work_units is None:
+            work_units = self.plan_work_units(use_cases_list, user_data, description)
+
+        # Work units sum the profiles of all appliances of a user type if appliances are not kept separately
+        sum_appliances = self.detail != "appliance"
+        # Columns of the returned dataframe in the order of the work units, whatever days are simulated
+        columns = {}
+        for work_unit in work_units:
+            user = use_cases_list[work_unit.use_case_idx][0].users[work_unit.user_idx]
+            for profile_key in unit_profile_keys(user, sum_appliances):
+                columns.setdefault(self.profile_column(user.user_name, profile_key))
+        columns = list(columns)
+
+        # Simulated days, day indexes of the work units are shifted to positions in these days
+        first_day, last_day = (0, self.number_of_days) if days is None else days
+        if not 0 <= first_day < last_day <= self.number_of_days:
+            raise ValueError(
+                f"Days must be a range of the timeframe of {self.number_of_days} days, got {days}"
+            )
+        number_of_days = last_day - first_day
+        start_date = self.days_timeseries[first_day]
+        if days is not None:
+            days_units = []
+            for work_unit in work_units:
+                in_days = (work_unit.day_indexes >= first_day) & (
+                    work_unit.day_indexes < last_day
+                )
+                if in_days.all():
+                    days_units.append(
+                        work_unit._replace(
+                            day_indexes=work_unit.day_indexes - first_day
+                        )
+                    )
+                elif in_days.any():
+                    raise ValueError(
+                        f"Days {days} split a work unit, they must consist of whole months"
+                    )
+            work_units = days_units
+
+        # Work units can only resample their profiles if these are complete at the requested level of detail,
+        # demand profiles sum all user types and are resampled once all work units are merged. In sparse mode, the
+        # events of the work units are resampled once merged. In out-of-core mode, the 1-minute profiles of all
+        # levels of detail are merged into the memory-mapped file and resampled from it
+        fold_units = (
+            resolution is not None
+            and self.detail != "demand"
+            and not self.sparse
+            and self.working_dir is None
+        )
+        # Profiles of the column store are reused if the results are reproducible
+        use_column_store = self.column_store is not None and (
+            self.seed is not None or self.engine == "expected"
+        )
+        # Statistics need the 1-minute load of every work unit: workers return it with their (folded) profiles.
+        # Profiles reused from the column store have no 1-minute load, with the column store work units return their
+        # 1-minute profiles, which are folded while merging
+        units_load = self.statistics and not use_column_store
+        unit_resolution = (
+            resolution if fold_units and (not self.statistics or units_load) else None
+        )
+        load_statistics = (
+            LoadStatistics(
+                start_date,
+                number_of_days,
+                [work_unit.day_indexes for work_unit in work_units],
+            )
+            if self.statistics
+            else None
+        )
 
-                # Increase day counter
-                day_counter += 1
+        # Fingerprint of every profile of the work units, None if the column store is not used
+        units_fingerprints = [None] * len(work_units)
+        # Profiles of the work units reused from the column store
+        units_stored_profiles = [{} for _ in work_units]
+        # Work units (or the appliances of work units) whose profiles have to be simulated and their position in
+        # work_units
+        simulated_units = []
+        simulated_unit_idxs = []
+        for unit_idx, work_unit in enumerate(work_units):
+            user = use_cases_list[work_unit.use_case_idx][0].users[work_unit.user_idx]
+            if use_column_store:
+                fingerprints = self.column_fingerprints(
+                    description, user, work_unit, sum_appliances, unit_resolution
+                )
+                units_fingerprints[unit_idx] = fingerprints
+                profile_keys = unit_profile_keys(user, sum_appliances)
+                for profile_key in dict.fromkeys(
+                    profile_keys[appliance_idx]
+                    for appliance_idx in work_unit.appliance_idxs
+                ):
+                    stored_profiles = self.column_store.get(fingerprints[profile_key])
+                    if stored_profiles is not None:
+                        units_stored_profiles[unit_idx][profile_key] = stored_profiles
+
+                # Only simulate the appliances of profiles missing in the column store
+                work_unit = work_unit._replace(
+                    appliance_idxs=[
+                        appliance_idx
+                        for appliance_idx in work_unit.appliance_idxs
+                        if profile_keys[appliance_idx]
+                        not in units_stored_profiles[unit_idx]
+                    ]
+                )
+            if work_unit.appliance_idxs:
+                simulated_units.append(work_unit)
+                simulated_unit_idxs.append(unit_idx)
+
+        # All columns are pre-allocated in one contiguous 3D numpy array [column, day_of_timeframe, step_of_day]
+        # the returned dataframe is built upon without copying, demand_profiles holds the 2D view of every column.
+        # In out-of-core mode, the work units are added to the memory-mapped file instead, one block of days at once
+        mapped_profiles = None
+        event_profiles = None
+        # Work units of all user types add up in the column of the demand: it is accumulated in float64 and cast to
+        # dtype on output. Other columns get one profile per day, which workers accumulated in float64
+        buffer_dtype = np.dtype(np.float64) if self.detail == "demand" else self.dtype
+        if self.sparse:
+            # Event lists of all columns instead of a buffer, see events.EventProfiles
+            event_profiles = EventProfiles(
+                columns, start_date, number_of_days, dtype=self.dtype
+            )
+        elif not fold_units:
+            # 1440 (minute) timesteps for each day to be simulated
+            if self.working_dir is not None:
+                # Out-of-core mode: the buffer is a memory-mapped file
+                mapped_profiles = MappedProfiles(
+                    self.working_dir,
+                    columns,
+                    start_date,
+                    number_of_days,
+                    dtype=buffer_dtype,
+                    prefix=f"{description}_",
+                )
+            else:
+                profiles_buffer = np.zeros(
+                    (len(columns), number_of_days, 1440), dtype=buffer_dtype
+                )
+                demand_profiles = {
+                    column: profiles_buffer[column_idx]
+                    for column_idx, column in enumerate(columns)
+                }
+        else:
+            # Sum and max of every time step of each day to be simulated
+            profiles_buffer = {
+                stat: np.zeros(
+                    (len(columns), number_of_days, 1440 // resolution),
+                    dtype=self.dtype,
+                )
+                for stat in ("sum", "max")
+            }
+            demand_profiles = {
+                column: {
+                    stat: stat_buffer[column_idx]
+                    for stat, stat_buffer in profiles_buffer.items()
+                }
+                for column_idx, column in enumerate(columns)
+            }
+
+        heartbeat = None
+        if progress is not None:
+            progress(description, 0.0, time.perf_counter() - start)
+            # Fraction of the work units merged and time of the last call of progress
+            progress_state = {"fraction": 0.0, "reported": time.perf_counter()}
+
+            def heartbeat():
+                # Also report progress while a work unit is simulated, so cancelling does not wait for its end
+                now = time.perf_counter()
+                if now - progress_state["reported"] >= HEARTBEAT_INTERVAL:
+                    progress_state["reported"] = now
+                    progress(description, progress_state["fraction"], now - start)
+
+        simulated_results = run_work_units(
+            use_cases_list,
+            simulated_units,
+            n_jobs=self.n_jobs,
+            heartbeat=heartbeat,
+            resolution=unit_resolution,
+            sum_appliances=sum_appliances,
+            engine=self.engine,
+            pool_size=self.pool_size,
+            dtype=self.dtype,
+            events=self.sparse,
+            load=units_load,
+        )
+        unit_results = zip(simulated_unit_idxs, simulated_results)
+        try:
+            # RAMP sampling of the work units (simulate_work_unit) and merging of their profiles
+            with span("simulate_work_units"):
+                simulated_unit_idx, simulated_profiles = next(
+                    unit_results, (None, None)
+                )
+                for unit_idx, (work_unit, fingerprints, unit_profiles) in enumerate(
+                    tqdm(
+                        zip(work_units, units_fingerprints, units_stored_profiles),
+                        total=len(work_units),
+                        desc=f"Modeling demands: {description}",
+                    )
+                ):
+                    use_case = use_cases_list[work_unit.use_case_idx][0]
+                    user_name = use_case.users[work_unit.user_idx].user_name
+                    # 1-minute load of all users and appliances of the work unit, None without simulated profile
+                    unit_load = None
+
+                    # Simulated units are a subsequence of work_units in the same order
+                    if simulated_unit_idx == unit_idx:
+                        if units_load:
+                            simulated_profiles, unit_load = simulated_profiles
+                        if fingerprints is not None:
+                            for profile_key, profiles in simulated_profiles.items():
+                                self.column_store.put(
+                                    fingerprints[profile_key], profiles, evict=False
+                                )
+                        unit_profiles = {**unit_profiles, **simulated_profiles}
+                        simulated_unit_idx, simulated_profiles = next(
+                            unit_results, (None, None)
+                        )
 
-        # Create dataframe from dict
-        # Loop through all users for which load profiles where generated
-        for user, user_dp in demand_profiles.items():
-            # Loop through every appliance
-            for app, app_dp in user_dp.items():
-                # Turn 2D numpy array: [day_of_timeframe, min_of_day] into 1D numpy array: [min_of_timeframe]
-                user_dp[app] = app_dp.reshape(1, len(app_dp) * 1440).squeeze()
+                    if load_statistics is not None:
+                        if not units_load:
+                            # 1-minute load computed from the 1-minute profiles (or events) of the work unit
+                            for profiles in unit_profiles.values():
+                                if event_profiles is not None:
+                                    profiles = events_to_profiles(
+                                        profiles, len(work_unit.day_indexes)
+                                    )
+                                unit_load = (
+                                    profiles.astype(np.float64)
+                                    if unit_load is None
+                                    else unit_load + profiles
+                                )
+                        load_statistics.add(user_name, work_unit.day_indexes, unit_load)
+
+                    # Add the work unit's load profiles to the days it was simulated for
+                    for profile_key, profiles in unit_profiles.items():
+                        column = self.profile_column(user_name, profile_key)
+                        if event_profiles is not None:
+                            event_profiles.add(column, profiles, work_unit.day_indexes)
+                        elif mapped_profiles is not None:
+                            mapped_profiles.add(column, work_unit.day_indexes, profiles)
+                        elif not fold_units:
+                            demand_profiles[column][work_unit.day_indexes] += profiles
+                        else:
+                            if unit_resolution is None:
+                                # 1-minute profiles kept for the statistics with the column store
+                                profiles = fold_day_profiles(profiles, resolution)
+                            for stat, stat_profiles in profiles.items():
+                                demand_profiles[column][stat][
+                                    work_unit.day_indexes
+                                ] += stat_profiles
+
+                    if progress is not None:
+                        progress_state["fraction"] = (unit_idx + 1) / len(work_units)
+                        progress_state["reported"] = time.perf_counter()
+                        progress(
+                            description,
+                            progress_state["fraction"],
+                            progress_state["reported"] - start,
+                        )
+        except BaseException:
+            # Cancelled or failed simulation: the memory-mapped file is not returned, delete it
+            if mapped_profiles is not None:
+                mapped_profiles.remove()
+            raise
+        finally:
+            # Work units not started yet are dropped if the loop was left early
+            simulated_results.close()
+
+        if self.column_store is not None:
+            self.column_store.evict()
+        if load_statistics is not None:
+            self.load_statistics[description] = load_statistics.summary()
+
+        if resolution is None:
+            if event_profiles is not None:
+                return event_profiles
+            if mapped_profiles is not None:
+                return mapped_profiles
+            return profiles_to_dataframe(
+                profiles_buffer.astype(self.dtype, copy=False),
+                columns,
+                self.min_timeseries[first_day * 1440 : last_day * 1440],
+            )
 
-            # Create dataframe of load profiles of this user's appliances
-            demand_profiles[user] = pd.DataFrame(user_dp)
+        # Folding of the merged profiles and building of the dataframes, work units folding their own days are part
+        # of simulate_work_units
+        with span("resampling"):
+            if event_profiles is not None:
+                # Fold the merged events of every column
+                profiles_buffer = event_profiles.fold(resolution)
+            elif mapped_profiles is not None:
+                # Resample the merged 1-minute profiles chunk by chunk, the file is not needed afterwards
+                profiles_buffer = mapped_profiles.fold(resolution)
+                mapped_profiles.remove()
+            elif not fold_units:
+                # Resample the merged 1-minute profiles of all columns at once
+                profiles_buffer = fold_day_profiles(profiles_buffer, resolution)
+
+            return resampled_dataframes(
+                profiles_buffer, columns, start_date, resolution, self.dtype
+            )
 
-        # Concat dataframe of each user in multi-level column dataframe and return
-        df = pd.concat(demand_profiles, axis=1)
-        df["datetime"] = self.min_timeseries
-        df.set_index("datetime", drop=True, inplace=True)
-        return df
+    def profile_column(self, user_name, profile_key):
+        """
+        Column of the returned dataframe a profile of a work unit is accumulated in, depending on self.detail
+        :param user_name: user type of the work unit
+        :param profile_key: key of the profile, see simulation.unit_profile_keys
+        :return: (user_name, appliance name), user_name or "total"
+        """
+        if self.detail == "appliance":
+            return user_name, profile_key
+        if self.detail == "user":
+            return user_name
+        return "total"
+
+    def column_fingerprints(
+        self, description, user, work_unit, sum_appliances, unit_resolution
+    ):
+        """
+        Fingerprints of the profiles of a work unit in the column store
+        - a fingerprint hashes everything a profile depends on: the parameters of the appliances added to it, the
+          number of users, the days and their day types, the peak time range, the seed of the work unit, the
+          simulation options and the engine version
+        - the appliances of a user are sampled with independent random streams, the profile of an appliance does
+          therefore not depend on the other appliances of the user
+
+        :param description: name of the demand
+        :param user: ramp.User instance of the work unit's user type
+        :param work_unit: WorkUnit
+        :param sum_appliances: see simulation.simulate_work_unit
+        :param unit_resolution: resolution of the work unit's profiles, see simulation.simulate_work_unit
+        :return: dict {profile_key: fingerprint} in the order of the user's appliances
+        """
+        unit_inputs = (
+            engine_version(),
+            description,
+            user.user_name,
+            user.num_users,
+            work_unit.day_indexes,
+            work_unit.day_types,
+            work_unit.peak_time_range,
+            work_unit.seed,
+            self.engine,
+            self.pool_size,
+            sum_appliances,
+            unit_resolution,
+            str(self.dtype),
+            self.sparse,
+        )
+        # Parameters of the appliances added to every profile of the work unit
+        profile_appliances = {}
+        for appliance_idx, (appliance, profile_key) in enumerate(
+            zip(user.App_list, unit_profile_keys(user, sum_appliances))
+        ):
+            profile_appliances.setdefault(profile_key, []).append(
+                (appliance_idx, appliance_parameters(appliance))
+            )
+        return {
+            profile_key: self.column_store.key(unit_inputs, appliances)
+            for profile_key, appliances in profile_appliances.items()
+        }
 
     def generate_cooking_demand_use_cases(self, cooking_input_data, admin_input):
         """
@@ -188,6 +1179,7 @@ class RampControl:
           being present in the settlement during the month of the year
         - for service water (livestock and irrigation) and agro-processing demand the usage_time of the appliances
           changes depending on the month
+        - months with the same parameters of a user share one ramp.User instance
         :param cooking_input_data:
         :param admin_input
         :return:
@@ -195,23 +1187,39 @@ class RampControl:
 
         # List for every month's use case
         cooking_demand_use_cases_list = []
+        # RAMP user instances by (user_name, month-dependent parameters)
+        # -> months with the same parameters share one instance instead of building a copy per month
+        shared_users = {}
+
         # Loop through every month of the year
         for month in range(1, 13):
             # Create dict to store generated RAMP user instances
             ramp_users_dict = {}
             # Loop through every survey respondent.
             for user_name, user_data in cooking_input_data.items():
-                # Create user instance for this household survey respondent
-                new_user = ramp.User(
-                    user_name=user_name, num_users=user_data["num_users"]
-                )
-
                 # Check if this household survey respondent is present in the settlement during this month
                 if month in user_data["months_present"]:
                     present = True
                 else:
                     present = False
 
+                # Reuse the user instance of a previous month with the same presence
+                if (user_name, present) in shared_users:
+                    ramp_users_dict[user_name] = shared_users[(user_name, present)]
+                    continue
+                if not present and (user_name, True) in shared_users:
+                    # Appliances of an absent user only differ by their func_time -> share all other parameters
+                    shared_users[(user_name, False)] = absent_user(
+                        shared_users[(user_name, True)]
+                    )
+                    ramp_users_dict[user_name] = shared_users[(user_name, False)]
+                    continue
+
+                # Create user instance for this household survey respondent
+                new_user = ramp.User(
+                    user_name=user_name, num_users=user_data["num_users"]
+                )
+
                 # Add cooking demands to this user
                 for cooking_demand_name, cooking_demand_data in user_data[
                     "cooking_demands"
@@ -288,8 +1296,9 @@ class RampControl:
                         random_var_w=cooking_metadate["cooking_window_variability"],
                     )
 
-                # Add deepcopy of user instance to ramp_user_dict
-                ramp_users_dict[user_name] = copy.deepcopy(new_user)
+                # Add user instance to ramp_user_dict and share it with the following months
+                ramp_users_dict[user_name] = new_user
+                shared_users[(user_name, present)] = new_user
 
             # Create RAMP use_case
             cooking_demand_use_case = ramp.UseCase(
@@ -304,23 +1313,38 @@ class RampControl:
 
         # List for every month's use case
         electric_appliances_use_cases_list = []
+        # RAMP user instances by (user_name, month-dependent parameters)
+        # -> months with the same parameters share one instance instead of building a copy per month
+        shared_users = {}
 
         for month in range(1, 13):
             # Create dict to store generated RAMP user instances
             ramp_users_dict = {}
             # Loop through every household survey respondent.
             for user_name, user_data in input_data.items():
-                # Create user instance for this household survey respondent
-                new_user = ramp.User(
-                    user_name=user_name, num_users=user_data["num_users"]
-                )
-
                 # Check if this household survey respondent is present in the settlement during this month
                 if month in user_data["months_present"]:
                     present = True
                 else:
                     present = False
 
+                # Reuse the user instance of a previous month with the same presence
+                if (user_name, present) in shared_users:
+                    ramp_users_dict[user_name] = shared_users[(user_name, present)]
+                    continue
+                if not present and (user_name, True) in shared_users:
+                    # Appliances of an absent user only differ by their func_time -> share all other parameters
+                    shared_users[(user_name, False)] = absent_user(
+                        shared_users[(user_name, True)]
+                    )
+                    ramp_users_dict[user_name] = shared_users[(user_name, False)]
+                    continue
+
+                # Create user instance for this household survey respondent
+                new_user = ramp.User(
+                    user_name=user_name, num_users=user_data["num_users"]
+                )
+
                 # Add appliances to this user.
                 for appliance_name, appliance_data in user_data["appliances"].items():
                     # Get appliance's metadata
@@ -390,8 +1414,9 @@ class RampControl:
                         wd_we_type=0,  # 0 -> working days
                     )
 
-                # Add deepcopy of user instance to ramp_user_dict
-                ramp_users_dict[user_name] = copy.deepcopy(new_user)
+                # Add user instance to ramp_user_dict and share it with the following months
+                ramp_users_dict[user_name] = new_user
+                shared_users[(user_name, present)] = new_user
 
             # Create RAMP use_case
             electric_appliances_use_case = ramp.UseCase(
@@ -408,12 +1433,26 @@ class RampControl:
 
         # List for every month's use case
         agro_processing_use_cases_list = []
+        # RAMP user instances by (user_name, month-dependent parameters)
+        # -> months with the same parameters share one instance instead of building a copy per month
+        shared_users = {}
 
         for month in range(1, 13):
             # Create dict to store generated RAMP user instances
             ramp_users_dict = {}
             # Loop through every household survey respondent.
             for user_name, user_data in input_data.items():
+                # Crop processed by every machine during this month, the only parameter depending on the month
+                month_key = tuple(
+                    appliance_data["crop_processed_per_day"][month]
+                    for appliance_data in user_data["agro_processing_machines"].values()
+                )
+
+                # Reuse the user instance of a previous month with the same crop processed
+                if (user_name, month_key) in shared_users:
+                    ramp_users_dict[user_name] = shared_users[(user_name, month_key)]
+                    continue
+
                 # Create user instance for this household survey respondent
                 new_user = ramp.User(
                     user_name=user_name, num_users=user_data["num_users"]
@@ -512,8 +1551,9 @@ class RampControl:
                         ],  # random variability of duty_cycle
                     )
 
-                # Add deepcopy of user instance to ramp_user_dict
-                ramp_users_dict[user_name] = copy.deepcopy(new_user)
+                # Add user instance to ramp_user_dict and share it with the following months
+                ramp_users_dict[user_name] = new_user
+                shared_users[(user_name, month_key)] = new_user
 
             # Create RAMP use_case
             agro_processing_use_case = ramp.UseCase(
@@ -528,23 +1568,38 @@ class RampControl:
 
         # List for every month's use case
         drinking_water_use_cases_list = []
+        # RAMP user instances by (user_name, month-dependent parameters)
+        # -> months with the same parameters share one instance instead of building a copy per month
+        shared_users = {}
 
         for month in range(1, 13):
             # Create dict to store generated RAMP user instances
             ramp_users_dict = {}
             # Loop through every household survey respondent.
             for user_name, user_data in input_data.items():
-                # Create user instance for this household survey respondent
-                new_user = ramp.User(
-                    user_name=user_name, num_users=user_data["num_users"]
-                )
-
                 # Check if this household survey respondent is present in the settlement during this month
                 if month in user_data["months_present"]:
                     present = True
                 else:
                     present = False
 
+                # Reuse the user instance of a previous month with the same presence
+                if (user_name, present) in shared_users:
+                    ramp_users_dict[user_name] = shared_users[(user_name, present)]
+                    continue
+                if not present and (user_name, True) in shared_users:
+                    # Appliances of an absent user only differ by their func_time -> share all other parameters
+                    shared_users[(user_name, False)] = absent_user(
+                        shared_users[(user_name, True)]
+                    )
+                    ramp_users_dict[user_name] = shared_users[(user_name, False)]
+                    continue
+
+                # Create user instance for this household survey respondent
+                new_user = ramp.User(
+                    user_name=user_name, num_users=user_data["num_users"]
+                )
+
                 drinking_water_demand = user_data["drinking_water_demand"]
                 # Drinking water windows
                 # Definition of usage windows is extremely messy. Propose to RAMP core to define usage windows in list?
@@ -597,8 +1652,9 @@ class RampControl:
                     wd_we_type=2,  # Drinking water demand is the same on every weekday
                 )
 
-                # Add deepcopy of user instance to ramp_user_dict
-                ramp_users_dict[user_name] = copy.deepcopy(new_user)
+                # Add user instance to ramp_user_dict and share it with the following months
+                ramp_users_dict[user_name] = new_user
+                shared_users[(user_name, present)] = new_user
 
             # Create RAMP use_case
             drinking_water_use_case = ramp.UseCase(
@@ -613,12 +1669,27 @@ class RampControl:
 
         # List for every month's use case
         service_water_use_cases_list = []
+        # RAMP user instances by (user_name, month-dependent parameters)
+        # -> months with the same parameters share one instance instead of building a copy per month
+        shared_users = {}
 
         for month in range(1, 13):
             # Create dict to store generated RAMP user instances
             ramp_users_dict = {}
             # Loop through every survey respondent.
             for user_name, user_data in input_data.items():
+                # Daily volume of every demand during this month, the only parameter depending on the month
+                month_key = tuple(
+                    demand_data["daily_demand"][month]
+                    for demand_data in user_data["service_water_demands"].values()
+                    if len(demand_data)
+                )
+
+                # Reuse the user instance of a previous month with the same daily volumes
+                if (user_name, month_key) in shared_users:
+                    ramp_users_dict[user_name] = shared_users[(user_name, month_key)]
+                    continue
+
                 # Create user instance for this household survey respondent
                 new_user = ramp.User(
                     user_name=user_name, num_users=user_data["num_users"]
@@ -686,8 +1757,9 @@ class RampControl:
                         wd_we_type=2,  # Service water demand is the same on every day of the week
                     )
 
-                # Add deepcopy of user instance to ramp_user_dict
-                ramp_users_dict[user_name] = copy.deepcopy(new_user)
+                # Add user instance to ramp_user_dict and share it with the following months
+                ramp_users_dict[user_name] = new_user
+                shared_users[(user_name, month_key)] = new_user
 
             # Create RAMP use_case
             service_water_use_case = ramp.UseCase(
@@ -699,6 +1771,47 @@ class RampControl:
         return service_water_use_cases_list
 
 
+def demand_progress(progress, demand_idx, start):
+    """
+    Progress callback of run_use_cases for one demand of run_opti_mg_dat
+    :param progress: progress callback of run_opti_mg_dat
+    :param demand_idx: position of the demand in DEMANDS
+    :param start: time.perf_counter() at the start of run_opti_mg_dat
+    :return: callable progress(demand_name, fraction, elapsed) reporting the fraction of all demands done and the
+        time elapsed since start to progress
+    """
+
+    def report(demand_name, fraction, elapsed):
+        progress(
+            demand_name,
+            (demand_idx + fraction) / len(DEMANDS),
+            time.perf_counter() - start,
+        )
+
+    return report
+
+
+def absent_user(user):
+    """
+    User instance of a survey respondent during the months of absence from the settlement
+    - appliances are shallow copies of the appliances of the present user with func_time (and func_cycle) set to 0
+      -> no demand is modeled, all month-invariant parameters (power, windows, duty cycles) are shared
+    :param user: ramp.User instance of the present survey respondent
+    :return: ramp.User
+    """
+    new_user = ramp.User(user_name=user.user_name, num_users=user.num_users)
+    for appliance in user.App_list:
+        absent_appliance = copy.copy(appliance)
+        absent_appliance.user = new_user
+        absent_appliance.func_time = (
+            0  # func_time is 0 -> therefore no demand is modeled
+        )
+        # func_cycle needs to be set to 0, otherwise RAMP core increases func_time to be >= func_cycle
+        absent_appliance.func_cycle = 0
+        new_user.App_list.append(absent_appliance)
+    return new_user
+
+
 def minutes_wd(window):
     """
     Turns usage window given in hours into minutes (needed for RAMP)
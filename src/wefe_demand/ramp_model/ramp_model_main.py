@@ -98,13 +98,9 @@ all_demands_df["service_water"] = service_water_dp.sum(axis="columns")
 all_demand_df = all_demands_df.resample("h").mean()
 
 # Get average day and week
-all_demands_day = all_demands_df.groupby(
-    all_demands_df.index.strftime("%H"), sort=False
-).mean()
-
-all_demands_week = all_demands_df.groupby(
-    all_demands_df.index.strftime("%a - %H"), sort=False
-).mean()
+typical_profiles = ramp_control.typical_profiles(all_demand_df)
+all_demands_day = typical_profiles["day"]
+all_demands_week = typical_profiles["week"]
 
 # %% Plot results
 from helpers import plotting
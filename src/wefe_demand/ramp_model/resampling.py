@@ -0,0 +1,153 @@
+"""
+Kernels to resample load profiles stored as 2D numpy arrays [day, min_of_day] (1440 one-minute time steps per day)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def check_resolution(resolution):
+    """
+    Check that an output resolution is a whole number of minutes which divides a day
+    :param resolution: length of the output time steps in minutes
+    :return:
+    """
+    if (
+        not isinstance(resolution, (int, np.integer))
+        or resolution <= 0
+        or 1440 % resolution != 0
+    ):
+        raise ValueError(
+            f"Output resolution must be a number of minutes dividing a day (e.g. 5, 15, 30, 60), got {resolution}"
+        )
+
+
+def fold_day_profiles(day_profiles, resolution):
+    """
+    Fold 1-minute profiles of whole days into time steps of resolution minutes
+
+    :param day_profiles: numpy array [..., day, min_of_day], e.g. [day, min_of_day] or [column, day, min_of_day]
+    :param resolution: length of the output time steps in minutes, must divide 1440
+    :return: dict with numpy arrays [..., day, step_of_day] of the "sum" and "max" of every time step, of the type
+        of day_profiles (sums are accumulated in float64)
+    """
+    steps = day_profiles.reshape(
+        *day_profiles.shape[:-1], 1440 // resolution, resolution
+    )
+    return {
+        "sum": steps.sum(axis=-1, dtype=np.float64).astype(
+            day_profiles.dtype, copy=False
+        ),
+        "max": steps.max(axis=-1),
+    }
+
+
+def fold_minute_profiles(minute_profiles, resolution):
+    """
+    Fold 1-minute profiles of whole days stored as columns into time steps of resolution minutes
+    - the array is reshaped to [step_of_timeframe, min_of_step, column] without copying, the sum and max of every
+      time step are computed over this view and the mean is derived from the sum
+
+    :param minute_profiles: 2D numpy array [min_of_timeframe, column], e.g. the values of a 1-minute dataframe
+    :param resolution: length of the output time steps in minutes, must divide 1440
+    :return: dict with 2D numpy arrays [step_of_timeframe, column] of the "sum", "mean" and "max" of every time step,
+        of the type of minute_profiles (sums are accumulated in float64)
+    """
+    steps = minute_profiles.reshape(-1, resolution, minute_profiles.shape[1])
+    step_sums = steps.sum(axis=1, dtype=np.float64)
+    return {
+        "sum": step_sums.astype(minute_profiles.dtype, copy=False),
+        "mean": (step_sums / resolution).astype(minute_profiles.dtype, copy=False),
+        "max": steps.max(axis=1),
+    }
+
+
+def group_day_means(day_profiles, day_groups, num_groups):
+    """
+    Mean profile of the days of every group of days, e.g. of every weekday or month
+    - the days of every group are summed by a product with a [group, day] indicator matrix, without sorting or
+      copying the profiles
+
+    :param day_profiles: numpy array [day, ...], e.g. [day, step_of_day, column]
+    :param day_groups: group (0 to num_groups - 1) of every day
+    :param num_groups: number of groups
+    :return: numpy array [group, ...] of the mean profile of every group, NaN for groups without days
+    """
+    dtype = np.result_type(day_profiles.dtype, np.float32)
+    indicator = (
+        np.arange(num_groups)[:, None] == np.asarray(day_groups)[None, :]
+    ).astype(dtype)
+    group_sums = indicator @ day_profiles.reshape(len(day_profiles), -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        group_means = group_sums / indicator.sum(axis=1)[:, None]
+    return group_means.reshape(num_groups, *day_profiles.shape[1:])
+
+
+def steps_timeseries(start_date, number_of_days, resolution):
+    """
+    Datetime index of the time steps of a resampled timeframe
+    :param start_date: first day of the timeframe
+    :param number_of_days: number of days of the timeframe
+    :param resolution: length of the time steps in minutes
+    :return: pd.DatetimeIndex
+    """
+    return pd.date_range(
+        start_date,
+        periods=number_of_days * (1440 // resolution),
+        # Timedelta frequencies are normalised, e.g. 60 minutes -> hourly like pandas' resample("h")
+        freq=pd.Timedelta(minutes=resolution),
+    )
+
+
+def column_index(columns):
+    """
+    Index of the columns of a dataframe of load profiles
+    :param columns: list of columns, see RampControl.profile_column
+    :return: pd.MultiIndex [user, appliance] if columns are tuples, pd.Index otherwise
+    """
+    if columns and isinstance(columns[0], tuple):
+        return pd.MultiIndex.from_tuples(columns)
+    return pd.Index(columns)
+
+
+def profiles_to_dataframe(profiles_buffer, columns, index):
+    """
+    Dataframe upon a buffer [column, day, step_of_day] of load profiles, without copying it
+    :param profiles_buffer: 3D numpy array (or memory map) [column, day, step_of_day]
+    :param columns: column of every profile of profiles_buffer
+    :param index: datetime index of all time steps of the days of profiles_buffer
+    :return:
+    """
+    # pandas stores the values of a dataframe as [column, row] block, which is the layout of the buffer once
+    # days and steps of day are flattened to [column, step]
+    df = pd.DataFrame(
+        profiles_buffer.reshape(len(columns), len(index)).T,
+        index=index,
+        columns=column_index(columns),
+        copy=False,
+    )
+    df.index.name = "datetime"
+    return df
+
+
+def resampled_dataframes(folded_profiles, columns, start_date, resolution, dtype):
+    """
+    "sum", "mean" and "max" dataframes of profiles folded by fold_day_profiles
+    :param folded_profiles: dict with 3D numpy arrays [column, day, step_of_day] of the "sum" and "max"
+    :param columns: column of every profile
+    :param start_date: first day of the profiles
+    :param resolution: length of the time steps in minutes
+    :param dtype: floating point type of the dataframes
+    :return: dict with the "sum", "mean" and "max" dataframes of every time step
+    """
+    steps_index = steps_timeseries(
+        start_date, folded_profiles["sum"].shape[1], resolution
+    )
+    resampled_dfs = {
+        stat: profiles_to_dataframe(
+            folded_profiles[stat].astype(dtype, copy=False), columns, steps_index
+        )
+        for stat in ("sum", "max")
+    }
+    resampled_dfs["mean"] = resampled_dfs["sum"] / resolution
+    return resampled_dfs
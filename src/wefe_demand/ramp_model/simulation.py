@@ -0,0 +1,593 @@
+"""
+Work units to simulate RAMP use cases independently of each other
+
+A work unit is one user type (= ramp.User instance) of one monthly use case during the days of this month.
+Work units share no state, they can therefore be simulated one after another or spread over a pool of
+worker processes and merged afterwards.
+
+RAMP draws its random numbers from the global state of the random module. If a seed is given, this state is
+reset from an independent stream for every user and appliance of a work unit, so results do not depend on the
+number of workers, on the order in which work units are scheduled or on the other appliances of the user.
+"""
+
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from wefe_demand.helpers.exceptions import SimulationCancelled
+from wefe_demand.helpers.instrumentation import instrumented
+from wefe_demand.ramp_model.events import profile_events
+from wefe_demand.ramp_model.expected_value import expected_daily_profile
+from wefe_demand.ramp_model.resampling import fold_day_profiles
+from wefe_demand.ramp_model.vectorized import sample_user_type_profile
+
+# Engines generating the load profiles of a work unit
+# - "ramp": stochastic sampling of every user and day with ramp.Appliance.generate_load_profile
+# - "expected": analytical expected value of the RAMP load profiles, see expected_value
+# - "vectorized": stochastic sampling of all users and days of a work unit at once with numpy, see vectorized
+ENGINES = ("ramp", "expected", "vectorized")
+
+# One user type of one use case during a batch of days
+# - use_case_idx: position of the use case in the list of (use_case, month) tuples
+# - user_idx: position of the user type in the use case's users
+# - day_indexes: position of the simulated days in the modeled timeframe
+# - day_types: RAMP day type of every simulated day (0->working day, 1->holiday)
+# - peak_time_range: peak time range of the use case
+# - seed: seed of the work unit's random streams (None -> use the current random state)
+# - appliance_idxs: position of the simulated appliances in the user's App_list (None -> all appliances)
+WorkUnit = namedtuple(
+    "WorkUnit",
+    [
+        "use_case_idx",
+        "user_idx",
+        "day_indexes",
+        "day_types",
+        "peak_time_range",
+        "seed",
+        "appliance_idxs",
+    ],
+    defaults=(None,),
+)
+
+# Maximal time in seconds between two calls of the heartbeat of run_work_units while waiting for worker processes
+HEARTBEAT_INTERVAL = 1.0
+
+# List of (use_case, month) tuples of the demand simulated by this worker process, set by init_worker
+_worker_use_cases_list = None
+
+# multiprocessing.Event set once the simulation of this worker process is cancelled, set by reseed_worker
+_worker_cancel_event = None
+
+
+def derive_seed(seed, *keys):
+    """
+    Derive the seed of an independent random stream from a root seed and the keys identifying the stream
+    - e.g. derive_seed(seed, demand, user_name, month) -> seed of this user type during this month
+    - keys can be integers or strings, strings are hashed so the result is stable between Python sessions
+
+    :param seed: root seed (int)
+    :param keys: keys identifying the random stream
+    :return: seed of the random stream (int)
+    """
+    spawn_key = tuple(
+        (
+            key
+            if isinstance(key, (int, np.integer))
+            else int.from_bytes(
+                hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little"
+            )
+        )
+        for key in keys
+    )
+    seed_sequence = np.random.SeedSequence(seed, spawn_key=spawn_key)
+    return int(seed_sequence.generate_state(1, dtype=np.uint64)[0])
+
+
+def seed_random_state(seed):
+    """
+    Reset the global random states RAMP draws its random numbers from
+    :param seed:
+    :return:
+    """
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+
+@instrumented()
+def simulate_work_unit(
+    user,
+    day_types,
+    peak_time_range,
+    seed=None,
+    resolution=None,
+    sum_appliances=False,
+    engine="ramp",
+    pool_size=None,
+    appliance_idxs=None,
+    dtype=np.float64,
+    events=False,
+    load=False,
+    heartbeat=None,
+):
+    """
+    Simulate the load profiles of all users of one user type for a batch of days
+
+    :param user: ramp.User instance of the user type
+    :param day_types: RAMP day type of every day of the batch (0->working day, 1->holiday)
+    :param peak_time_range: peak time range of the use case the user belongs to
+    :param seed: seed of the work unit. If given, every user of the user type is simulated with its own random
+        stream derived from this seed
+    :param resolution: if given, the profiles are folded into time steps of resolution minutes before they are
+        returned, see resampling.fold_day_profiles
+    :param sum_appliances: if True, the profiles of all appliances are summed into one profile of the user type
+    :param engine: engine generating the load profiles, one of ENGINES
+    :param pool_size: if given, user types with more than pool_size users are simulated by bootstrap resampling from
+        a pool of pool_size user-days per day type, see add_bootstrap_profiles. Only used by the "ramp" engine
+    :param appliance_idxs: position of the appliances to simulate in the user's App_list. If None (default), all
+        appliances of the user are simulated
+    :param dtype: floating point type of the returned profiles. Profiles are accumulated in float64 and only cast
+        to dtype when returned
+    :param events: if True, the event lists of the profiles are returned instead of arrays (resolution is then not
+        used), see events.profile_events
+    :param load: if True, the 1-minute load of the work unit (sum of all its profiles in float64, [day_of_batch,
+        min_of_day], None without profile) is returned with the profiles, whatever resolution and events, e.g. for
+        load_statistics.LoadStatistics
+    :return: dict with a 2D numpy array [day_of_batch, min_of_day] for every appliance of the user (or one entry
+        with the user_name as key if sum_appliances). If resolution is given, dict with the folded "sum" and "max"
+        arrays for every entry instead. If events, dict with the events.LoadEvents of every entry instead, the
+        profile of an event is its day of the batch. If load, (profiles, load) with the 1-minute load of the work
+        unit instead
+    :param heartbeat: if given, function without argument called before every user ("ramp" engine), every user-day
+        of the pool (bootstrap) or every appliance ("vectorized" engine). An exception raised by heartbeat stops the
+        work unit, e.g. SimulationCancelled once the simulation is cancelled
+    """
+    if appliance_idxs is None:
+        appliance_idxs = range(len(user.App_list))
+    # Key of the profile each simulated appliance's load profile is added to
+    all_profile_keys = unit_profile_keys(user, sum_appliances)
+    profile_keys = [all_profile_keys[appliance_idx] for appliance_idx in appliance_idxs]
+
+    # Pre-allocate 1440 (minute) timesteps for each day of the batch and every profile
+    # The loads of all users and appliances are summed in float64, rounding to dtype only once when returned
+    unit_profiles = {
+        key: np.zeros((len(day_types), 1440), dtype=np.float64) for key in profile_keys
+    }
+
+    if engine == "expected":
+        add_expected_profiles(
+            user,
+            appliance_idxs,
+            day_types,
+            peak_time_range,
+            unit_profiles,
+            profile_keys,
+        )
+    elif engine == "vectorized":
+        add_vectorized_profiles(
+            user,
+            appliance_idxs,
+            day_types,
+            peak_time_range,
+            seed,
+            unit_profiles,
+            profile_keys,
+            heartbeat,
+        )
+    elif pool_size is not None and user.num_users > pool_size:
+        add_bootstrap_profiles(
+            user,
+            appliance_idxs,
+            day_types,
+            peak_time_range,
+            seed,
+            unit_profiles,
+            profile_keys,
+            pool_size,
+            heartbeat,
+        )
+    else:
+        add_ramp_profiles(
+            user,
+            appliance_idxs,
+            day_types,
+            peak_time_range,
+            seed,
+            unit_profiles,
+            profile_keys,
+            heartbeat,
+        )
+
+    unit_load = None
+    if load:
+        for profiles in unit_profiles.values():
+            unit_load = profiles.copy() if unit_load is None else unit_load + profiles
+
+    if events:
+        # Only keep the runs of minutes of constant, non-zero load -> few events for sparse profiles
+        returned_profiles = {
+            profile_key: profile_events(profiles.astype(dtype, copy=False))
+            for profile_key, profiles in unit_profiles.items()
+        }
+    elif resolution is not None:
+        # Only keep the output resolution -> 1-minute profiles of a work unit are never merged
+        returned_profiles = {
+            profile_key: {
+                stat: stat_profiles.astype(dtype, copy=False)
+                for stat, stat_profiles in fold_day_profiles(
+                    profiles, resolution
+                ).items()
+            }
+            for profile_key, profiles in unit_profiles.items()
+        }
+    else:
+        returned_profiles = {
+            profile_key: profiles.astype(dtype, copy=False)
+            for profile_key, profiles in unit_profiles.items()
+        }
+    if load:
+        return returned_profiles, unit_load
+    return returned_profiles
+
+
+def unit_profile_keys(user, sum_appliances):
+    """
+    Key of the work unit's profile every appliance of the user is added to
+    :param user: ramp.User instance of the user type
+    :param sum_appliances: if True, all appliances are added to one profile with the user_name as key, otherwise
+        every appliance to a profile with its name as key
+    :return: list with one key per appliance of the user's App_list
+    """
+    if sum_appliances:
+        return [user.user_name for _ in user.App_list]
+    return [appliance.name for appliance in user.App_list]
+
+
+def add_ramp_profiles(
+    user,
+    appliance_idxs,
+    day_types,
+    peak_time_range,
+    seed,
+    unit_profiles,
+    profile_keys,
+    heartbeat=None,
+):
+    """
+    Sample the load profiles of all users of one user type with RAMP and add them to unit_profiles
+    :param user: ramp.User instance of the user type
+    :param appliance_idxs: position of the simulated appliances in the user's App_list
+    :param day_types: RAMP day type of every day of the batch
+    :param peak_time_range: peak time range of the use case the user belongs to
+    :param seed: seed of the work unit or None
+    :param unit_profiles: dict of 2D numpy arrays [day_of_batch, min_of_day] the profiles are added to
+    :param profile_keys: key of unit_profiles every simulated appliance is added to
+    :param heartbeat: function without argument called before every user, see simulate_work_unit
+    :return:
+    """
+    # Loop through each user of this user type
+    for user_number in range(user.num_users):
+        if heartbeat is not None:
+            heartbeat()
+        # Loop through user's appliances
+        for appliance_idx, profile_key in zip(appliance_idxs, profile_keys):
+            appliance = user.App_list[appliance_idx]
+            if seed is not None:
+                # Independent random stream for every user and appliance of the user type
+                seed_random_state(derive_seed(seed, user_number, appliance_idx))
+
+            for day_idx, day_type in enumerate(day_types):
+                # --- Generate appliance load profile ---
+                # Generate a daylong profile with 1-min resolution (1440 time steps) for this appliance
+                # Load profile is not returned but saved in the appliance's daily_use attribute
+                appliance.generate_load_profile(
+                    prof_i=0,  # Day of the year in RAMP core. Not used here, thus always 0
+                    peak_time_range=peak_time_range,
+                    day_type=int(day_type),  # Day type: 0->working day, 1->holiday
+                    power=appliance.power,  # Power of the appliance at this day
+                )
+
+                # Add this appliance load profile to the day's load profile
+                unit_profiles[profile_key][day_idx] += appliance.daily_use
+
+
+def add_bootstrap_profiles(
+    user,
+    appliance_idxs,
+    day_types,
+    peak_time_range,
+    seed,
+    unit_profiles,
+    profile_keys,
+    pool_size,
+    heartbeat=None,
+):
+    """
+    Build the load profiles of all users of one user type by bootstrap resampling from a pool of RAMP user-days
+    - for every day type of the batch, pool_size daylong profiles of a single user are sampled with RAMP
+    - every day of the batch is the sum of num_users profiles drawn from the pool of its day type with replacement
+    - all appliances of a drawn user-day are kept together, so the pool holds whole user-days
+    The runtime grows with pool_size and the number of days, not with num_users.
+
+    Error bound: a day of the bootstrap aggregate is a sum of num_users draws from the empirical distribution of the
+    pool instead of the distribution of RAMP user-days. Both have the same expected value up to the sampling error
+    of the pool mean, so
+    - the relative standard error of the energy is cv_e / sqrt(pool_size), with cv_e the coefficient of variation
+      of the daily energy of a single user-day (e.g. cv_e = 1, pool_size = 100 -> 10%, at most ~3 sigma)
+    - at every minute t, the relative standard error of the aggregate's expected value is cv_t / sqrt(pool_size),
+      with cv_t the coefficient of variation of a single user-day at minute t (usually larger than cv_e). Peaks are
+      the maximum over minutes, they pick up the positive errors and are biased upwards by up to ~3 cv_t /
+      sqrt(pool_size). Coarser output resolutions average these errors over the minutes of a time step
+    - the pool is drawn once per work unit, these errors are therefore correlated between the days of the batch
+      and do not average out over a month
+    The day-to-day variability of the aggregate (num_users draws per day) is preserved.
+
+    :param user: ramp.User instance of the user type
+    :param appliance_idxs: position of the simulated appliances in the user's App_list
+    :param day_types: RAMP day type of every day of the batch
+    :param peak_time_range: peak time range of the use case the user belongs to
+    :param seed: seed of the work unit or None
+    :param unit_profiles: dict of 2D numpy arrays [day_of_batch, min_of_day] the profiles are added to
+    :param profile_keys: key of unit_profiles every simulated appliance is added to
+    :param pool_size: number of user-days in the pool of every day type
+    :param heartbeat: function without argument called before every user-day of the pool, see simulate_work_unit
+    :return:
+    """
+    # Random generator drawing the user-days from the pool
+    generator = np.random.default_rng(
+        None if seed is None else derive_seed(seed, "bootstrap")
+    )
+
+    for day_type in np.unique(day_types):
+        # Pool of single user-days [appliance, pool_idx, min_of_day]
+        pool = np.zeros(
+            (len(appliance_idxs), pool_size, 1440),
+            dtype=unit_profiles[profile_keys[0]].dtype,
+        )
+        for pool_idx in range(pool_size):
+            if heartbeat is not None:
+                heartbeat()
+            for pool_appliance_idx, appliance_idx in enumerate(appliance_idxs):
+                appliance = user.App_list[appliance_idx]
+                if seed is not None:
+                    # Independent random stream for every user-day and appliance of the pool
+                    seed_random_state(
+                        derive_seed(
+                            seed, "pool", int(day_type), pool_idx, appliance_idx
+                        )
+                    )
+                appliance.generate_load_profile(
+                    prof_i=0,  # Day of the year in RAMP core. Not used here, thus always 0
+                    peak_time_range=peak_time_range,
+                    day_type=int(day_type),  # Day type: 0->working day, 1->holiday
+                    power=appliance.power,  # Power of the appliance at this day
+                )
+                pool[pool_appliance_idx, pool_idx] = appliance.daily_use
+
+        # Number of times every user-day of the pool is drawn on each day [day, pool_idx]
+        day_mask = day_types == day_type
+        draws = generator.multinomial(
+            user.num_users, np.full(pool_size, 1 / pool_size), size=day_mask.sum()
+        )
+
+        for pool_appliance_idx, profile_key in enumerate(profile_keys):
+            unit_profiles[profile_key][day_mask] += draws @ pool[pool_appliance_idx]
+
+
+def add_vectorized_profiles(
+    user,
+    appliance_idxs,
+    day_types,
+    peak_time_range,
+    seed,
+    unit_profiles,
+    profile_keys,
+    heartbeat=None,
+):
+    """
+    Sample the load profiles of all users of one user type with the vectorized sampler and add them to unit_profiles
+    - all users and days of the batch are sampled at once, see vectorized.sample_user_type_profile
+    :param user: ramp.User instance of the user type
+    :param appliance_idxs: position of the simulated appliances in the user's App_list
+    :param day_types: RAMP day type of every day of the batch
+    :param peak_time_range: peak time range of the use case the user belongs to
+    :param seed: seed of the work unit or None
+    :param unit_profiles: dict of 2D numpy arrays [day_of_batch, min_of_day] the profiles are added to
+    :param profile_keys: key of unit_profiles every simulated appliance is added to
+    :param heartbeat: function without argument called before every appliance, see simulate_work_unit
+    :return:
+    """
+    for appliance_idx, profile_key in zip(appliance_idxs, profile_keys):
+        if heartbeat is not None:
+            heartbeat()
+        # Independent random stream for every appliance of the user type
+        generator = np.random.default_rng(
+            None if seed is None else derive_seed(seed, "vectorized", appliance_idx)
+        )
+        unit_profiles[profile_key] += sample_user_type_profile(
+            user.App_list[appliance_idx],
+            user.num_users,
+            day_types,
+            peak_time_range,
+            generator,
+            dtype=unit_profiles[profile_key].dtype,
+        )
+
+
+def add_expected_profiles(
+    user, appliance_idxs, day_types, peak_time_range, unit_profiles, profile_keys
+):
+    """
+    Add the expected load profiles of all users of one user type to unit_profiles
+    - the expected profile of each appliance is computed once per day type and multiplied by num_users
+    :param user: ramp.User instance of the user type
+    :param appliance_idxs: position of the simulated appliances in the user's App_list
+    :param day_types: RAMP day type of every day of the batch
+    :param peak_time_range: expected peak time range of the use case, see expected_value.expected_peak_time_range
+    :param unit_profiles: dict of 2D numpy arrays [day_of_batch, min_of_day] the profiles are added to
+    :param profile_keys: key of unit_profiles every simulated appliance is added to
+    :return:
+    """
+    for appliance_idx, profile_key in zip(appliance_idxs, profile_keys):
+        appliance = user.App_list[appliance_idx]
+        for day_type in np.unique(day_types):
+            unit_profiles[profile_key][day_types == day_type] += (
+                expected_daily_profile(appliance, peak_time_range, int(day_type))
+                * user.num_users
+            )
+
+
+def init_worker(use_cases_list, cancel_event=None):
+    """
+    Initializer of the worker processes: store the use cases once per worker instead of sending them with every
+    work unit
+    :param use_cases_list: list of (use_case, month) tuples
+    :param cancel_event: see reseed_worker
+    :return:
+    """
+    global _worker_use_cases_list
+    _worker_use_cases_list = use_cases_list
+    reseed_worker(cancel_event)
+
+
+def reseed_worker(cancel_event=None):
+    """
+    Initializer of worker processes: forked workers inherit the random state of the parent process, draw a fresh
+    state for every worker instead
+    :param cancel_event: multiprocessing.Event set by the parent process to cancel the simulation of the worker, see
+        check_cancelled
+    :return:
+    """
+    global _worker_cancel_event
+    _worker_cancel_event = cancel_event
+    random.seed()
+    np.random.seed()
+
+
+def check_cancelled(*args):
+    """
+    Raise SimulationCancelled if the parent process cancelled the simulation of this worker process
+    - heartbeat of the work units simulated in worker processes, can also be passed as progress callback of
+      RampControl.run_use_cases
+    :param args: ignored
+    :return:
+    """
+    if _worker_cancel_event is not None and _worker_cancel_event.is_set():
+        raise SimulationCancelled("The simulation was cancelled")
+
+
+def wait_result(future, heartbeat=None, interval=HEARTBEAT_INTERVAL):
+    """
+    Wait for the result of a concurrent.futures.Future
+    :param future: concurrent.futures.Future
+    :param heartbeat: if given, function without argument called every interval seconds while waiting. An exception
+        raised by heartbeat stops waiting
+    :param interval: time in seconds between two calls of heartbeat
+    :return: result of the future
+    """
+    while True:
+        try:
+            return future.result(timeout=None if heartbeat is None else interval)
+        except concurrent.futures.TimeoutError:
+            heartbeat()
+
+
+def simulate_work_unit_in_worker(work_unit, **simulation_options):
+    """
+    Simulate a work unit in a worker process initialized with init_worker
+    - the work unit stops at its next user once the parent process cancelled the simulation, see check_cancelled
+    :param work_unit: WorkUnit
+    :param simulation_options: keyword arguments passed to simulate_work_unit
+    :return: see simulate_work_unit
+    """
+    user = _worker_use_cases_list[work_unit.use_case_idx][0].users[work_unit.user_idx]
+    return simulate_work_unit(
+        user,
+        work_unit.day_types,
+        work_unit.peak_time_range,
+        seed=work_unit.seed,
+        appliance_idxs=work_unit.appliance_idxs,
+        heartbeat=check_cancelled,
+        **simulation_options,
+    )
+
+
+def run_work_units(
+    use_cases_list, work_units, n_jobs=1, heartbeat=None, **simulation_options
+):
+    """
+    Simulate a list of work units, either serially or in a pool of worker processes
+    - results are yielded in the order of work_units, whatever the number of workers
+    - closing the generator or an exception raised by heartbeat (e.g. cancelled simulation) stops the simulation
+      without waiting for the work units being simulated: work units not started yet are dropped, work units
+      being simulated in worker processes stop at their next user
+
+    :param use_cases_list: list of (use_case, month) tuples the work units refer to
+    :param work_units: list of WorkUnit
+    :param n_jobs: number of worker processes. 1 simulates in the current process, -1 uses all CPU cores
+    :param heartbeat: if given, function without argument called regularly while work units are simulated: before
+        every user in the current process (see simulate_work_unit), every HEARTBEAT_INTERVAL seconds while waiting
+        for worker processes
+    :param simulation_options: keyword arguments passed to simulate_work_unit (e.g. resolution)
+    :return: generator of the results of simulate_work_unit
+    """
+    n_jobs = resolve_n_jobs(n_jobs)
+
+    if n_jobs == 1 or len(work_units) < 2:
+        for work_unit in work_units:
+            user = use_cases_list[work_unit.use_case_idx][0].users[work_unit.user_idx]
+            yield simulate_work_unit(
+                user,
+                work_unit.day_types,
+                work_unit.peak_time_range,
+                seed=work_unit.seed,
+                appliance_idxs=work_unit.appliance_idxs,
+                heartbeat=heartbeat,
+                **simulation_options,
+            )
+    else:
+        # Set to stop the work units being simulated by the workers, see check_cancelled
+        cancel_event = multiprocessing.Event()
+        # No with statement: leaving it would wait for the work units being simulated
+        executor = ProcessPoolExecutor(
+            max_workers=min(n_jobs, len(work_units)),
+            initializer=init_worker,
+            initargs=(use_cases_list, cancel_event),
+        )
+        try:
+            futures = [
+                executor.submit(
+                    partial(simulate_work_unit_in_worker, **simulation_options),
+                    work_unit,
+                )
+                for work_unit in work_units
+            ]
+            for future in futures:
+                yield wait_result(future, heartbeat)
+        except BaseException:
+            # Generator closed early (GeneratorExit), cancelled simulation or failed work unit
+            cancel_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+
+def resolve_n_jobs(n_jobs):
+    """
+    Turn the n_jobs argument into a number of worker processes
+    - None or 1 -> 1 (serial simulation)
+    - negative values count back from the number of CPU cores (-1 -> all cores, -2 -> all but one, ...)
+    :param n_jobs:
+    :return: number of worker processes (>= 1)
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+    return max(1, n_jobs)
@@ -0,0 +1,578 @@
+"""
+Vectorized sampling of RAMP load profiles
+
+ramp.Appliance.generate_load_profile samples the switch-on events of one appliance during one day in Python. This
+module samples the same steps for a whole batch of profiles (all users of a user type during all days of a work
+unit) with numpy array operations, one switch-on event of every profile at a time:
+- the days the appliance is used on (wd_we_type, occasional_use)
+- the randomised usage windows (window_1-3, random_var_w)
+- the randomised total time of use (func_time, time_fraction_random_variability, func_cycle)
+- switch-on events of at least func_cycle minutes drawn uniformly within the remaining free time of the windows,
+  until the total time of use is reached
+- the coincident switch-ons inside and outside the peak time range (number, fixed)
+- the power of each event (power, thermal_p_var) or the randomised duty cycle (fixed_cycle=1, p_11/t_11, p_12/t_12,
+  r_c1, cw11/cw12) repeated during the event
+- flat appliances (flat="yes") switched on during their whole windows
+
+Profiles follow the same distribution as RAMP's, they are not identical draws: random numbers come from a numpy
+Generator and not from the global random state. Differences to RAMP:
+- a func_cycle of 0 is handled as events of at least 1 minute (RAMP fails on empty events)
+- an event of a duty cycle appliance outside the duty cycle windows is drawn again at most MAX_DRAWS times, then the
+  profile is left without further events (RAMP retries until the recursion limit)
+- only appliances without or with one duty cycle (fixed_cycle 0 or 1) are supported
+
+The statistics of the profiles of both engines are compared appliance by appliance by helpers.vectorized_validation.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from wefe_demand.ramp_model.expected_value import MU_PEAK, OP_FACTOR, S_PEAK
+
+# Maximal number of profiles sampled at once, bounds the memory of a batch (about 30 MB per 1000 profiles)
+MAX_BATCH_PROFILES = 2048
+
+# Maximal number of draws of a switch-on event of a duty cycle appliance within its duty cycle windows
+MAX_DRAWS = 100
+
+# Value of the minutes of the randomised windows without switch-on event, like in RAMP's daily_use
+WINDOW_MASK_VALUE = 0.001
+
+# Start and stop of free ranges which contain no minute of the day
+NO_MINUTE = 1441
+
+# Switch-on events of a batch of profiles, one entry per event
+# - profile: position of the profile in the batch
+# - switch_on: minute of the day the event starts
+# - duration: duration of the event in minutes
+# - power_1, duration_1, power_2, cycle_length: the event draws power_1 during the first duration_1 minutes of
+#   every cycle of cycle_length minutes and power_2 during the rest of the cycle (cycle_length = duration_1 =
+#   duration for events of constant power). Powers include the coincident switch-ons
+SwitchOnEvents = namedtuple(
+    "SwitchOnEvents",
+    [
+        "profile",
+        "switch_on",
+        "duration",
+        "power_1",
+        "duration_1",
+        "power_2",
+        "cycle_length",
+    ],
+)
+
+
+def check_vectorized_appliance(appliance):
+    """
+    Check that the vectorized sampler supports an appliance
+    :param appliance: ramp.Appliance
+    :return:
+    """
+    if appliance.fixed_cycle > 1:
+        raise ValueError(
+            f"The vectorized engine supports appliances with at most one duty cycle, appliance "
+            f"'{appliance.name}' has fixed_cycle={appliance.fixed_cycle}. Use the 'ramp' engine instead"
+        )
+
+
+def sample_user_type_profile(
+    appliance, num_users, day_types, peak_time_range, generator, dtype=np.float64
+):
+    """
+    Sum of the load profiles of one appliance of all users of a user type on every day of a batch
+    - users are sampled in batches of at most MAX_BATCH_PROFILES user-days
+    :param appliance: ramp.Appliance
+    :param num_users: number of users of the user type
+    :param day_types: RAMP day type of every day of the batch (0->working day, 1->holiday)
+    :param peak_time_range: peak time range of the use case the user belongs to
+    :param generator: numpy random Generator
+    :param dtype: floating point type of the returned profiles
+    :return: 2D numpy array [day_of_batch, min_of_day]
+    """
+    check_vectorized_appliance(appliance)
+    day_types = np.asarray(day_types)
+    num_days = len(day_types)
+    profiles = np.zeros((num_days, 1440), dtype=dtype)
+    users_per_batch = max(1, MAX_BATCH_PROFILES // max(num_days, 1))
+    for first_user in range(0, num_users, users_per_batch):
+        batch_users = min(users_per_batch, num_users - first_user)
+        # Profiles of the batch [user, day] are flattened to rows
+        batch_profiles = sample_load_profiles(
+            appliance, np.tile(day_types, batch_users), peak_time_range, generator
+        )
+        profiles += batch_profiles.reshape(batch_users, num_days, 1440).sum(axis=0)
+    return profiles
+
+
+def sample_load_profiles(appliance, day_types, peak_time_range, generator):
+    """
+    Sample independent daylong load profiles of one appliance of a single user, see ramp.Appliance.generate_load_profile
+    :param appliance: ramp.Appliance
+    :param day_types: RAMP day type of every sampled profile (0->working day, 1->holiday)
+    :param peak_time_range: peak time range of the use case the user belongs to
+    :param generator: numpy random Generator
+    :return: 2D numpy array [profile, min_of_day]
+    """
+    day_types = np.asarray(day_types)
+
+    # Days the appliance is used on
+    used = generator.random(len(day_types)) <= appliance.occasional_use
+    if appliance.wd_we_type != 2:
+        used &= day_types == appliance.wd_we_type
+    if (
+        appliance.pref_index != 0
+        and appliance.user.rand_daily_pref != appliance.pref_index
+    ) or appliance.func_time == 0:
+        used[:] = False
+    rows = np.flatnonzero(used)
+    if rows.size == 0:
+        return np.zeros((len(day_types), 1440))
+
+    # Randomised start and end of the 3 windows [window, profile]
+    window_starts, window_ends = random_windows(appliance, rows.size, generator)
+    in_windows = window_mask(window_starts, window_ends)
+
+    rand_time = random_total_time_of_use(
+        appliance, (window_ends - window_starts).sum(axis=0), generator
+    )
+
+    if appliance.flat == "yes":
+        # Flat appliances are switched on with all copies during their whole windows
+        daily_use = in_windows * (appliance.power[0] * appliance.number)
+    else:
+        daily_use = np.where(in_windows, WINDOW_MASK_VALUE, 0.0)
+        write_events(
+            daily_use,
+            sample_switch_on_events(
+                appliance,
+                window_starts,
+                window_ends,
+                rand_time,
+                peak_time_range,
+                generator,
+            ),
+        )
+
+    if rows.size == len(day_types):
+        return daily_use
+    profiles = np.zeros((len(day_types), 1440))
+    profiles[rows] = daily_use
+    return profiles
+
+
+def window_mask(window_starts, window_ends):
+    """
+    :param window_starts: 2D numpy array [window, profile] of the first minute of the windows
+    :param window_ends: 2D numpy array [window, profile] of the minute after the windows
+    :return: 2D boolean numpy array [profile, min_of_day], True within any window
+    """
+    size = window_starts.shape[1]
+    window_starts = np.clip(window_starts, 0, 1440)
+    window_ends = np.clip(window_ends, window_starts, 1440)
+    # +1 at the start and -1 at the end of every window, the cumulative sum counts the windows of every minute
+    window_changes = np.zeros((size, 1441), dtype=np.int8)
+    profile_idx = np.tile(np.arange(size), len(window_starts))
+    np.add.at(window_changes, (profile_idx, window_starts.reshape(-1)), 1)
+    np.add.at(window_changes, (profile_idx, window_ends.reshape(-1)), -1)
+    return np.cumsum(window_changes[:, :1440], axis=1, dtype=np.int8) > 0
+
+
+def random_windows(appliance, size, generator):
+    """
+    Randomise the windows of use, see ramp.Appliance.calc_rand_window
+    :param appliance: ramp.Appliance
+    :param size: number of profiles
+    :param generator: numpy random Generator
+    :return: 2D numpy arrays [window, profile] of the start and end minutes of the windows
+    """
+    window_starts = np.empty((3, size), dtype=np.int64)
+    window_ends = np.empty((3, size), dtype=np.int64)
+    for window_idx in range(3):
+        window = getattr(appliance, f"window_{window_idx + 1}")
+        random_var = getattr(appliance, f"random_var_{window_idx + 1}")
+        window_starts[window_idx] = np.maximum(
+            generator.integers(
+                window[0] - random_var, window[0] + random_var, size, endpoint=True
+            ),
+            0,
+        )
+        window_ends[window_idx] = np.minimum(
+            generator.integers(
+                window[1] - random_var, window[1] + random_var, size, endpoint=True
+            ),
+            1440,
+        )
+    return window_starts, window_ends
+
+
+def random_total_time_of_use(appliance, total_time, generator):
+    """
+    Randomised total time of use of every profile, see ramp.Appliance.rand_total_time_of_use
+    :param appliance: ramp.Appliance
+    :param total_time: time of the randomised windows of every profile in minutes
+    :param generator: numpy random Generator
+    :return: 1D numpy array of int
+    """
+    size = len(total_time)
+    random_var_t = random_uniform(
+        generator,
+        1 - appliance.time_fraction_random_variability,
+        1 + appliance.time_fraction_random_variability,
+        size,
+    )
+    rand_time = np.round(
+        random_uniform(
+            generator,
+            appliance.func_time,
+            (appliance.func_time * random_var_t).astype(np.int64),
+            size,
+        )
+    ).astype(np.int64)
+    rand_time = np.maximum(rand_time, appliance.func_cycle)
+    # The total time of use does not exceed the time available in the windows
+    rand_time = np.where(
+        rand_time > 0.99 * total_time, (0.99 * total_time).astype(np.int64), rand_time
+    )
+    if np.any(rand_time < appliance.func_cycle):
+        raise ValueError(
+            f"The func_cycle you choose for appliance {appliance.name} might be too large to fit in the available "
+            f"time for appliance usage, please either reduce func_cycle or increase the windows of use of the appliance"
+        )
+    return rand_time
+
+
+def sample_switch_on_events(
+    appliance, window_starts, window_ends, rand_time, peak_time_range, generator
+):
+    """
+    Draw switch-on events until the total time of use of every profile is reached, see steps 2c-2e of
+    ramp.Appliance.generate_load_profile
+    - like RAMP, every profile keeps a list of free ranges of minutes per window. An event is drawn uniformly among
+      the switch-on minutes of all free ranges and splits the first free range containing it in two
+    - all profiles draw their n-th event at the same time, the cost of an event is independent of the 1440 minutes
+    :param appliance: ramp.Appliance
+    :param window_starts: 2D numpy array [window, profile] of the first minute of the randomised windows
+    :param window_ends: 2D numpy array [window, profile] of the minute after the randomised windows
+    :param rand_time: randomised total time of use of every profile
+    :param peak_time_range: peak time range of the use case the user belongs to
+    :param generator: numpy random Generator
+    :return: SwitchOnEvents
+    """
+    size = len(rand_time)
+    func_cycle = max(int(appliance.func_cycle), 1)
+    if appliance.fixed_cycle > 0:
+        # Randomised duty cycle of every profile, see ramp.Appliance.assign_random_cycles
+        cycle_powers = [
+            random_uniform(
+                generator,
+                1 - appliance.thermal_p_var,
+                1 + appliance.thermal_p_var,
+                size,
+            )
+            * power
+            for power in (appliance.p_11, appliance.p_12)
+        ]
+        cycle_durations = [
+            (
+                random_uniform(generator, 1 - appliance.r_c1, 1 + appliance.r_c1, size)
+                * duration
+            ).astype(np.int64)
+            for duration in (appliance.t_11, appliance.t_12)
+        ]
+        cycle_length = cycle_durations[0] + cycle_durations[1]
+
+    # Free ranges [start, stop) of every profile [profile, range] and the window they belong to. Empty windows have
+    # no free range, they get a range which can neither be drawn nor contain an event
+    empty = window_ends <= window_starts
+    spot_starts = np.where(empty, NO_MINUTE, window_starts).T
+    spot_stops = np.where(empty, NO_MINUTE, window_ends).T
+    spot_windows = np.tile(np.arange(3), (size, 1))
+
+    events = []
+    # Time of use of every profile so far
+    tot_time = np.zeros(size, dtype=np.int64)
+    pending = rand_time > 0
+    while pending.any():
+        rows = np.flatnonzero(pending)
+        # Number of possible switch-on minutes of every free range
+        n_candidates = np.maximum(
+            spot_stops[rows] - spot_starts[rows] - func_cycle + 1, 0
+        )
+        # Profiles without available time for another event are complete
+        available = n_candidates.sum(axis=1) > 0
+        pending[rows[~available]] = False
+        rows, n_candidates = rows[available], n_candidates[available]
+        if rows.size == 0:
+            break
+
+        switch_on, duration = random_event(
+            func_cycle,
+            rand_time[rows],
+            spot_starts[rows],
+            spot_stops[rows],
+            spot_windows[rows],
+            n_candidates,
+            generator,
+        )
+        if appliance.fixed_cycle > 0:
+            # Events must overlap one of the duty cycle windows, other events are drawn again
+            accepted = within_cycle_windows(appliance, switch_on, duration)
+            for _ in range(MAX_DRAWS - 1):
+                if accepted.all():
+                    break
+                redrawn = np.flatnonzero(~accepted)
+                switch_on[redrawn], duration[redrawn] = random_event(
+                    func_cycle,
+                    rand_time[rows[redrawn]],
+                    spot_starts[rows[redrawn]],
+                    spot_stops[rows[redrawn]],
+                    spot_windows[rows[redrawn]],
+                    n_candidates[redrawn],
+                    generator,
+                )
+                accepted[redrawn] = within_cycle_windows(
+                    appliance, switch_on[redrawn], duration[redrawn]
+                )
+            pending[rows[~accepted]] = False
+            rows, switch_on, duration = (
+                rows[accepted],
+                switch_on[accepted],
+                duration[accepted],
+            )
+            if appliance.continuous_duty_cycle == 0:
+                # Events are limited to one duty cycle
+                duration = np.where(
+                    (cycle_length[rows] > 0) & (duration > cycle_length[rows]),
+                    cycle_length[rows],
+                    duration,
+                )
+
+        # The last event is shortened to the remaining time of use
+        duration = np.minimum(duration, rand_time[rows] - tot_time[rows])
+        tot_time[rows] += duration
+        pending[rows] &= tot_time[rows] < rand_time[rows]
+        placed = duration > 0
+        rows, switch_on, duration = rows[placed], switch_on[placed], duration[placed]
+        if rows.size == 0:
+            continue
+
+        # The first free range (in the order of the windows) containing the event is split around it
+        last_minute = switch_on + duration - 1
+        containing = (spot_starts[rows] <= switch_on[:, None]) & (
+            last_minute[:, None] <= spot_stops[rows]
+        )
+        spot_idx = np.argmin(np.where(containing, spot_windows[rows], 3), axis=1)
+        new_starts = np.full(size, NO_MINUTE)
+        new_stops = np.full(size, NO_MINUTE)
+        new_windows = np.full(size, 3)
+        new_starts[rows] = last_minute + 1
+        new_stops[rows] = spot_stops[rows, spot_idx]
+        new_windows[rows] = spot_windows[rows, spot_idx]
+        spot_stops[rows, spot_idx] = switch_on
+        spot_starts = np.column_stack((spot_starts, new_starts))
+        spot_stops = np.column_stack((spot_stops, new_stops))
+        spot_windows = np.column_stack((spot_windows, new_windows))
+
+        coincidence = coincident_switch_on(
+            appliance,
+            within_peak_time_range(switch_on, duration, peak_time_range),
+            generator,
+        )
+        if appliance.fixed_cycle > 0:
+            # The duty cycle is repeated during the whole event
+            events.append(
+                SwitchOnEvents(
+                    profile=rows,
+                    switch_on=switch_on,
+                    duration=duration,
+                    power_1=coincidence * cycle_powers[0][rows],
+                    duration_1=cycle_durations[0][rows],
+                    power_2=coincidence * cycle_powers[1][rows],
+                    cycle_length=cycle_length[rows],
+                )
+            )
+        else:
+            events.append(
+                SwitchOnEvents(
+                    profile=rows,
+                    switch_on=switch_on,
+                    duration=duration,
+                    power_1=coincidence
+                    * appliance.power[0]
+                    * random_uniform(
+                        generator,
+                        1 - appliance.thermal_p_var,
+                        1 + appliance.thermal_p_var,
+                        rows.size,
+                    ),
+                    duration_1=duration,
+                    power_2=np.zeros(rows.size),
+                    cycle_length=duration,
+                )
+            )
+
+    if not events:
+        return SwitchOnEvents(*(np.zeros(0, dtype=np.int64) for _ in range(7)))
+    return SwitchOnEvents(*(np.concatenate(field) for field in zip(*events)))
+
+
+def write_events(daily_use, events):
+    """
+    Write switch-on events into daylong profiles, later events overwrite earlier ones like np.put in RAMP
+    :param daily_use: 2D C-contiguous numpy array [profile, min_of_day]
+    :param events: SwitchOnEvents, profile is the row of daily_use
+    :return:
+    """
+    # RAMP writes nothing for duty cycles whose duration was rounded down to 0
+    events = SwitchOnEvents(*(field[events.cycle_length > 0] for field in events))
+    duration = events.duration
+    # Minute of every minute of the events since its switch-on
+    event_minutes = np.arange(duration.sum()) - np.repeat(
+        np.cumsum(duration) - duration, duration
+    )
+    power = np.where(
+        event_minutes % np.repeat(events.cycle_length, duration)
+        < np.repeat(events.duration_1, duration),
+        np.repeat(events.power_1, duration),
+        np.repeat(events.power_2, duration),
+    )
+    daily_use.reshape(-1)[
+        np.repeat(events.profile * 1440 + events.switch_on, duration) + event_minutes
+    ] = power
+
+
+def random_event(
+    func_cycle,
+    rand_time,
+    spot_starts,
+    spot_stops,
+    spot_windows,
+    n_candidates,
+    generator,
+):
+    """
+    Draw the switch-on minute and duration of one event of every profile, see ramp.Appliance.rand_switch_on_window
+    :param func_cycle: minimal duration of an event
+    :param rand_time: randomised total time of use of every profile
+    :param spot_starts: 2D numpy array [profile, range] of the first minute of the free ranges
+    :param spot_stops: 2D numpy array [profile, range] of the minute after the free ranges
+    :param spot_windows: 2D numpy array [profile, range] of the window of the free ranges
+    :param n_candidates: 2D numpy array [profile, range] of the number of possible switch-on minutes
+    :param generator: numpy random Generator
+    :return: 1D numpy arrays of the switch-on minute and the duration of every event
+    """
+    rows = np.arange(len(rand_time))
+    # Uniform draw among the possible switch-on minutes of all free ranges
+    candidates_count = np.cumsum(n_candidates, axis=1)
+    candidate_idx = (generator.random(len(rows)) * candidates_count[:, -1]).astype(
+        np.int64
+    )
+    drawn_spot = np.argmax(candidates_count > candidate_idx[:, None], axis=1)
+    switch_on = (
+        spot_starts[rows, drawn_spot]
+        + candidate_idx
+        - candidates_count[rows, drawn_spot]
+        + n_candidates[rows, drawn_spot]
+    )
+    # The event is limited by the first free range (in the order of the windows) it can start in
+    can_start = (spot_starts <= switch_on[:, None]) & (
+        switch_on[:, None] <= spot_stops - func_cycle
+    )
+    spot_idx = np.argmin(np.where(can_start, spot_windows, 3), axis=1)
+    largest_duration = np.minimum(rand_time, spot_stops[rows, spot_idx] - switch_on)
+    duration = np.where(
+        largest_duration > func_cycle,
+        random_uniform(generator, func_cycle, largest_duration, len(rows)).astype(
+            np.int64
+        ),
+        func_cycle,
+    )
+    return switch_on, duration
+
+
+def within_cycle_windows(appliance, switch_on, duration):
+    """
+    Check if events overlap the windows of the first duty cycle, see ramp.core.utils.range_within_window
+    :param appliance: ramp.Appliance
+    :param switch_on: switch-on minute of every event
+    :param duration: duration of every event
+    :return: 1D boolean numpy array
+    """
+    last_minute = switch_on + duration - 1
+    return overlaps(switch_on, last_minute, appliance.cw11) | overlaps(
+        switch_on, last_minute, appliance.cw12
+    )
+
+
+def within_peak_time_range(switch_on, duration, peak_time_range):
+    """
+    Check if events overlap the peak time range, see ramp.core.utils.within_peak_time_window
+    :param switch_on: switch-on minute of every event
+    :param duration: duration of every event
+    :param peak_time_range: peak time range of the use case
+    :return: 1D boolean numpy array
+    """
+    return overlaps(
+        switch_on,
+        switch_on + duration - 1,
+        (peak_time_range[0], peak_time_range[-1]),
+    )
+
+
+def overlaps(first_minute, last_minute, window):
+    """
+    :param first_minute: first minute of every event
+    :param last_minute: last minute of every event
+    :param window: [start, end] of the window
+    :return: 1D boolean numpy array, True for events overlapping the window
+    """
+    return ~(
+        ((first_minute < window[0]) & (last_minute < window[0]))
+        | ((first_minute > window[1]) & (last_minute > window[1]))
+    )
+
+
+def coincident_switch_on(appliance, inside_peak_window, generator):
+    """
+    Number of copies of the appliance switched on during every event, see ramp.Appliance.calc_coincident_switch_on
+    :param appliance: ramp.Appliance
+    :param inside_peak_window: 1D boolean numpy array, True for events within the peak time range
+    :param generator: numpy random Generator
+    :return: 1D numpy array
+    """
+    number = appliance.number
+    size = len(inside_peak_window)
+    if appliance.fixed != "no":
+        # All copies of the appliance are switched on altogether
+        return np.full(size, float(number))
+    # Within the peak time range: eq. 4 of RAMP's paper
+    peak_coincidence = np.clip(
+        np.ceil(generator.normal(number * MU_PEAK, S_PEAK * number * MU_PEAK, size)),
+        1,
+        number,
+    )
+    # Off-peak: eq. 3 of RAMP's paper
+    off_peak_coincidence = (
+        np.minimum(
+            np.floor(
+                random_uniform(generator, 0, (number - OP_FACTOR) / number, size)
+                * number
+            ),
+            number - 1,
+        )
+        + 1
+    )
+    return np.where(inside_peak_window, peak_coincidence, off_peak_coincidence)
+
+
+def random_uniform(generator, low, high, size):
+    """
+    Uniform random numbers between low and high like random.uniform, high may be lower than low
+    :param generator: numpy random Generator
+    :param low: scalar or 1D numpy array
+    :param high: scalar or 1D numpy array
+    :param size: number of random numbers
+    :return: 1D numpy array
+    """
+    return low + (high - low) * generator.random(size)
@@ -3,10 +3,12 @@ import sys
 
 import argparse
 
+from wefe_demand.helpers.instrumentation import instrumented
 from wefe_demand.input.admin_input import admin_input
 from wefe_demand.preprocessing.surveyparser import SurveyParser
 from wefe_demand.preprocessing.surveyparser import SurveyParser
 from wefe_demand.ramp_model.ramp_control import RampControl
+from wefe_demand.ramp_model.cache import ResultCache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,6 +30,111 @@ parser.add_argument(
     help="Starting date of the time window of the simulation",
 )
 
+parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes used to simulate the demands, -1 uses all CPU cores",
+)
+
+parser.add_argument(
+    "-s",
+    "--seed",
+    type=int,
+    default=None,
+    help="Seed of the simulation to reproduce results. If not provided, every run is different.",
+)
+
+parser.add_argument(
+    "-r",
+    "--resolution",
+    type=int,
+    default=None,
+    help="Length of the output time steps in minutes. If provided, the 1-minute profiles are resampled while \
+        simulating instead of being kept in memory for the whole time window.",
+)
+
+parser.add_argument(
+    "-d",
+    "--detail",
+    type=str,
+    default="appliance",
+    choices=["appliance", "user", "demand"],
+    help="Level of detail of the simulated profiles. 'demand' only keeps the total of each demand, which \
+        needs the least memory.",
+)
+
+parser.add_argument(
+    "-e",
+    "--engine",
+    type=str,
+    default="ramp",
+    choices=["ramp", "expected", "vectorized"],
+    help="Engine generating the demand profiles. 'expected' computes the mean profiles analytically instead \
+        of sampling them with RAMP, 'vectorized' samples them with numpy, all users and days at once.",
+)
+
+parser.add_argument(
+    "-k",
+    "--pool-size",
+    type=int,
+    default=None,
+    help="If given, user types with more users are built by resampling from a pool of this many simulated \
+        user-days per month and day type, which is faster for large villages.",
+)
+
+parser.add_argument(
+    "-c",
+    "--cache-dir",
+    type=str,
+    default=None,
+    help="If given, results of seeded runs are cached in this directory. Identical requests are not \
+        simulated again and only the changed columns of edited requests are simulated.",
+)
+
+parser.add_argument(
+    "-p",
+    "--parallel-demands",
+    action="store_true",
+    help="Simulate the 5 demands concurrently, each in its own worker process.",
+)
+
+parser.add_argument(
+    "-t",
+    "--dtype",
+    type=str,
+    default="float64",
+    choices=["float64", "float32"],
+    help="Floating point type of the simulated profiles and of the output. 'float32' halves the memory needed \
+        for the profiles.",
+)
+
+parser.add_argument(
+    "-w",
+    "--working-dir",
+    type=str,
+    default=None,
+    help="If given, the 1-minute profiles are accumulated in memory-mapped files in this directory instead of \
+        memory, so long time windows with many users do not run out of memory. The files are deleted once \
+        resampled.",
+)
+
+parser.add_argument(
+    "--sparse",
+    action="store_true",
+    help="Keep the simulated profiles as lists of events (runs of minutes of constant load) instead of 1-minute \
+        profiles, which needs less memory for demands with few, short uses. Cannot be combined with \
+        --working-dir.",
+)
+
+parser.add_argument(
+    "--statistics",
+    action="store_true",
+    help="Compute the sizing statistics of every demand (peak, energy, load factor, coincidence factor and load \
+        duration curve) from the exact 1-minute profiles, whatever the output resolution.",
+)
+
 parser.add_argument(
     "-i",
     "--id",
@@ -144,6 +251,7 @@ def dump_aggregated_output(dat_output, survey, dir, type="mean"):
     dat_output.to_csv(csv_file_path, index=True)
 
 
+@instrumented()
 def preprocess_survey(surv_id, token, args):
     """
     Preprocess survey data for the RAMP model
@@ -165,20 +273,45 @@ def preprocess_survey(surv_id, token, args):
     return preprocessed_survey
 
 
-def run_simulation_on_survey(data, args):
+@instrumented()
+def run_simulation_on_survey(data, args, progress=None):
     """
     Run the simulation of the demand using the RAMP model and dump the output to CSV files
 
     This function is the main entry point for the demo script
+
+    Args:
+        progress (callable, optional): progress callback of RampControl.run_opti_mg_dat, called with the running
+            demand, the fraction of the simulation done and the elapsed time. It may raise SimulationCancelled
     """
     SURVEY_KEY = os.getenv("SURVEY_KEY")
 
     # %% Create instance of RampControl class, define timeframe to model load profiles
     days, start = args.get("days"), args.get("date")
-    ramp_control = RampControl(days, start)
+    # Results and the profiles of unchanged columns are reused from the cache directory, if given
+    cache = ResultCache(args["cache_dir"]) if args.get("cache_dir") else None
+    ramp_control = RampControl(
+        days,
+        start,
+        n_jobs=args.get("jobs"),
+        seed=args.get("seed"),
+        output_resolution=args.get("resolution"),
+        detail=args.get("detail"),
+        engine=args.get("engine"),
+        pool_size=args.get("pool_size"),
+        cache=cache,
+        column_store=cache,
+        parallel_demands=args.get("parallel_demands", False),
+        dtype=args.get("dtype", "float64"),
+        working_dir=args.get("working_dir"),
+        sparse=args.get("sparse", False),
+        statistics=args.get("statistics", False),
+    )
 
     # %% Run simulation of the demand
-    dat_output_mean, dat_output_max = ramp_control.run_opti_mg_dat(data, admin_input)
+    dat_output_mean, dat_output_max = ramp_control.run_opti_mg_dat(
+        data, admin_input, progress=progress
+    )
 
     print(dat_output_mean)
     # %% Dump raw output on CSV
@@ -191,9 +324,19 @@ def run_simulation_on_survey(data, args):
     # dump_aggregated_output(dat_output_max, survey=SURVEY_KEY, dir=dir, type="max")
     dat_output_mean_agg = dat_output_mean.groupby(level=0, axis=1).sum()
     dat_output_max_agg = dat_output_max.groupby(level=0, axis=1).sum()
-    return {"agg_mean": dat_output_mean_agg, "agg_max": dat_output_max_agg}
-
-def main(input_dict):
+    sim_agg_data = {"agg_mean": dat_output_mean_agg, "agg_max": dat_output_max_agg}
+    if args.get("statistics"):
+        # Sizing statistics of every demand, see RampControl.load_statistics
+        for demand, demand_statistics in ramp_control.load_statistics.items():
+            print(
+                f"{demand}: peak {demand_statistics['peak']} at {demand_statistics['peak_time']}, "
+                f"load factor {demand_statistics['load_factor']:.3f}, "
+                f"coincidence factor {demand_statistics['coincidence_factor']:.3f}"
+            )
+        sim_agg_data["statistics"] = ramp_control.load_statistics
+    return sim_agg_data
+
+def main(input_dict, progress=None):
     args = input_dict.get("args", {})
     default_args = vars(parser.parse_args([]))
     KOBO_TOKEN = os.getenv(env_KOBO_TOKEN)
@@ -213,7 +356,7 @@ def main(input_dict):
 
 
     if len(list(preprocessed_survey.keys())):
-        sim_agg_data = run_simulation_on_survey(preprocessed_survey, args)
+        sim_agg_data = run_simulation_on_survey(preprocessed_survey, args, progress)
         return sim_agg_data
     else:
         print("None of the forms could be preprocessed")
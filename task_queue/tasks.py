@@ -3,10 +3,16 @@ import traceback
 import json
 from contextlib import contextmanager
 
+import pandas as pd
+
 from celery import Celery
+from celery.contrib.abortable import AbortableTask
 from celery.utils.log import get_task_logger
 
+from fastapi_app.progress_key import progress_id
 from task_queue.demo.ramp_simulation_demo import main as run_ramp_simulation
+from wefe_demand.helpers.exceptions import SimulationCancelled
+from wefe_demand.helpers.instrumentation import Instrumentation, span
 
 
 logger = get_task_logger(__name__)
@@ -17,6 +23,9 @@ CELERY_RESULT_BACKEND = os.environ.get(
 
 CELERY_TASK_NAME = os.environ.get("CELERY_TASK_NAME", "grid")
 
+# Minimal time in seconds between two progress updates of the task (and checks for an abort request)
+PROGRESS_INTERVAL = 1.0
+
 app = Celery(CELERY_TASK_NAME, broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
 
 @contextmanager
@@ -39,8 +48,71 @@ def temporary_env(**items):
                 os.environ[k] = v
 
 
-@app.task(name=f"dev.run_simulation")
-def run_simulation(simulation_input: dict,) -> dict:
+def task_progress(task, interval=PROGRESS_INTERVAL):
+    """
+    Progress callback of RampControl.run_opti_mg_dat for a running task
+    - the progress is stored with the state "PROGRESS" under the id returned by fastapi_app.progress_key.progress_id,
+      with the running demand, the fraction of the simulation done and the elapsed time in seconds. It is not stored
+      in the state of the task itself, which would overwrite the ABORTED state set by AbortableAsyncResult.abort
+    - if the task was aborted (AbortableAsyncResult.abort), SimulationCancelled is raised and the simulation stops
+      without terminating the worker process
+    """
+    last_update = None
+
+    def progress(demand, fraction, elapsed):
+        nonlocal last_update
+        if last_update is not None and elapsed - last_update < interval and fraction < 1:
+            return
+        last_update = elapsed
+        if task.is_aborted():
+            raise SimulationCancelled(f"Task {task.request.id} was aborted")
+        task.backend.store_result(
+            progress_id(task.request.id),
+            {"demand": demand, "fraction": fraction, "elapsed": elapsed},
+            "PROGRESS",
+        )
+
+    return progress
+
+
+def statistics_to_dict(load_statistics):
+    """
+    JSON serialisable sizing statistics of every demand, see RampControl.load_statistics
+    - numbers and timestamps are converted to float and ISO strings, missing values (e.g. the load factor of a demand
+      without load) to None
+    - the statistics of every user type are a dict {user_type: {statistic: value}}, the load duration curve a dict
+      with the lower edges of the load bins ("load") and the minutes at or above them ("minutes")
+    """
+
+    def to_json(value):
+        if value is None or pd.isna(value):
+            return None
+        if isinstance(value, pd.Timestamp):
+            return value.isoformat()
+        return float(value)
+
+    return {
+        demand: {
+            **{
+                key: to_json(value)
+                for key, value in demand_statistics.items()
+                if key not in ("users", "load_duration_curve")
+            },
+            "users": {
+                str(user_type): {key: to_json(value) for key, value in user.items()}
+                for user_type, user in demand_statistics["users"].to_dict(orient="index").items()
+            },
+            "load_duration_curve": {
+                "load": demand_statistics["load_duration_curve"].index.tolist(),
+                "minutes": demand_statistics["load_duration_curve"].tolist(),
+            },
+        }
+        for demand, demand_statistics in load_statistics.items()
+    }
+
+
+@app.task(name=f"dev.run_simulation", bind=True, base=AbortableTask)
+def run_simulation(self, simulation_input: dict,) -> dict:
     logger.info("Start new simulation")
 
     kobo_token = os.getenv("KOBO_TOKEN")
@@ -54,10 +126,31 @@ def run_simulation(simulation_input: dict,) -> dict:
         logger.info("Starting simulation (survey_id=%s, kobo_token_present=%s)",
                     survey_id, bool(kobo_token))
 
+        # Time (and, if requested, memory) of every stage of the simulation
+        instrumentation = Instrumentation(
+            "run_simulation", trace_memory=simulation_input.get("trace_memory", False)
+        )
         try:
-            sim_agg_data = run_ramp_simulation(simulation_input)
-            simulation_output = {"agg_mean": sim_agg_data["agg_mean"].to_dict(orient="list"),
-                                 "agg_max": sim_agg_data["agg_max"].to_dict(orient="list")}
+            with instrumentation:
+                sim_agg_data = run_ramp_simulation(
+                    simulation_input, progress=task_progress(self)
+                )
+                with span("serialisation"):
+                    simulation_output = {"agg_mean": sim_agg_data["agg_mean"].to_dict(orient="list"),
+                                         "agg_max": sim_agg_data["agg_max"].to_dict(orient="list")}
+                    if "statistics" in sim_agg_data:
+                        simulation_output["statistics"] = statistics_to_dict(sim_agg_data["statistics"])
+            logger.info("Stages of the simulation:\n%s", instrumentation.report().format())
+            if simulation_input.get("instrumentation"):
+                # Attach the stage report to the task result
+                simulation_output["instrumentation"] = instrumentation.report().to_dict()
+        except SimulationCancelled:
+            logger.info("Simulation aborted")
+            simulation_output = json.dumps(dict(
+                SERVER=CELERY_TASK_NAME,
+                ABORTED="Simulation aborted",
+                INPUT_JSON=simulation_input,
+            ))
         except Exception as e:
             logger.error(
                 "An exception occured in the simulation task: {}".format(
@@ -69,4 +162,7 @@ def run_simulation(simulation_input: dict,) -> dict:
                 ERROR="{}".format(traceback.format_exc()),
                 INPUT_JSON=simulation_input,
             ))
+        finally:
+            # The progress entry is not needed once the task is done, aborted or failed
+            self.AsyncResult(progress_id(self.request.id)).forget()
         return simulation_output